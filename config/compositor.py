@@ -0,0 +1,133 @@
+"""
+Text Compositor
+Renders a wrapped text block once into a small mask and composites fill, shadow,
+outline and scrim onto the image in place.
+"""
+from PIL import Image, ImageDraw, ImageFilter
+
+
+class TextStyle:
+    """How a text block is painted onto the image"""
+
+    def __init__(self, fill="white", shadow_color="black", shadow_offset=(2, 2), shadow_blur=0,
+                 outline_width=0, outline_color="black", scrim_opacity=0, scrim_color="black",
+                 scrim_padding=0.6):
+        self.fill = fill
+        self.shadow_color = shadow_color
+        self.shadow_offset = shadow_offset
+        # Gaussian blur radius for a soft shadow (0 = hard offset shadow)
+        self.shadow_blur = shadow_blur
+        self.outline_width = outline_width
+        self.outline_color = outline_color
+        # Peak opacity (0-255) of a vertical gradient band behind the text
+        self.scrim_opacity = scrim_opacity
+        self.scrim_color = scrim_color
+        # Extra scrim height above and below the block, as a fraction of its height
+        self.scrim_padding = scrim_padding
+
+
+# Matches draw_text_with_shadow: white text, black 2px hard shadow
+DEFAULT_STYLE = TextStyle()
+
+
+def render_text_mask(lines, font, line_height, padding=0):
+    """
+    Rasterizes the lines (each centered with anchor "mm", one line_height apart)
+    into an "L" mask sized to the text bounds.
+
+    Returns:
+        (mask, (dx, dy)) where (dx, dy) is the position in the mask of the first
+        line's anchor point
+    """
+    left = top = float("inf")
+    right = bottom = float("-inf")
+    for i, line in enumerate(lines):
+        l, t, r, b = font.getbbox(line, anchor="mm")
+        y = i * line_height
+        left, top = min(left, l), min(top, t + y)
+        right, bottom = max(right, r), max(bottom, b + y)
+
+    dx = int(-left) + padding
+    dy = int(-top) + padding
+    width = int(right - left) + 2 * padding + 1
+    height = int(bottom - top) + 2 * padding + 1
+    mask = Image.new("L", (max(1, width), max(1, height)), 0)
+
+    draw = ImageDraw.Draw(mask)
+    for i, line in enumerate(lines):
+        draw.text((dx, dy + i * line_height), line, font=font, fill=255, anchor="mm")
+    return mask, (dx, dy)
+
+
+def paste_color(image, color, position, mask):
+    """Paints ``color`` through ``mask`` at ``position``, clipped to the image"""
+    x, y = position
+    crop_left, crop_top = max(0, -x), max(0, -y)
+    crop_right = min(mask.width, image.width - x)
+    crop_bottom = min(mask.height, image.height - y)
+    if crop_right <= crop_left or crop_bottom <= crop_top:
+        return
+    if (crop_left, crop_top, crop_right, crop_bottom) != (0, 0, mask.width, mask.height):
+        mask = mask.crop((crop_left, crop_top, crop_right, crop_bottom))
+    image.paste(color, (x + crop_left, y + crop_top), mask)
+
+
+def draw_scrim(image, top, bottom, style):
+    """Darkens a full-width band, strongest at the text block and fading out above and below"""
+    block_height = max(1, bottom - top)
+    pad = int(block_height * style.scrim_padding)
+    band_top, band_bottom = top - pad, bottom + pad
+    band_height = band_bottom - band_top
+    # 0 -> 255 -> 0 vertical profile, scaled to the peak opacity
+    ramp = Image.linear_gradient("L").resize((1, max(1, band_height // 2)))
+    profile = Image.new("L", (1, band_height))
+    profile.paste(ramp, (0, 0))
+    profile.paste(ramp.transpose(Image.FLIP_TOP_BOTTOM), (0, band_height - ramp.height))
+    profile = profile.point(lambda v: v * style.scrim_opacity // 255)
+    mask = profile.resize((image.width, band_height))
+    paste_color(image, style.scrim_color, (0, band_top), mask)
+
+
+def composite_text(image, lines, font, center_x, start_y, line_height, style=DEFAULT_STYLE):
+    """
+    Draws a block of centered lines onto ``image`` in place.
+
+    The text is rasterized once into a mask covering only the text bounds; the
+    shadow and outline are derived from that mask instead of drawing every line
+    again, and everything is alpha-composited through ``Image.paste``.
+
+    Args:
+        image: RGB image, modified in place
+        lines: Lines of text, top to bottom
+        font: Pillow font
+        center_x: Horizontal center of every line
+        start_y: Vertical middle of the first line
+        line_height: Distance between line middles
+        style: TextStyle
+
+    Returns:
+        The same image, for chaining
+    """
+    if not lines:
+        return image
+
+    blur = style.shadow_blur
+    padding = int(blur * 3) + style.outline_width + 1
+    mask, (dx, dy) = render_text_mask(lines, font, line_height, padding=padding)
+    origin = (center_x - dx, start_y - dy)
+
+    if style.scrim_opacity:
+        draw_scrim(image, origin[1] + padding, origin[1] + mask.height - padding, style)
+
+    if style.shadow_color is not None:
+        shadow = mask.filter(ImageFilter.GaussianBlur(blur)) if blur else mask
+        offset_x, offset_y = style.shadow_offset
+        paste_color(image, style.shadow_color, (origin[0] + offset_x, origin[1] + offset_y), shadow)
+
+    if style.outline_width:
+        # Dilate the glyph mask rather than re-rendering every line with a stroke
+        outline = mask.filter(ImageFilter.MaxFilter(2 * style.outline_width + 1))
+        paste_color(image, style.outline_color, origin, outline)
+
+    paste_color(image, style.fill, origin, mask)
+    return image
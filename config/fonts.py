@@ -0,0 +1,107 @@
+"""
+Font Registry
+Loads bundled fonts once and shares FreeTypeFont objects across requests and threads.
+"""
+import os
+import threading
+from collections import OrderedDict
+from PIL import ImageFont
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "fonts")
+DEFAULT_FACE = "Ubuntu-Bold"
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+
+class FontRegistry:
+    """
+    Registry of validated font files plus an LRU of loaded fonts keyed by (face, size).
+
+    Fonts are read from disk only the first time a (face, size) pair is used;
+    no network access happens at runtime (fonts ship in assets/fonts).
+    """
+
+    def __init__(self, font_dir: str = FONT_DIR, max_cached: int = 64):
+        self.font_dir = font_dir
+        self.max_cached = max_cached
+        self._faces = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load_bundled(self):
+        """Registers and validates every font file in font_dir (face name = file stem)"""
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.isdir(self.font_dir):
+                for filename in sorted(os.listdir(self.font_dir)):
+                    if filename.lower().endswith(FONT_EXTENSIONS):
+                        face = os.path.splitext(filename)[0]
+                        self._register(face, os.path.join(self.font_dir, filename))
+            if not self._faces:
+                print(f"WARNING: No usable fonts found in {self.font_dir}. Falling back to default.")
+            self._loaded = True
+
+    def register(self, face: str, path: str):
+        """Registers a font file under a face name after checking it parses"""
+        with self._lock:
+            self._register(face, path)
+
+    def _register(self, face: str, path: str):
+        try:
+            ImageFont.truetype(path, 12)
+        except Exception as e:
+            print(f"ERROR: Font {path} could not be loaded: {e}")
+            return
+        self._faces[face] = path
+        print(f"OK: Font '{face}' registered from {path}")
+
+    @property
+    def faces(self):
+        return sorted(self._faces)
+
+    def path(self, face: str = DEFAULT_FACE):
+        """Returns the font file for a face, or None if it is not registered"""
+        if not self._loaded:
+            self.load_bundled()
+        return self._faces.get(face)
+
+    def get(self, face: str = DEFAULT_FACE, size: int = 40):
+        """
+        Returns a font for (face, size), loading it on first use.
+
+        Args:
+            face: Registered face name (file stem, e.g. "Ubuntu-Bold")
+            size: Font size in pixels
+
+        Returns:
+            FreeTypeFont, or Pillow's default font if the face is unavailable
+        """
+        if not self._loaded:
+            self.load_bundled()
+
+        key = (face, size)
+        with self._lock:
+            font = self._cache.get(key)
+            if font is not None:
+                self._cache.move_to_end(key)
+                return font
+
+        path = self._faces.get(face)
+        font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+
+        with self._lock:
+            self._cache[key] = font
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return font
+
+    def clear(self):
+        """Drops all loaded fonts (registered faces are kept)"""
+        with self._lock:
+            self._cache.clear()
+
+
+# Process-wide registry
+font_registry = FontRegistry()
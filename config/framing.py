@@ -0,0 +1,140 @@
+"""
+Framing
+Named output variants (story, feed, thumbnail) and fitting one generated image to
+each: content-aware crop when little would be lost, blurred padding otherwise.
+"""
+from PIL import Image, ImageEnhance, ImageFilter
+
+# Longest side of the grayscale proxy the crop search runs on
+ENERGY_PROXY_SIZE = 128
+# Weight of the pull towards the center, relative to the busiest window
+CENTER_BIAS = 0.15
+
+
+class VariantSpec:
+    """
+    One output placement.
+
+    Args:
+        size: (width, height) in pixels
+        max_crop: Largest fraction of the source that may be cropped away to
+            reach the aspect ratio; beyond it the image is padded instead
+        max_text_height: Fraction of the height the quote may use (see
+            TextOverlayService.overlay_text), None for the default layout
+        source: For thumbnails, the variant (text included) to reduce from;
+            None means the variant is framed from the generated image
+    """
+
+    def __init__(self, size, max_crop=0.35, max_text_height=None, source=None):
+        self.size = tuple(size)
+        self.max_crop = max_crop
+        self.max_text_height = max_text_height
+        self.source = source
+
+
+VARIANTS = {
+    "story": VariantSpec((1080, 1920), max_text_height=0.3),
+    "feed_square": VariantSpec((1080, 1080), max_text_height=0.35),
+    "feed_portrait": VariantSpec((1080, 1350), max_text_height=0.35),
+    "thumbnail": VariantSpec((320, 320), source="feed_square"),
+}
+
+
+def _energy_profile(image: Image.Image, axis: int) -> list:
+    """
+    Edge energy per row (axis=1) or column (axis=0) of a small grayscale proxy,
+    resampled back to the image's length along that axis.
+    """
+    proxy = image.convert("L")
+    proxy.thumbnail((ENERGY_PROXY_SIZE, ENERGY_PROXY_SIZE), reducing_gap=2.0)
+    edges = proxy.filter(ImageFilter.FIND_EDGES)
+    # A 1-pixel-wide BOX resize averages each row / column in C
+    if axis == 1:
+        profile = list(edges.resize((1, edges.height), Image.BOX).getdata())
+    else:
+        profile = list(edges.resize((edges.width, 1), Image.BOX).getdata())
+    length = image.size[axis]
+    return [profile[min(len(profile) - 1, i * len(profile) // length)] for i in range(length)]
+
+
+def smart_crop_box(image: Image.Image, aspect: float) -> tuple:
+    """
+    The crop box with the given width/height ratio that keeps the busiest part
+    of the image, with a mild preference for the center.
+
+    Returns:
+        (left, top, right, bottom)
+    """
+    width, height = image.size
+    if width / height > aspect:
+        axis, length, window = 0, width, max(1, round(height * aspect))
+    else:
+        axis, length, window = 1, height, max(1, round(width / aspect))
+    if window >= length:
+        return (0, 0, width, height)
+
+    profile = _energy_profile(image, axis)
+    # Sliding window sums over a running prefix sum
+    prefix = [0]
+    for value in profile:
+        prefix.append(prefix[-1] + value)
+    best_total = max(prefix[i + window] - prefix[i] for i in range(length - window + 1)) or 1
+    center = (length - window) / 2
+    best_offset, best_score = 0, None
+    for offset in range(length - window + 1):
+        score = (prefix[offset + window] - prefix[offset]) / best_total
+        score -= CENTER_BIAS * abs(offset - center) / max(center, 1)
+        if best_score is None or score > best_score:
+            best_offset, best_score = offset, score
+
+    if axis == 0:
+        return (best_offset, 0, best_offset + window, height)
+    return (0, best_offset, width, best_offset + window)
+
+
+def pad_to_size(image: Image.Image, size: tuple) -> Image.Image:
+    """Fits the whole image inside ``size`` over a blurred, darkened cover of itself"""
+    width, height = size
+    scale = max(width / image.width, height / image.height)
+    cover = image.resize((max(width, round(image.width * scale)), max(height, round(image.height * scale))),
+                         Image.BILINEAR, reducing_gap=2.0)
+    left, top = (cover.width - width) // 2, (cover.height - height) // 2
+    background = cover.crop((left, top, left + width, top + height)).filter(ImageFilter.GaussianBlur(width / 30))
+    background = ImageEnhance.Brightness(background).enhance(0.6)
+
+    scale = min(width / image.width, height / image.height)
+    fitted = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS, reducing_gap=3.0)
+    background.paste(fitted, ((width - fitted.width) // 2, (height - fitted.height) // 2))
+    return background
+
+
+def fit_to_size(image: Image.Image, size: tuple, max_crop: float = 0.35) -> Image.Image:
+    """
+    Reframes the image to exactly ``size``: smart-cropped to the aspect ratio
+    when that loses at most ``max_crop`` of it, padded otherwise. Always
+    returns a new image, so the source can still be drawn on afterwards.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = size
+    aspect, source_aspect = width / height, image.width / image.height
+    lost = 1 - min(aspect / source_aspect, source_aspect / aspect)
+    if lost > max_crop:
+        return pad_to_size(image, size)
+    framed = image.crop(smart_crop_box(image, aspect))
+    if framed.size != (width, height):
+        framed = framed.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+    return framed
+
+
+def draft_thumbnail(image: Image.Image, size: tuple) -> Image.Image:
+    """
+    Small preview of ``image`` at ``size``. Most of the shrinking is done by a
+    fast integer box reduce (Pillow's draft-style ``reducing_gap``); only the
+    last step resamples properly.
+    """
+    framed = image
+    aspect = size[0] / size[1]
+    if abs(image.width / image.height - aspect) > 0.01:
+        framed = image.crop(smart_crop_box(image, aspect))
+    return framed.resize(size, Image.BICUBIC, reducing_gap=2.0)
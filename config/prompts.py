@@ -1,4 +1,5 @@
 # System Prompts and Constants
+import textwrap
 
 # Space Educator Bot Prompt
 QUOTE_SYSTEM_PROMPT = """YTell me a fun fact about the following entity:
@@ -8,6 +9,13 @@ QUOTE_SYSTEM_PROMPT = """YTell me a fun fact about the following entity:
 Output format:
 [Your fact here]"""
 
+# Visual rules shared by the image prompt expansion and the combined quote call
+IMAGE_GUIDELINES = """- **Visual Style**: Make the image according to the quote and the theme of space. use terms from the quote and include the elemet or things mentioned in the quote
+- **Composition**: Vertical (9:16) for Instagram Reels. Open negative space (deep black/dark blue) at the BOTTOM CENTER to allow for text overlay.
+- **Typography**: DO NOT INCLUDE ANY TEXT IN THE IMAGE. The text will be added programmatically later.
+- **Interpretation**: Metaphorical but grounded in the grandeur of the universe.
+- **Mood**: Awe-inspiring, infinite, silent, majestic."""
+
 # Cosmic Visual Imagination Agent Prompt
 IMAGE_SYSTEM_PROMPT = """You are a cosmic visual imagination agent. Your task is to generate a breathtaking, image that visually represents the meaning of the given quote, with clear, legible typography embedded in the scene.
 
@@ -15,29 +23,66 @@ Input:
 Quote: "{{quote}}"
 
 Instructions:
-- **Visual Style**: Make the image according to the quote and the theme of space. use terms from the quote and include the elemet or things mentioned in the quote
-- **Composition**: Vertical (9:16) for Instagram Reels. Open negative space (deep black/dark blue) at the BOTTOM CENTER to allow for text overlay.
-- **Typography**: DO NOT INCLUDE ANY TEXT IN THE IMAGE. The text will be added programmatically later.
-- **Interpretation**: Metaphorical but grounded in the grandeur of the universe.
-- **Mood**: Awe-inspiring, infinite, silent, majestic.
+""" + IMAGE_GUIDELINES + """
 
 Output format:
 Image Prompt: [Detailed description of the provided quote + specific instruction for a clean image with no text + vertical 9:16 aspect ratio]
 Progression Text: [A poetic 1-3 word phrase ending with ellipses]
 Transparent Background: false"""
 
+# Local image prompt (no LLM call): the quote plus a scene for its entity
+IMAGE_PROMPT_TEMPLATE = """A breathtaking, awe-inspiring space image that visually represents this quote: "{{quote}}"
+Scene: {{scene}}
+Include the elements and things mentioned in the quote. Metaphorical but grounded in the grandeur of the universe; infinite, silent, majestic.
+Vertical 9:16 composition for Instagram Reels with open negative space (deep black/dark blue) at the bottom center for a text overlay.
+Clean image with absolutely no text, letters or typography."""
+
+DEFAULT_SCENE = "Deep space filled with stars, glowing nebulae and distant galaxies."
+
+# Expanded once per entity and reused as the {{scene}} of IMAGE_PROMPT_TEMPLATE
+ENTITY_SCENE_PROMPT = """Describe a breathtaking, photorealistic space scene featuring: {{entity}}
+
+Write 2-3 sentences about the subject, lighting, colors and camera angle. No text in the scene.
+Output ONLY the description."""
+
+# Fact and image prompt in one structured call
+QUOTE_WITH_IMAGE_PROMPT = """Tell me a fun fact about the following entity, and describe an image for it.
+
+**Entity**: {{entity}}
+
+Return JSON with:
+- "quote": the fun fact, without a "Fun fact:" prefix
+- "image_prompt": a detailed description of a breathtaking image that visually represents the fact, following these rules:
+""" + IMAGE_GUIDELINES
+
+# Caption rules shared by the caption prompt and the single structured call
+CAPTION_REQUIREMENTS = """- Start with a hook or emoji.
+- Include the quote/fact naturally if needed, or just comment on it.
+- Add 15-20 relevant, high-reach hashtags (e.g., #space, #universe, #astronomy, #cosmos, etc.).
+- Keep it clean and spaced out."""
+
 # Instagram Caption Prompt
 CAPTION_SYSTEM_PROMPT = """You are a social media expert. Generate an engaging Instagram caption for this quote/fact:
 "{{quote}}"
 
 Requirements:
-- Start with a hook or emoji.
-- Include the quote/fact naturally if needed, or just comment on it.
-- Add 15-20 relevant, high-reach hashtags (e.g., #space, #universe, #astronomy, #cosmos, etc.).
-- Keep it clean and spaced out.
+""" + CAPTION_REQUIREMENTS + """
 
 Output ONLY the caption text."""
 
+# Everything for one post in a single structured call
+POST_CONTENT_PROMPT = """Create an Instagram post about a fun fact for the following entity.
+
+**Entity**: {{entity}}
+
+Return JSON with:
+- "quote": the fun fact, without a "Fun fact:" prefix
+- "caption": an engaging Instagram caption for the fact, following these requirements:
+""" + textwrap.indent(CAPTION_REQUIREMENTS, "  ") + """
+- "image_prompt": a detailed description of a breathtaking image that visually represents the fact, following these rules:
+""" + textwrap.indent(IMAGE_GUIDELINES, "  ") + """
+- "progression_text": a poetic 1-3 word phrase ending with ellipses"""
+
 # List of Space Entities
 SPACE_ENTITIES = [
     "Moon", "Sun", "Mercury", "Venus", "Earth", "Mars", "Jupiter", "Saturn", "Uranus", "Neptune",
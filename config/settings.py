@@ -0,0 +1,133 @@
+"""
+Runtime Settings
+Tunables read from the environment (or .env), with defaults for local runs.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _int_env(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"WARNING: {name}={value!r} is not an integer, using {default}")
+        return default
+
+
+def _bool_env(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Gemini models
+TEXT_MODEL = os.getenv("TEXT_MODEL", "gemini-2.5-flash")
+IMAGE_MODEL = os.getenv("IMAGE_MODEL", "gemini-2.5-flash-image")
+
+# Shared Gemini HTTP connection pool (see services/gemini_client.py)
+GEMINI_TIMEOUT_SECONDS = _int_env("GEMINI_TIMEOUT_SECONDS", 120)
+GEMINI_MAX_CONNECTIONS = _int_env("GEMINI_MAX_CONNECTIONS", 20)
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = _int_env("GEMINI_MAX_KEEPALIVE_CONNECTIONS", 10)
+GEMINI_KEEPALIVE_EXPIRY_SECONDS = _int_env("GEMINI_KEEPALIVE_EXPIRY_SECONDS", 60)
+GEMINI_HTTP2 = _bool_env("GEMINI_HTTP2", True)
+
+# Model call resilience (services/resilience.py): retries with backoff, a deadline
+# per call including retries, circuit breaker, and hedged text calls (0 ms = off)
+MODEL_MAX_ATTEMPTS = _int_env("MODEL_MAX_ATTEMPTS", 4)
+MODEL_RETRY_BASE_MS = _int_env("MODEL_RETRY_BASE_MS", 1000)
+MODEL_RETRY_MAX_SECONDS = _int_env("MODEL_RETRY_MAX_SECONDS", 30)
+TEXT_CALL_DEADLINE_SECONDS = _int_env("TEXT_CALL_DEADLINE_SECONDS", 60)
+IMAGE_CALL_DEADLINE_SECONDS = _int_env("IMAGE_CALL_DEADLINE_SECONDS", 180)
+BREAKER_FAILURE_RATE_PERCENT = _int_env("BREAKER_FAILURE_RATE_PERCENT", 50)
+BREAKER_MIN_CALLS = _int_env("BREAKER_MIN_CALLS", 10)
+BREAKER_WINDOW = _int_env("BREAKER_WINDOW", 20)
+BREAKER_OPEN_SECONDS = _int_env("BREAKER_OPEN_SECONDS", 30)
+TEXT_HEDGE_DELAY_MS = _int_env("TEXT_HEDGE_DELAY_MS", 0)
+
+# How the image prompt is built: "llm" (expand each quote with the text model),
+# "template" (local template, no call), "cached" (one expansion per entity, reused)
+# or "combined" (returned together with the quote by a single structured call)
+IMAGE_PROMPT_STRATEGY = os.getenv("IMAGE_PROMPT_STRATEGY", "llm").lower()
+
+# Text calls per post: "multi" (quote, caption, image prompt separately) or "single"
+# (one JSON-schema call for all of them, falling back to "multi" if it fails)
+TEXT_GENERATION_MODE = os.getenv("TEXT_GENERATION_MODE", "multi").lower()
+
+# Job queue: how many generations run at once and how many may wait in line
+GENERATION_CONCURRENCY = _int_env("GENERATION_CONCURRENCY", 2)
+JOB_QUEUE_SIZE = _int_env("JOB_QUEUE_SIZE", 20)
+# Finished jobs are kept this long (seconds) so clients can poll the result
+JOB_TTL_SECONDS = _int_env("JOB_TTL_SECONDS", 900)
+
+# Warm pool of ready "random" posts for instant "Surprise Me" (size 0 = off). Producers
+# refill it only while no other generation is running; the pool survives restarts
+WARM_POOL_SIZE = _int_env("WARM_POOL_SIZE", 0)
+WARM_POOL_CONCURRENCY = _int_env("WARM_POOL_CONCURRENCY", 1)
+WARM_POOL_PATH = os.getenv("WARM_POOL_PATH") or os.path.join(PROJECT_ROOT, ".cache", "warm_pool.json")
+
+# Worker processes for overlay + encode in the server (0 = run them in the threadpool)
+RENDER_PROCESSES = _int_env("RENDER_PROCESSES", 0)
+
+# Content-addressed store for final images served at /images/{hash}.{ext}
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR") or os.path.join(PROJECT_ROOT, "generated_images")
+
+# Output encoding: png (lossless), jpeg or webp. OUTPUT_MAX_BYTES > 0 makes the
+# encoder search for the highest quality that fits the budget (lossy formats only)
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "png").lower()
+OUTPUT_QUALITY = _int_env("OUTPUT_QUALITY", 90)
+OUTPUT_MAX_BYTES = _int_env("OUTPUT_MAX_BYTES", 0)
+PNG_COMPRESS_LEVEL = _int_env("PNG_COMPRESS_LEVEL", 6)
+
+# Extra placements rendered from each generated image, comma-separated names from
+# config/framing.py VARIANTS (story, feed_square, feed_portrait, thumbnail); empty = none
+OUTPUT_VARIANTS = tuple(name.strip() for name in os.getenv("OUTPUT_VARIANTS", "").split(",") if name.strip())
+
+
+def encode_options():
+    """Keyword arguments for TextOverlayService.encode from the settings above"""
+    return {
+        "format": OUTPUT_FORMAT,
+        "quality": OUTPUT_QUALITY,
+        "max_bytes": OUTPUT_MAX_BYTES or None,
+        "png_compress_level": PNG_COMPRESS_LEVEL,
+    }
+
+# Batch runs: parallel generations and per-model request budgets (requests/minute, 0 = unlimited)
+BATCH_CONCURRENCY = _int_env("BATCH_CONCURRENCY", 4)
+TEXT_MODEL_RPM = _int_env("TEXT_MODEL_RPM", 60)
+IMAGE_MODEL_RPM = _int_env("IMAGE_MODEL_RPM", 10)
+
+# Persistent LLM response cache (off by default so interactive output stays fresh)
+LLM_CACHE_ENABLED = _bool_env("LLM_CACHE_ENABLED", False)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or os.path.join(PROJECT_ROOT, ".cache", "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = _int_env("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = _int_env("LLM_CACHE_MAX_ENTRIES", 10000)
+LLM_IMAGE_CACHE_MAX_MB = _int_env("LLM_IMAGE_CACHE_MAX_MB", 1024)
+
+# Post library (SQLite) shared by the server and the batch scripts
+POST_LIBRARY_ENABLED = _bool_env("POST_LIBRARY_ENABLED", True)
+POST_LIBRARY_PATH = os.getenv("POST_LIBRARY_PATH") or os.path.join(PROJECT_ROOT, "images", "posts.sqlite3")
+
+# Near-duplicate fact detection, checked against the post library before the image call.
+# Lexical (MinHash) always; DEDUP_EMBEDDINGS = gemini or local adds a semantic check
+DEDUP_ENABLED = _bool_env("DEDUP_ENABLED", True)
+DEDUP_LEXICAL_THRESHOLD_PERCENT = _int_env("DEDUP_LEXICAL_THRESHOLD_PERCENT", 50)
+DEDUP_SEMANTIC_THRESHOLD_PERCENT = _int_env("DEDUP_SEMANTIC_THRESHOLD_PERCENT", 90)
+DEDUP_REGENERATE_ATTEMPTS = _int_env("DEDUP_REGENERATE_ATTEMPTS", 2)
+DEDUP_EMBEDDINGS = os.getenv("DEDUP_EMBEDDINGS", "").strip().lower()
+DEDUP_EMBEDDING_MODEL = os.getenv("DEDUP_EMBEDDING_MODEL") or None
+
+# Visually repeated images: pHash + dHash within IMAGE_DEDUP_RADIUS bits (of 64) of a stored
+# image. IMAGE_DEDUP_ACTION = flag (keep it, report the match) or reject (fail the image)
+IMAGE_DEDUP_ENABLED = _bool_env("IMAGE_DEDUP_ENABLED", True)
+IMAGE_DEDUP_RADIUS = _int_env("IMAGE_DEDUP_RADIUS", 8)
+IMAGE_DEDUP_ACTION = os.getenv("IMAGE_DEDUP_ACTION", "flag").strip().lower()
+
@@ -0,0 +1,201 @@
+"""
+Text Layout
+Line breaking with memoized glyph advances, plus font-size fitting for a bounding box.
+"""
+import threading
+
+# (font path, font size, font mode) -> {text: advance}
+_advance_cache = {}
+_advance_lock = threading.Lock()
+# Cap per font so user-supplied text cannot grow the cache without bound
+MAX_CACHED_ADVANCES = 8192
+
+
+def _font_key(font, mode):
+    return (getattr(font, "path", id(font)), getattr(font, "size", None), mode)
+
+
+class TextMeasurer:
+    """Measures text advances for one font, memoizing every word and space"""
+
+    def __init__(self, font, draw=None):
+        self.font = font
+        self.draw = draw
+        self.mode = draw.fontmode if draw is not None else "L"
+        key = _font_key(font, self.mode)
+        with _advance_lock:
+            self._advances = _advance_cache.setdefault(key, {})
+
+    def measure(self, text: str) -> float:
+        """Advance width of ``text``, from the cache when seen before"""
+        advance = self._advances.get(text)
+        if advance is None:
+            if self.draw is not None:
+                advance = self.draw.textlength(text, font=self.font)
+            else:
+                advance = self.font.getlength(text)
+            if len(self._advances) >= MAX_CACHED_ADVANCES:
+                self._advances.clear()
+            self._advances[text] = advance
+        return advance
+
+    @property
+    def space(self) -> float:
+        return self.measure(" ")
+
+
+def break_lines_greedy(words, max_width, measurer, compat=False):
+    """
+    Greedy first-fit line breaking in one pass over the words.
+
+    Line widths are the sum of cached word and space advances. With ``compat``
+    the result matches the original wrap_text exactly: lines whose estimated
+    width falls near ``max_width`` are re-measured as a whole string (so kerning
+    decides ties the same way), and a first word wider than ``max_width`` is
+    preceded by an empty line as before.
+    """
+    lines = []
+    current = []
+    current_width = 0.0
+    space = measurer.space
+    tolerance = max(2.0, max_width * 0.02)
+
+    for word in words:
+        word_width = measurer.measure(word)
+        candidate_width = word_width if not current else current_width + space + word_width
+
+        if compat and abs(candidate_width - max_width) <= tolerance:
+            # Too close to call from the summed advances; measure the real line
+            fits = measurer.measure(" ".join(current + [word])) <= max_width
+        else:
+            fits = candidate_width <= max_width
+
+        if fits:
+            current.append(word)
+            current_width = candidate_width
+        elif current:
+            lines.append(" ".join(current))
+            current = [word]
+            current_width = word_width
+        else:
+            # Word wider than the line on its own
+            if compat:
+                lines.append("")
+            current = [word]
+            current_width = word_width
+
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+def break_lines_balanced(words, max_width, measurer):
+    """
+    Minimum-raggedness line breaking (sum of squared trailing space, last line free).
+
+    Dynamic programming over break points; each line only looks back as far as
+    the words that fit in ``max_width``, so the cost is linear in the number of
+    words for a fixed line width. Words wider than a line get a line of their own.
+    """
+    n = len(words)
+    if n == 0:
+        return []
+    widths = [measurer.measure(word) for word in words]
+    space = measurer.space
+
+    # best[i]: minimal cost to lay out words[i:]; next_break[i]: end of the first line
+    best = [0.0] * (n + 1)
+    next_break = [n] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        best[i] = float("inf")
+        line_width = -space
+        for j in range(i, n):
+            line_width += space + widths[j]
+            if line_width > max_width and j > i:
+                break
+            slack = max(0.0, max_width - line_width)
+            cost = (0.0 if j == n - 1 else slack * slack) + best[j + 1]
+            if cost < best[i]:
+                best[i] = cost
+                next_break[i] = j + 1
+
+    lines = []
+    i = 0
+    while i < n:
+        j = next_break[i]
+        lines.append(" ".join(words[i:j]))
+        i = j
+    return lines
+
+
+def layout_lines(text, font, max_width, draw=None, strategy="greedy", compat=False):
+    """
+    Breaks ``text`` into lines no wider than ``max_width``.
+
+    Args:
+        text: Text to wrap (split on whitespace)
+        font: Pillow font used for measuring
+        max_width: Maximum line width in pixels
+        draw: Optional ImageDraw; measurements then use its font mode
+        strategy: "greedy" (first fit) or "balanced" (minimum raggedness)
+        compat: Reproduce the original wrap_text breaks exactly (greedy only)
+
+    Returns:
+        List of line strings
+    """
+    measurer = TextMeasurer(font, draw)
+    words = text.split()
+    if strategy == "balanced":
+        return break_lines_balanced(words, max_width, measurer)
+    if strategy != "greedy":
+        raise ValueError(f"Unknown line breaking strategy: {strategy}")
+    return break_lines_greedy(words, max_width, measurer, compat=compat)
+
+
+def line_height_for(font, padding=10):
+    """Line height used by the overlay: bbox height of "Ay" plus padding"""
+    return font.getbbox("Ay")[3] + padding
+
+
+def fit_font_size(text, get_font, max_width, max_height, max_size, min_size=12,
+                  strategy="greedy", line_padding=10):
+    """
+    Finds the largest font size whose wrapped text fits in a bounding box.
+
+    Args:
+        text: Text to lay out
+        get_font: Callable returning a font for a pixel size (e.g. get_ubuntu_font)
+        max_width: Box width in pixels
+        max_height: Box height in pixels
+        max_size: Largest size to try
+        min_size: Smallest size to return, even if it still overflows
+        strategy: Line breaking strategy passed to layout_lines
+        line_padding: Extra pixels between lines
+
+    Returns:
+        (font, lines) for the chosen size
+    """
+    def layout(size):
+        font = get_font(size)
+        lines = layout_lines(text, font, max_width, strategy=strategy)
+        fits = len(lines) * line_height_for(font, line_padding) <= max_height
+        if fits:
+            fits = all(font.getlength(line) <= max_width for line in lines)
+        return font, lines, fits
+
+    # Binary search: fitting is monotonic in font size for practical purposes
+    low, high = min_size, max(min_size, max_size)
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        font, lines, fits = layout(mid)
+        if fits:
+            best = (font, lines)
+            low = mid + 1
+        else:
+            high = mid - 1
+
+    if best is None:
+        font, lines, _ = layout(min_size)
+        best = (font, lines)
+    return best
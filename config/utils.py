@@ -1,6 +1,7 @@
 import os
 import requests
-from PIL import ImageFont, ImageDraw
+from config.fonts import font_registry, DEFAULT_FACE
+from config.text_layout import layout_lines
 
 def download_font(font_url, save_path):
     if not os.path.exists(save_path):
@@ -15,19 +16,12 @@ def download_font(font_url, save_path):
         print(f"Font already exists at {save_path}")
 
 def get_ubuntu_font(size=40):
-    import os
-    font_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "fonts")
-    font_path = os.path.join(font_dir, "Ubuntu-Bold.ttf")
-    # URL for Ubuntu Bold from Google Fonts (raw github link or similar reliable source)
-    # Using a reliable raw link for Ubuntu font
-    font_url = "https://github.com/google/fonts/raw/main/ufl/ubuntu/Ubuntu-Bold.ttf"
-    
-    try:
-        download_font(font_url, font_path)
-        return ImageFont.truetype(font_path, size)
-    except Exception as e:
-        print(f"Error loading Ubuntu font: {e}. Falling back to default.")
-        return ImageFont.load_default()
+    """
+    Returns the bundled Ubuntu Bold font at the given size.
+    Served from the process-wide font registry, so repeated sizes never touch disk.
+    Use download_font to fetch the file once if assets/fonts is missing it.
+    """
+    return font_registry.get(DEFAULT_FACE, size)
 
 def draw_text_with_shadow(draw, position, text, font, fill="white", shadow_color="black", shadow_offset=(2, 2)):
     x, y = position
@@ -36,20 +30,14 @@ def draw_text_with_shadow(draw, position, text, font, fill="white", shadow_color
     # Draw text
     draw.text((x, y), text, font=font, fill=fill, anchor="mm")
 
-def wrap_text(text, font, max_width, draw):
-    lines = []
-    words = text.split()
-    current_line = []
-    
-    for word in words:
-        current_line.append(word)
-        line_width = draw.textlength(" ".join(current_line), font=font)
-        if line_width > max_width:
-            current_line.pop()
-            lines.append(" ".join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(" ".join(current_line))
-        
-    return lines
+def wrap_text(text, font, max_width, draw, strategy="greedy", compat=True):
+    """
+    Wraps text into lines no wider than max_width.
+    Word and space advances are measured once and cached per font, so wrapping
+    is linear in the number of words (see config.text_layout).
+
+    Args:
+        strategy: "greedy" (first fit) or "balanced" (minimum raggedness)
+        compat: Keep the exact line breaks of the original implementation
+    """
+    return layout_lines(text, font, max_width, draw=draw, strategy=strategy, compat=compat)
@@ -6,13 +6,30 @@ if sys.platform == 'win32':
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
     sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 
+from typing import Dict, List, Optional
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from services.quote_service import QuoteService
 from services.image_service import ImageService
 from services.text_overlay_service import TextOverlayService
+from services.generation_service import GenerationService
+from services.job_service import JobService, QueueFullError
+from services.image_store import ImageStore, mime_type_for, parse_range
+from services.warm_pool import WarmPool, is_random_prompt
+from services.render_pool import RenderPool
+from services.post_library import PostLibrary
+from services.quote_dedup import DuplicateQuoteError, make_deduper
+from services.image_dedup import make_image_deduper
+from services.llm_cache import with_cache
+from services.resilience import with_resilience
+from services.gemini_client import get_client, aclose_client
+from config import settings
+from config.fonts import font_registry
+import json
 import logging
 
 # Configure logging
@@ -28,9 +45,43 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 # Services
-quote_service = QuoteService()
-image_service = ImageService()
+# One pooled Gemini client shared by every service. Calls get retries, deadlines and a
+# circuit breaker; repeated (model, prompt, config) calls are served from the response
+# cache when LLM_CACHE_ENABLED is set
+gemini_client = with_cache(with_resilience(get_client()))
+# Every finished post is recorded here (shared with the batch scripts)
+post_library = PostLibrary(settings.POST_LIBRARY_PATH) if settings.POST_LIBRARY_ENABLED else None
+# New quotes that repeat a stored fact are regenerated before the image call (DEDUP_*)
+quote_deduper = make_deduper(post_library, gemini_client)
+quote_service = QuoteService(gemini_client, quote_deduper)
+# Generated images that look like stored ones are flagged or rejected (IMAGE_DEDUP_*)
+image_deduper = make_image_deduper(post_library)
+image_service = ImageService(gemini_client, image_deduper=image_deduper)
 text_overlay_service = TextOverlayService()
+image_store = ImageStore(settings.IMAGE_STORE_DIR)
+# CPU-bound overlay + encode in worker processes when RENDER_PROCESSES > 0
+render_pool = RenderPool(settings.RENDER_PROCESSES) if settings.RENDER_PROCESSES > 0 else None
+generation_service = GenerationService(
+    quote_service, image_service, text_overlay_service, image_store,
+    encode_options=settings.encode_options(),
+    text_mode=settings.TEXT_GENERATION_MODE,
+    render_pool=render_pool,
+    variants=settings.OUTPUT_VARIANTS,
+    post_library=post_library,
+)
+job_service = JobService(
+    generation_service,
+    concurrency=settings.GENERATION_CONCURRENCY,
+    queue_size=settings.JOB_QUEUE_SIZE,
+    ttl_seconds=settings.JOB_TTL_SECONDS,
+)
+# Ready-made "random" posts, refilled only while no jobs are queued or running
+warm_pool = WarmPool(
+    generation_service, image_store, settings.WARM_POOL_PATH,
+    size=settings.WARM_POOL_SIZE,
+    concurrency=settings.WARM_POOL_CONCURRENCY,
+    is_busy=lambda: job_service.pending > 0,
+)
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -40,6 +91,92 @@ class GenerateResponse(BaseModel):
     quote: str
     image_url: str
     caption: str
+    # Extra placements (OUTPUT_VARIANTS): variant name -> /images/... URL
+    variants: Dict[str, str] = {}
+    # Stored image this one looks like (IMAGE_DEDUP_ACTION=flag)
+    near_duplicate_of: Optional[str] = None
+
+class JobCreatedResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    completed_stages: List[str] = []
+    quote: Optional[str] = None
+    caption: Optional[str] = None
+    image_prompt: Optional[str] = None
+    image_url: Optional[str] = None
+    variants: Dict[str, str] = {}
+    near_duplicate_of: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class PostResponse(BaseModel):
+    id: int
+    image_number: Optional[int] = None
+    entity: Optional[str] = None
+    quote: str
+    caption: Optional[str] = None
+    image_prompt: Optional[str] = None
+    progression_text: Optional[str] = None
+    image_path: Optional[str] = None
+    image_url: Optional[str] = None
+    content_hash: Optional[str] = None
+    image_hash: Optional[str] = None
+    variants: Dict[str, str] = {}
+    source: Optional[str] = None
+    created_at: float
+
+class PostsResponse(BaseModel):
+    posts: List[PostResponse]
+    # Pass back as ?cursor= for the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+@app.on_event("startup")
+async def load_fonts():
+    # Validate bundled fonts once instead of on the first overlay
+    font_registry.load_bundled()
+
+@app.on_event("startup")
+async def load_quote_deduper():
+    # Index every stored quote before the first generation is checked against them
+    if quote_deduper is not None:
+        count = await run_in_threadpool(quote_deduper.load)
+        logger.info(f"Quote dedup index loaded with {count} stored quotes")
+
+@app.on_event("startup")
+async def load_image_deduper():
+    # Perceptual hashes of every stored image, so repeats are caught from the first request
+    if image_deduper is not None:
+        count = await run_in_threadpool(image_deduper.load)
+        logger.info(f"Image dedup index loaded with {count} stored images")
+
+@app.on_event("startup")
+async def start_render_pool():
+    # Spawn the workers (fonts loaded) before the first request needs them
+    if render_pool is not None:
+        await run_in_threadpool(render_pool.start)
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_service.start()
+
+@app.on_event("startup")
+async def start_warm_pool():
+    await warm_pool.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await warm_pool.stop()
+    await job_service.stop()
+    if render_pool is not None:
+        await run_in_threadpool(render_pool.shutdown)
+    await aclose_client()
 
 @app.get("/")
 async def read_root(request: Request):
@@ -48,37 +185,115 @@ async def read_root(request: Request):
 @app.post("/api/generate", response_model=GenerateResponse)
 async def generate(request: GenerateRequest):
     logger.info(f"Received generation request: {request.prompt}")
+    if is_random_prompt(request.prompt, request.description):
+        post = warm_pool.pop()
+        if post is not None:
+            logger.info("Served random post from the warm pool")
+            return GenerateResponse(quote=post["quote"], image_url=post["image_url"], caption=post["caption"],
+                                    variants=post.get("variants") or {})
     try:
-        # 1. Generate Quote
-        quote = quote_service.generate_quote(request.prompt, request.description)
-        logger.info(f"Generated quote: {quote}")
-
-        # 2. Generate Caption (Parallelizable, but sequential for now)
-        caption = quote_service.generate_caption(quote)
-        logger.info("Generated caption")
-
-        # 3. Generate Image
-        try:
-            generated_image = image_service.generate_image(quote)
-            logger.info("Image generated successfully")
-            
-            # 4. Overlay text on image
-            final_image = text_overlay_service.overlay_text(generated_image, quote)
-            logger.info("Text overlaid on image")
-            
-            # 5. Convert to base64 data URL
-            image_url = text_overlay_service.image_to_base64(final_image)
-            logger.info("Image converted to base64")
-        except Exception as e:
-            logger.error(f"Error generating/processing image: {e}")
-            image_url = "https://placehold.co/600x400?text=Error+Generating+Image"
-
-        return GenerateResponse(quote=quote, image_url=image_url, caption=caption)
+        result = await generation_service.generate(request.prompt, request.description)
+        return GenerateResponse(quote=result["quote"], image_url=result["image_url"], caption=result["caption"],
+                                variants=result["variants"], near_duplicate_of=result["near_duplicate_of"])
 
+    except DuplicateQuoteError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/generate/stream")
+async def generate_stream(prompt: str, description: str = ""):
+    """Server-Sent Events variant of /api/generate: each artifact is sent as soon as it is ready"""
+    logger.info(f"Received streaming generation request: {prompt}")
+
+    post = warm_pool.pop() if is_random_prompt(prompt, description) else None
+
+    async def events():
+        if post is None:
+            async for event, data in generation_service.stream(prompt, description):
+                yield event, data
+            return
+        logger.info("Served random post from the warm pool")
+        yield "quote", {"quote": post["quote"]}
+        yield "caption", {"caption": post["caption"]}
+        yield "image_prompt", {"image_prompt": post["image_prompt"]}
+        yield "image", {"image_url": post["image_url"]}
+        yield "done", {"variants": {}, **post, "image_error": None}
+
+    async def event_stream():
+        async for event, data in events():
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/jobs", response_model=JobCreatedResponse, status_code=202)
+async def create_job(request: GenerateRequest):
+    logger.info(f"Received job request: {request.prompt}")
+    try:
+        job = job_service.submit(request.prompt, request.description)
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "5"})
+    return JobCreatedResponse(job_id=job.id, status=job.status, status_url=f"/api/jobs/{job.id}")
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    job = job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatusResponse(**job.to_dict())
+
+@app.get("/api/posts", response_model=PostsResponse)
+async def list_posts(entity: Optional[str] = None, q: Optional[str] = None, limit: int = 20, cursor: Optional[str] = None):
+    """Newest posts first, filtered by entity and/or words in the quote or caption"""
+    if post_library is None:
+        raise HTTPException(status_code=404, detail="Post library is disabled")
+    try:
+        posts, next_cursor = await run_in_threadpool(post_library.query, entity, q, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PostsResponse(posts=posts, next_cursor=next_cursor)
+
+@app.get("/images/{key}")
+async def get_image(key: str, request: Request):
+    """Serves a stored image; content-addressed, so it can be cached forever"""
+    path = image_store.path_for(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{key.split(".")[0]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mime_type_for(key)
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    size = os.path.getsize(path)
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    start, end = byte_range
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=data, status_code=206, media_type=media_type, headers=headers)
+
 if __name__ == "__main__":
     import uvicorn
     print("\n" + "="*50)
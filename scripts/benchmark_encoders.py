@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark output encoders: encode time and output size per format and quality
+Usage: python scripts/benchmark_encoders.py [image_path] [--runs N] [--max-bytes N]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import statistics
+from PIL import Image, ImageDraw, ImageFilter
+from services.text_overlay_service import TextOverlayService
+
+def synthetic_image(width=1080, height=1920):
+    """Build a 9:16 test image with gradients, stars and a blurred nebula"""
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image = Image.merge("RGB", (image.getchannel(0).point(lambda v: v // 4),
+                                image.getchannel(0).point(lambda v: v // 3),
+                                image.getchannel(0).point(lambda v: v // 2)))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(42)
+    for _ in range(1500):
+        x, y, r = rng.randrange(width), rng.randrange(height), rng.choice([1, 1, 1, 2])
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(255, 255, 255))
+    for _ in range(12):
+        x, y, r = rng.randrange(width), rng.randrange(height // 2), rng.randrange(80, 300)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(rng.randrange(256), 40, rng.randrange(256)))
+    return image.filter(ImageFilter.GaussianBlur(2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output encoders")
+    parser.add_argument("image", nargs="?", help="Image to encode (default: synthetic 1080x1920)")
+    parser.add_argument("--runs", type=int, default=3, help="Encodes per configuration")
+    parser.add_argument("--max-bytes", type=int, default=500_000, help="Byte budget for the size-targeted rows")
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB") if args.image else synthetic_image()
+    service = TextOverlayService()
+
+    configs = [
+        ("png", {"png_compress_level": 1}),
+        ("png", {"png_compress_level": 6}),
+        ("png", {"png_compress_level": 9}),
+        ("jpeg", {"quality": 95}),
+        ("jpeg", {"quality": 85}),
+        ("jpeg", {"quality": 90, "max_bytes": args.max_bytes}),
+        ("webp", {"quality": 90}),
+        ("webp", {"quality": 80}),
+        ("webp", {"quality": 90, "max_bytes": args.max_bytes}),
+    ]
+
+    print(f"\nImage: {args.image or 'synthetic'} {image.size[0]}x{image.size[1]}, {args.runs} run(s) each")
+    print("=" * 72)
+    print(f"{'format':<8}{'options':<36}{'size (KB)':>12}{'median ms':>12}")
+    print("-" * 72)
+    for format, options in configs:
+        timings = []
+        for _ in range(args.runs):
+            encoded = service.encode(image, format, **options)
+            timings.append(encoded.encode_seconds * 1000)
+        label = ", ".join(f"{k}={v}" for k, v in options.items())
+        if encoded.quality is not None and "max_bytes" in options:
+            label += f" -> q{encoded.quality}"
+        print(f"{format:<8}{label:<36}{encoded.size / 1024:>12.1f}{statistics.median(timings):>12.1f}")
+    print("=" * 72)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark peak memory per request: decode the model's image, overlay the quote,
+encode and store, comparing the old copy-heavy path with the current one
+Usage: python scripts/benchmark_memory.py [image_path] [--runs N] [--format png|jpeg|webp]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import json
+import statistics
+import subprocess
+import tempfile
+from PIL import Image
+from config.fonts import font_registry
+from services.image_store import ImageStore
+from services.text_overlay_service import TextOverlayService
+from scripts.benchmark_encoders import synthetic_image
+
+QUOTE = "Saturn's rings are mostly water ice, and some pieces are as large as a house."
+
+
+def _proc_status_mb(field: str):
+    """A VmRSS / VmHWM line of /proc/self/status in MB, or None off Linux"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss() -> float:
+    """
+    Starts a new peak measurement and returns the current RSS in MB. On Linux
+    the high-water mark is reset so setup work does not hide the request's
+    peak; elsewhere the peak since process start is used.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    current = _proc_status_mb("VmRSS")
+    return current if current is not None else peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (since the last reset on Linux), in MB"""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def legacy_request(data: bytes, service: TextOverlayService, store: ImageStore, encode_options: dict) -> str:
+    """The pipeline before streaming: decode + copy, overlay on a copy, encode to bytes, then store"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = image.copy()
+    final_image = service.overlay_text(image, QUOTE)
+    encoded = service.encode(final_image, **encode_options)
+    return store.put(encoded.data, encoded.ext)
+
+
+def current_request(data: bytes, service: TextOverlayService, store: ImageStore, encode_options: dict) -> str:
+    """Decode once, draw in place and stream the encoder output into the store"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    else:
+        image.load()
+    final_image = service.overlay_text(image, QUOTE, in_place=True)
+    with store.writer(encode_options.get("format", "png")) as out:
+        service.encode_to(final_image, out, **encode_options)
+    return out.key
+
+
+VARIANTS = {"legacy": legacy_request, "current": current_request}
+
+
+def run_child(variant: str, input_path: str, store_dir: str, encode_options: dict):
+    """Runs one request in this (fresh) process and prints its memory as JSON"""
+    font_registry.load_bundled()
+    service = TextOverlayService()
+    store = ImageStore(store_dir)
+    with open(input_path, "rb") as f:
+        data = f.read()
+    baseline = reset_peak_rss()
+    VARIANTS[variant](data, service, store, encode_options)
+    print(json.dumps({"baseline_mb": baseline, "peak_mb": peak_rss_mb()}))
+
+
+def measure(variant: str, input_path: str, store_dir: str, encode_options: dict) -> float:
+    """Peak RSS growth of one request, measured in a child process"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", variant, input_path,
+         "--store", store_dir, "--encode-options", json.dumps(encode_options)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["peak_mb"] - result["baseline_mb"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark peak memory per request")
+    parser.add_argument("image", nargs="?", help="Model output image (default: synthetic 1080x1920 PNG)")
+    parser.add_argument("--runs", type=int, default=3, help="Child processes per variant")
+    parser.add_argument("--format", default="png", choices=["png", "jpeg", "webp"], help="Output format")
+    parser.add_argument("--quality", type=int, default=90, help="Quality for jpeg/webp")
+    parser.add_argument("--max-bytes", type=int, default=None, help="Byte budget for jpeg/webp")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    parser.add_argument("--encode-options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.image, args.store, json.loads(args.encode_options))
+        return
+
+    if sys.platform == "win32":
+        print("❌ Peak RSS is read with the resource module, which is not available on Windows")
+        sys.exit(1)
+
+    encode_options = {"format": args.format}
+    if args.format != "png":
+        encode_options.update(quality=args.quality, max_bytes=args.max_bytes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = args.image
+        if input_path is None:
+            # The image model returns PNG bytes; decode cost starts from those
+            input_path = os.path.join(tmp, "input.png")
+            synthetic_image().save(input_path, format="PNG")
+        with Image.open(input_path) as probe:
+            print(f"Input: {probe.size[0]}x{probe.size[1]} {probe.mode}, "
+                  f"{os.path.getsize(input_path) / 1024:.0f} KB -> {args.format}")
+
+        print(f"{'variant':<10}{'median MB':>12}{'min MB':>10}{'max MB':>10}")
+        medians = {}
+        for variant in VARIANTS:
+            samples = [measure(variant, input_path, os.path.join(tmp, "store"), encode_options)
+                       for _ in range(args.runs)]
+            medians[variant] = statistics.median(samples)
+            print(f"{variant:<10}{medians[variant]:>12.1f}{min(samples):>10.1f}{max(samples):>10.1f}")
+
+        saved = medians["legacy"] - medians["current"]
+        print(f"\nPeak RSS per request: {medians['legacy']:.1f} MB -> {medians['current']:.1f} MB "
+              f"({saved:.1f} MB less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark text overlay: per-line double draw.text vs the single-pass compositor
+Usage: python scripts/benchmark_overlay.py [image_path] [--runs N]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import time
+from PIL import Image, ImageDraw, ImageChops
+from config.utils import get_ubuntu_font, draw_text_with_shadow, wrap_text
+from config.compositor import TextStyle
+from services.text_overlay_service import TextOverlayService
+from scripts.benchmark_encoders import synthetic_image
+
+SAMPLE_QUOTE = (
+    "Did you know that a small percentage of the static \"snow\" you see on an old analog TV "
+    "when it's not tuned to a channel is actually the Cosmic Microwave Background - the leftover "
+    "radiation from the Big Bang itself? You're literally seeing an echo of the universe's beginning!"
+)
+
+def legacy_overlay(image, quote):
+    """The previous overlay: copy the frame, then draw shadow and fill per line"""
+    image = image.copy()
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    font = get_ubuntu_font(int(width * 0.032))
+    margin = int(width * 0.1)
+    lines = wrap_text(quote, font, width - (2 * margin), draw)
+    line_height = font.getbbox("Ay")[3] + 10
+    current_y = height - int(height * 0.25) - (len(lines) * line_height // 2)
+    for line in lines:
+        draw_text_with_shadow(draw, (width // 2, current_y), line, font)
+        current_y += line_height
+    return image
+
+def time_ms(func, runs):
+    func()  # warm up fonts and advance caches
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text overlay")
+    parser.add_argument("image", nargs="?", help="Background image (default: synthetic 1080x1920)")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per configuration")
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB") if args.image else synthetic_image()
+    service = TextOverlayService()
+    frames = [image.copy() for _ in range(args.runs + 1)]
+
+    cases = [
+        ("legacy: copy + 2x draw.text per line", lambda: legacy_overlay(image, SAMPLE_QUOTE)),
+        ("compositor (copy)", lambda: service.overlay_text(image, SAMPLE_QUOTE)),
+        ("compositor (in place)", lambda: service.overlay_text(frames.pop(), SAMPLE_QUOTE, in_place=True)),
+        ("compositor + soft shadow", lambda: service.overlay_text(image, SAMPLE_QUOTE, style=TextStyle(shadow_blur=4))),
+        ("compositor + outline", lambda: service.overlay_text(image, SAMPLE_QUOTE, style=TextStyle(outline_width=2))),
+        ("compositor + gradient scrim", lambda: service.overlay_text(image, SAMPLE_QUOTE, style=TextStyle(scrim_opacity=160))),
+    ]
+
+    same = ImageChops.difference(legacy_overlay(image, SAMPLE_QUOTE), service.overlay_text(image, SAMPLE_QUOTE)).getbbox() is None
+    print(f"\nImage: {args.image or 'synthetic'} {image.size[0]}x{image.size[1]}, {args.runs} run(s) each")
+    print(f"Default style output identical to legacy: {'yes' if same else 'NO'}")
+    print("=" * 60)
+    baseline = None
+    for label, func in cases:
+        ms = time_ms(func, args.runs)
+        baseline = baseline or ms
+        print(f"{label:<42}{ms:>8.2f} ms {baseline / ms:>6.2f}x")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
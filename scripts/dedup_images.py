@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Find visually duplicate images in images/ by perceptual hash (pHash + dHash). Files are
+hashed in parallel worker processes; of each group of look-alikes the earliest image
+(by image number) is kept and the later ones are reported, or moved with --move-to.
+Usage: python scripts/dedup_images.py [--images-dir DIR] [--radius BITS] [--workers N]
+       [--no-embedded] [--move-to DIR]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from services.image_dedup import ImageHashIndex, hash_file
+from services.caption_backfill import is_variant_file, parse_image_filename
+from config.framing import VARIANTS
+from config import settings
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def image_order(filename):
+    """Earlier image numbers first; unnumbered files after them, by name"""
+    number = parse_image_filename(filename)[0]
+    return (number is None, number or 0, filename)
+
+
+def variant_files(images_dir, filename, names):
+    """The variant files written next to an image ({stem}_{variant}.{ext})"""
+    stem = os.path.splitext(filename)[0]
+    prefixes = tuple(f"{stem}_{variant}." for variant in VARIANTS)
+    return [name for name in names if name.startswith(prefixes)]
+
+
+def main():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Find (and optionally move) visually duplicate images")
+    parser.add_argument("--images-dir", default=os.path.join(project_root, "images"), help="Directory to scan")
+    parser.add_argument("--radius", type=int, default=settings.IMAGE_DEDUP_RADIUS,
+                        help="Max differing bits (of 64) under both hashes (default: IMAGE_DEDUP_RADIUS or 8)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Hashing processes (default: CPU count)")
+    parser.add_argument("--embedded", action=argparse.BooleanOptionalAction, default=True,
+                        help="Use the hash embedded at generation time when a file has one; --no-embedded "
+                             "hashes every file's pixels so overlaid and clean hashes are never mixed")
+    parser.add_argument("--move-to", help="Move duplicates (and their variant files) into this directory")
+    args = parser.parse_args()
+
+    images_dir = os.path.abspath(args.images_dir)
+    if not os.path.isdir(images_dir):
+        print(f"❌ Images directory not found: {images_dir}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    names = set(os.listdir(images_dir))
+    filenames = sorted((name for name in names
+                        if name.lower().endswith(IMAGE_EXTENSIONS) and not is_variant_file(name, names)),
+                       key=image_order)
+    paths = [os.path.join(images_dir, name) for name in filenames]
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        hashes = list(executor.map(partial(hash_file, use_embedded=args.embedded), paths, chunksize=32))
+    hash_seconds = time.perf_counter() - start
+    unreadable = sum(1 for value in hashes if value is None)
+    print(f"🔎 Hashed {len(filenames)} images in {hash_seconds:.2f}s on {args.workers} process(es)"
+          + (f", {unreadable} unreadable" if unreadable else ""))
+
+    # Each image is compared with the images kept so far, so the earliest of a group survives
+    index = ImageHashIndex()
+    duplicates = []
+    for filename, value in zip(filenames, hashes):
+        if value is None:
+            continue
+        matches = index.query(value, args.radius)
+        if matches:
+            duplicates.append((filename, matches[0]))
+        else:
+            index.add(value, filename)
+
+    for filename, match in duplicates:
+        print(f"♻️  {filename} looks like {match.label} (pHash {match.phash_distance}, dHash {match.dhash_distance} bits)")
+    print(f"🧾 {len(duplicates)} near-duplicate(s) of {index.size} distinct image(s) "
+          f"in {time.perf_counter() - start:.2f}s (radius {args.radius} bits)")
+
+    if not duplicates or not args.move_to:
+        return
+    move_dir = os.path.abspath(args.move_to)
+    os.makedirs(move_dir, exist_ok=True)
+    moved = 0
+    for filename, _ in duplicates:
+        for name in [filename, *variant_files(images_dir, filename, names)]:
+            shutil.move(os.path.join(images_dir, name), os.path.join(move_dir, name))
+            moved += 1
+    print(f"✅ Moved {moved} file(s) to {move_dir}")
+
+
+if __name__ == "__main__":
+    main()
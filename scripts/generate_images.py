@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 """
-Script to generate 60 images using the "Surprise Me" functionality
+Script to generate images in bulk using the "Surprise Me" functionality
 Each image will be saved to the images/ directory in the project root
+Images are generated concurrently (--concurrency) under per-model rate limits
+Progress is checkpointed in images/manifest.jsonl; rerunning resumes where it stopped
+With --bulk, all text goes through one batch job and images are rendered on a process pool
 """
 import sys
 import os
@@ -17,13 +20,26 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import random
 import time
 import json
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from services.quote_service import QuoteService
 from services.image_service import ImageService
-from services.text_overlay_service import TextOverlayService
+from services.text_overlay_service import TextOverlayService, output_ext
+from services.batch_engine import BatchEngine
+from services.rate_limit import RateLimiter, RateLimitedClient
+from services.manifest import Manifest
+from services.post_library import PostLibrary, record_to_post, file_hash, portable_path
+from services.quote_dedup import DuplicateQuoteError, make_deduper
+from services.image_dedup import DuplicateImageError, make_image_deduper
+from services.llm_cache import with_cache, get_response_cache
+from services.resilience import with_resilience
+from services.gemini_client import get_client
+from services.batch_backend import BatchRequest, GeminiBatchBackend, FakeBatchBackend
+from services.render_pool import init_batch_worker, render_post, write_variants
 from config.prompts import SPACE_ENTITIES
-from dotenv import load_dotenv
-
-load_dotenv(override=True)
+from config import settings
+from config.framing import VARIANTS
 
 def sanitize_filename(text, max_length=50):
     """Sanitize text for use in filename"""
@@ -38,91 +54,270 @@ def sanitize_filename(text, max_length=50):
         text = text[:max_length]
     return text
 
-def generate_and_save_image(index, total, images_dir, captions_file, json_file, json_data, quote_service, image_service, text_overlay_service):
+def image_filename_stem(index, entity, quote):
+    """File name without extension: number, entity and the first words of the quote"""
+    quote_snippet = sanitize_filename(quote[:30])
+    return f"image_{index + 1:03d}_{entity}_{quote_snippet}"
+
+def post_metadata(index, entity, quote, caption, image_prompt, progression_text):
+    """Post details embedded in the image file, so the file can be indexed without the manifest"""
+    return {
+        "image_number": index + 1,
+        "entity": entity,
+        "quote": quote,
+        "caption": caption,
+        "image_prompt": image_prompt,
+        "progression_text": progression_text,
+        "generated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def record_image(index, filepath, entity, quote, caption, image_prompt, progression_text, captions_file, manifest, write_lock=None, variants=None, library=None, image_hash=None):
+    """Append the manifest entry and the text-file caption for one saved image (and add it to the post library)"""
+    filename = os.path.basename(filepath)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    image_path_relative = os.path.relpath(filepath, project_root)
+    
+    # Create JSON object with all information
+    image_data = {
+        "image_number": index + 1,
+        "filename": filename,
+        "image_path": filepath,
+        "image_path_relative": image_path_relative,
+        "entity": entity,
+        "quote": quote,
+        "instagram_caption": caption,
+        "image_prompt": image_prompt,
+        "progression_text": progression_text,
+        "variants": variants or {},
+        "image_hash": image_hash,
+        "generated_at": time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    
+    # Checkpoint: one durable manifest line per finished image
+    manifest.append(image_data)
+    
+    # The manifest stays the checkpoint; a library error only costs the index entry
+    if library is not None:
+        try:
+            post = record_to_post(image_data, project_root)
+            post["content_hash"] = file_hash(filepath)
+            library.add(post)
+        except Exception as e:
+            print(f"⚠️  #{index + 1:03d} not added to the post library: {e}")
+    
+    # Also save to text file for backward compatibility (one worker at a time)
+    with (write_lock or threading.Lock()):
+        with open(captions_file, 'a', encoding='utf-8') as f:
+            f.write(f"\n{'='*80}\n")
+            f.write(f"Image #{index + 1:03d}\n")
+            f.write(f"Filename: {filename}\n")
+            f.write(f"Entity: {entity}\n")
+            f.write(f"Quote: {quote}\n")
+            f.write(f"{'-'*80}\n")
+            f.write(f"Instagram Caption:\n{caption}\n")
+            f.write(f"{'='*80}\n")
+
+def generate_and_save_image(index, total, images_dir, captions_file, manifest, quote_service, image_service, text_overlay_service, encode_options=None, write_lock=None, text_mode="multi", variants=(), library=None):
     """Generate one image and save it, along with its caption"""
-    print(f"\n{'='*60}")
-    print(f"Generating image {index + 1}/{total}")
-    print(f"{'='*60}")
+    tag = f"[#{index + 1:03d}]"
+    print(f"{tag} Generating image {index + 1}/{total}")
+    quote = image_hash = None
     
     try:
         # Pick a random entity (same as "Surprise Me" button)
         entity = random.choice(SPACE_ENTITIES)
-        print(f"Selected entity: {entity}")
+        print(f"{tag} Selected entity: {entity}")
+        
+        # Single text mode: quote, caption and image prompt from one structured call
+        post = quote_service.generate_post(entity, '') if text_mode == "single" else None
+        image_prompt = post["image_prompt"] if post else None
+        progression_text = post["progression_text"] if post else None
         
-        # Generate quote (using 'random' prompt which will pick random entity)
-        print("Generating quote...")
-        quote = quote_service.generate_quote('random', '')
-        print(f"Generated quote: {quote[:80]}...")
+        # Generate quote for the selected entity ("combined" mode gets the image prompt with it)
+        if post:
+            quote = post["quote"]
+        elif image_service.prompt_strategy == "combined":
+            combined = quote_service.generate_quote_with_image_prompt(entity, '')
+            quote, image_prompt = combined["quote"], combined["image_prompt"]
+        else:
+            quote = quote_service.generate_quote(entity, '')
+        print(f"{tag} Generated quote: {quote[:80]}...")
         
         # Generate Instagram caption
-        print("Generating Instagram caption...")
-        caption = quote_service.generate_caption(quote)
-        print("Caption generated successfully")
+        caption = post["caption"] if post else quote_service.generate_caption(quote)
+        print(f"{tag} Caption generated successfully")
         
         # Generate image
-        print("Generating image...")
-        generated_image = image_service.generate_image(quote)
-        print("Image generated successfully")
-        
-        # Overlay text on image
-        print("Overlaying text...")
-        final_image = text_overlay_service.overlay_text(generated_image, quote)
-        print("Text overlaid successfully")
+        if image_prompt is None:
+            image_prompt = image_service.generate_image_prompt(quote, entity)
+        generated_image = image_service.render_image(image_prompt)
+        print(f"{tag} Image generated successfully")
+        # Perceptual hash, reserved by the image deduper (None without one)
+        image_hash, _ = image_service.screen_image(generated_image)
         
         # Create filename
         # Use entity name and first few words of quote
-        quote_snippet = sanitize_filename(quote[:30])
-        filename = f"image_{index + 1:03d}_{entity}_{quote_snippet}.png"
-        filepath = os.path.join(images_dir, filename)
-        
-        # Save image
-        final_image.save(filepath, "PNG")
-        print(f"✅ Saved: {filepath}")
-        
-        # Get image paths
-        image_path_relative = os.path.relpath(filepath, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        encode_options = encode_options or {}
+        path_stem = os.path.join(images_dir, image_filename_stem(index, entity, quote))
+        filepath = f"{path_stem}.{output_ext(encode_options.get('format', 'png'))}"
+        metadata = post_metadata(index, entity, quote, caption, image_prompt, progression_text)
+        if image_hash:
+            metadata["image_hash"] = image_hash
         
-        # Create JSON object with all information
-        image_data = {
-            "image_number": index + 1,
-            "filename": filename,
-            "image_path": filepath,
-            "image_path_relative": image_path_relative,
-            "entity": entity,
-            "quote": quote,
-            "instagram_caption": caption,
-            "generated_at": time.strftime('%Y-%m-%d %H:%M:%S')
-        }
+        # Extra placements come from the clean image, before the overlay draws on it
+        variant_paths = {}
+        if variants:
+            variant_paths = write_variants(text_overlay_service, generated_image, quote, variants, path_stem,
+                                           encode_options, metadata)
+            print(f"{tag} Saved variants: {', '.join(variant_paths)}")
         
-        # Add to JSON data array
-        json_data.append(image_data)
-        
-        # Save JSON file (overwrite each time to keep it updated)
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+        # Overlay text on image
+        final_image = text_overlay_service.overlay_text(generated_image, quote, in_place=True)
         
-        # Also save to text file for backward compatibility
-        with open(captions_file, 'a', encoding='utf-8') as f:
-            f.write(f"\n{'='*80}\n")
-            f.write(f"Image #{index + 1:03d}\n")
-            f.write(f"Filename: {filename}\n")
-            f.write(f"Entity: {entity}\n")
-            f.write(f"Quote: {quote}\n")
-            f.write(f"{'-'*80}\n")
-            f.write(f"Instagram Caption:\n{caption}\n")
-            f.write(f"{'='*80}\n")
+        # Save image, streaming the encoder output straight to the file
+        with open(filepath, 'wb') as f:
+            encoded = text_overlay_service.encode_to(final_image, f, metadata=metadata, **encode_options)
+        print(f"{tag} ✅ Saved: {filepath} ({encoded.size / 1024:.0f} KB, encoded in {encoded.encode_seconds * 1000:.0f} ms)")
         
-        print(f"✅ Caption saved to: {captions_file}")
-        print(f"✅ JSON data updated: {json_file}")
+        record_image(index, filepath, entity, quote, caption, image_prompt, progression_text, captions_file, manifest, write_lock, variant_paths, library, image_hash)
+        if image_hash:
+            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            image_service.image_deduper.add(image_hash, portable_path(filepath, project_root))
+        quote_service.keep_quote(quote, caption)
+        print(f"{tag} ✅ Caption and manifest entry saved")
         
         return True, quote, caption
         
     except Exception as e:
-        print(f"❌ Error generating image {index + 1}: {e}")
+        print(f"{tag} ❌ Error generating image {index + 1}: {e}")
         import traceback
         traceback.print_exc()
+        # The fact (and a screened image) were claimed by the dedupers but nothing was saved
+        quote_service.release_quote(quote)
+        if image_hash:
+            image_service.image_deduper.release(image_hash)
         return False, None, None
 
+def fake_post_responder(entities):
+    """Canned structured post output for the offline fake batch backend"""
+    def respond(model, request):
+        entity = entities[int(request.key)]
+        return json.dumps({
+            "quote": f"{entity} is one of the most fascinating places in the universe.",
+            "caption": f"✨ Ever wondered about {entity}? ✨\n\n#space #universe #astronomy #cosmos",
+            "image_prompt": f"A breathtaking vertical 9:16 view of {entity} in deep space, no text",
+            "progression_text": "Look up...",
+        })
+    return respond
+
+def bulk_text(pending, entities, backend, quote_service, image_service, poll_seconds):
+    """
+    Write the text for every pending image with one batch submission.
+    
+    Every item is one structured post request; items whose batch output is
+    missing or invalid fall back to interactive calls. Quotes stay claimed
+    in the deduper until run_bulk keeps (image saved) or releases them.
+    
+    Returns:
+        Dict of index -> post dict (quote, caption, image_prompt, progression_text)
+    """
+    requests = []
+    for index in pending:
+        contents, config = quote_service.post_request(entities[index])
+        requests.append(BatchRequest(str(index), contents, config))
+    texts = backend.run(settings.TEXT_MODEL, requests, poll_seconds=poll_seconds)
+    
+    posts = {}
+    for index in pending:
+        try:
+            result = texts.get(str(index))
+            if isinstance(result, Exception):
+                raise result
+            post = quote_service.parse_post(result)
+            # Batch output skips the service's dedup; a repeated fact is rewritten interactively
+            match = quote_service.deduper.claim(post["quote"]) if quote_service.deduper is not None else None
+            if match is not None:
+                raise DuplicateQuoteError(post["quote"], match)
+            posts[index] = post
+            continue
+        except Exception as e:
+            print(f"[#{index + 1:03d}] ⚠️  Batch output unusable ({e}), falling back to interactive calls")
+        try:
+            post = quote_service.generate_post(entities[index])
+            if post is None:
+                quote = quote_service.generate_quote(entities[index], '')
+                post = {
+                    "quote": quote,
+                    "caption": quote_service.generate_caption(quote),
+                    "image_prompt": image_service.generate_image_prompt(quote, entities[index]),
+                    "progression_text": None,
+                }
+            posts[index] = post
+        except Exception as e:
+            print(f"[#{index + 1:03d}] ❌ Could not write text: {e}")
+    return posts
+
+def run_bulk(args, pending, images_dir, captions_file, manifest, quote_service, image_service, encode_options, library=None, image_deduper=None):
+    """
+    Bulk mode: all text through one batch job, then images rendered, overlaid and
+    encoded on a process pool. Returns the number of saved images.
+    
+    Workers hash each image; the image deduper checks the hashes here, as results
+    come in. A rejected image is deleted and left pending for the next run.
+    """
+    offline = args.batch_backend == "fake"
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    entities = {index: random.choice(SPACE_ENTITIES) for index in pending}
+    if offline:
+        backend = FakeBatchBackend(fake_post_responder(entities))
+    else:
+        backend = GeminiBatchBackend(get_client())
+    posts = bulk_text(pending, entities, backend, quote_service, image_service, args.poll_seconds)
+    print(f"📝 Text ready for {len(posts)}/{len(pending)} images, rendering on {args.processes} process(es)")
+    
+    # Each process gets its share of the image model budget
+    image_rpm = args.image_rpm / args.processes if args.image_rpm else 0
+    successful = 0
+    with ProcessPoolExecutor(max_workers=args.processes, initializer=init_batch_worker,
+                             initargs=(offline, image_rpm, encode_options, args.variants)) as executor:
+        futures = {}
+        for index, post in posts.items():
+            task = {
+                "quote": post["quote"],
+                "image_prompt": post["image_prompt"],
+                "path_stem": os.path.join(images_dir, image_filename_stem(index, entities[index], post["quote"])),
+                "metadata": post_metadata(index, entities[index], post["quote"], post["caption"],
+                                          post["image_prompt"], post["progression_text"]),
+            }
+            futures[executor.submit(render_post, task)] = index
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            post = posts[index]
+            try:
+                rendered = future.result()
+            except Exception as e:
+                quote_service.release_quote(post["quote"])
+                print(f"📊 {done}/{len(futures)} done (❌ #{index + 1:03d}: {e})")
+                continue
+            label = portable_path(rendered["path"], project_root)
+            try:
+                match = image_deduper.check(rendered["image_hash"], label) if image_deduper is not None else None
+            except DuplicateImageError as e:
+                for path in [rendered["path"], *rendered["variants"].values()]:
+                    os.remove(path)
+                quote_service.release_quote(post["quote"])
+                print(f"📊 {done}/{len(futures)} done (♻️  #{index + 1:03d} rejected: {e})")
+                continue
+            if match is not None:
+                print(f"⚠️  #{index + 1:03d} looks like {match.label} (pHash {match.phash_distance}, dHash {match.dhash_distance} bits)")
+            record_image(index, rendered["path"], entities[index], post["quote"], post["caption"],
+                         post["image_prompt"], post["progression_text"], captions_file, manifest,
+                         variants=rendered["variants"], library=library, image_hash=rendered["image_hash"])
+            quote_service.keep_quote(post["quote"], post["caption"])
+            successful += 1
+            print(f"📊 {done}/{len(futures)} done (✅ #{index + 1:03d}, {rendered['size'] / 1024:.0f} KB)")
+    return successful
+
 def check_if_running():
     """Check if another instance of this script is already running"""
     try:
@@ -157,8 +352,59 @@ def check_if_running():
             f.write(str(os.getpid()))
         return False
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Generate images using the \"Surprise Me\" flow")
+    parser.add_argument("--count", type=int, default=60, help="Number of images to generate (default: 60)")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY,
+                        help="Images generated in parallel (default: BATCH_CONCURRENCY or 4)")
+    parser.add_argument("--text-rpm", type=int, default=settings.TEXT_MODEL_RPM,
+                        help="Requests per minute for the text model (0 = unlimited)")
+    parser.add_argument("--image-rpm", type=int, default=settings.IMAGE_MODEL_RPM,
+                        help="Requests per minute for the image model (0 = unlimited)")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=settings.LLM_CACHE_ENABLED,
+                        help="Serve repeated model calls from the response cache (default: LLM_CACHE_ENABLED)")
+    parser.add_argument("--prompt-strategy", default=settings.IMAGE_PROMPT_STRATEGY,
+                        choices=["llm", "template", "cached", "combined"],
+                        help="How image prompts are built (default: IMAGE_PROMPT_STRATEGY or llm)")
+    parser.add_argument("--text-mode", default=settings.TEXT_GENERATION_MODE, choices=["multi", "single"],
+                        help="single = one structured text call per image (default: TEXT_GENERATION_MODE or multi)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Write all text in one batch job, then render images on a process pool")
+    parser.add_argument("--batch-backend", default="gemini", choices=["gemini", "fake"],
+                        help="Batch backend for --bulk; fake runs offline with canned text and placeholder images")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2,
+                        help="Render processes for --bulk (default: CPU count)")
+    parser.add_argument("--poll-seconds", type=float, default=30,
+                        help="Seconds between batch status checks for --bulk (default: 30)")
+    parser.add_argument("--format", default=settings.OUTPUT_FORMAT, choices=["png", "jpeg", "jpg", "webp"],
+                        help="Output image format (default: OUTPUT_FORMAT or png)")
+    parser.add_argument("--quality", type=int, default=settings.OUTPUT_QUALITY,
+                        help="Quality for jpeg/webp, upper bound when --max-bytes is set")
+    parser.add_argument("--max-bytes", type=int, default=settings.OUTPUT_MAX_BYTES,
+                        help="Target byte budget per image for jpeg/webp (0 = no target)")
+    parser.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=settings.DEDUP_ENABLED,
+                        help="Regenerate facts that repeat an earlier one (default: DEDUP_ENABLED)")
+    parser.add_argument("--image-dedup", action=argparse.BooleanOptionalAction, default=settings.IMAGE_DEDUP_ENABLED,
+                        help="Flag or reject images that look like an earlier one (default: IMAGE_DEDUP_ENABLED)")
+    parser.add_argument("--library", action=argparse.BooleanOptionalAction, default=settings.POST_LIBRARY_ENABLED,
+                        help="Record each image in the post library (default: POST_LIBRARY_ENABLED)")
+    parser.add_argument("--variants", type=lambda value: tuple(name.strip() for name in value.split(",") if name.strip()),
+                        default=settings.OUTPUT_VARIANTS,
+                        help=f"Extra placements saved next to each image, comma-separated from {', '.join(VARIANTS)} "
+                             f"(default: OUTPUT_VARIANTS)")
+    args = parser.parse_args()
+    unknown = [name for name in args.variants if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(unknown)}")
+    return args
+
 def main():
-    """Main function to generate 60 images"""
+    """Main function to generate --count images"""
+    args = parse_args()
+    encode_options = settings.encode_options()
+    encode_options.update(format=args.format, quality=args.quality, max_bytes=args.max_bytes or None)
+    
     # Check if another instance is running
     if check_if_running():
         print("❌ Another instance is already running. Exiting...")
@@ -183,6 +429,7 @@ def main():
         # Create captions file paths
         captions_file = os.path.join(images_dir, "instagram_captions.txt")  # Text file for backward compatibility
         json_file = os.path.join(images_dir, "instagram_captions.json")  # JSON file with structured data
+        manifest_file = os.path.join(images_dir, "manifest.jsonl")  # Append-only checkpoint log
         
         # Change to project root directory for relative paths
         os.chdir(project_root)
@@ -193,62 +440,119 @@ def main():
         print(f"📁 Images will be saved to: {os.path.abspath(images_dir)}")
         print(f"📝 Text captions will be saved to: {os.path.abspath(captions_file)}")
         print(f"📄 JSON data will be saved to: {os.path.abspath(json_file)}")
-        print(f"🎯 Generating 60 images...")
+        if args.bulk:
+            print(f"🎯 Generating {args.count} images in bulk ({args.batch_backend} batch, {args.processes} render processes)...")
+        else:
+            print(f"🎯 Generating {args.count} images ({args.concurrency} at a time)...")
+        print(f"🚦 Rate limits: text {args.text_rpm or 'unlimited'} rpm, image {args.image_rpm or 'unlimited'} rpm")
         print("="*60)
         
-        # Check if API key is set
+        # Check if API key is set (the offline fake backend does not need one)
         api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_key and not (args.bulk and args.batch_backend == "fake"):
             print("❌ ERROR: GEMINI_API_KEY not found in environment variables.")
             print("Please set GEMINI_API_KEY in your .env file")
             sys.exit(1)
         
-        # Initialize JSON data array
-        json_data = []
+        # Load the checkpoint; seed it from an existing JSON file on first use
+        manifest = Manifest(manifest_file)
+        if not os.path.exists(manifest_file):
+            imported = manifest.import_json(json_file)
+            if imported:
+                print(f"📥 Imported {imported} entries from {os.path.basename(json_file)}")
+        # Shared with the server: WAL mode lets both write while the API reads
+        library = PostLibrary(settings.POST_LIBRARY_PATH) if args.library else None
+        completed = manifest.completed()
+        pending = [i for i in range(args.count) if i + 1 not in completed]
+        print(f"⏭️  {args.count - len(pending)} of {args.count} images already done, {len(pending)} to generate")
         
-        # Initialize captions text file with header (for backward compatibility)
-        with open(captions_file, 'w', encoding='utf-8') as f:
-            f.write("="*80 + "\n")
-            f.write("INSTAGRAM CAPTIONS FOR GENERATED IMAGES\n")
-            f.write("="*80 + "\n")
-            f.write(f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total images: 60\n")
-            f.write("="*80 + "\n\n")
+        # Initialize captions text file with header (for backward compatibility); never truncate it
+        if not os.path.exists(captions_file):
+            with open(captions_file, 'w', encoding='utf-8') as f:
+                f.write("="*80 + "\n")
+                f.write("INSTAGRAM CAPTIONS FOR GENERATED IMAGES\n")
+                f.write("="*80 + "\n")
+                f.write(f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"Total images: {args.count}\n")
+                f.write("="*80 + "\n\n")
         
         # Initialize services once (reuse for all images)
         print("\nInitializing services...")
-        quote_service = QuoteService()
-        image_service = ImageService()
+        # One pooled client for all workers. Model calls share one limiter per model, so
+        # parallel workers back off together. Other failures are retried by the resilience layer;
+        # the cache sits outside both so hits cost no quota
+        limiter = RateLimiter({settings.TEXT_MODEL: args.text_rpm, settings.IMAGE_MODEL: args.image_rpm})
+        client = get_client()
+        if client is not None:
+            client = with_cache(with_resilience(RateLimitedClient(client, limiter)), args.cache)
+        # Facts are checked against every earlier post (the library and the manifest)
+        # (not for the fake backend: its canned text is the same sentence for every entity)
+        deduper = make_deduper(library, client, args.dedup and not (args.bulk and args.batch_backend == "fake"))
+        if deduper is not None:
+            seeded = deduper.load() if library is not None else 0
+            seeded += deduper.load(record.get("quote") for record in manifest.records())
+            print(f"♻️  Dedup index: {seeded} earlier facts")
+        quote_service = QuoteService(client, deduper)
+        # Images are checked the same way, by perceptual hash (IMAGE_DEDUP_ACTION: flag or reject);
+        # the fake backend's placeholder gradients all look alike, so it skips this too
+        image_deduper = make_image_deduper(library, args.image_dedup and not (args.bulk and args.batch_backend == "fake"))
+        if image_deduper is not None:
+            seeded = image_deduper.load() if library is not None else 0
+            seeded += image_deduper.load((portable_path(record.get("image_path_relative") or record.get("filename")),
+                                          record.get("image_hash")) for record in manifest.records())
+            print(f"🖼️  Image dedup index: {seeded} earlier images ({image_deduper.action} within {image_deduper.radius} bits)")
+        image_service = ImageService(client, prompt_strategy=args.prompt_strategy, image_deduper=image_deduper)
         text_overlay_service = TextOverlayService()
         print("Services initialized successfully\n")
         
-        successful = 0
-        failed = 0
+        write_lock = threading.Lock()
+        start_time = time.time()
         
-        # Generate 60 images
-        for i in range(60):
-            result = generate_and_save_image(i, 60, images_dir, captions_file, json_file, json_data, quote_service, image_service, text_overlay_service)
-            if result[0]:  # Check if successful
-                successful += 1
-                # json_data is modified in place, no need to update
-            else:
-                failed += 1
-            
-            # Add a small delay between requests to avoid rate limiting
-            if i < 59:  # Don't wait after the last image
-                print(f"\n⏳ Waiting 2 seconds before next generation...")
-                time.sleep(2)
+        def report(result, done, total):
+            ok = result.ok and result.value[0]
+            print(f"📊 {done}/{total} done ({'✅' if ok else '❌'} #{result.item + 1:03d} in {result.seconds:.1f}s)")
+        
+        if args.bulk:
+            successful = run_bulk(args, pending, images_dir, captions_file, manifest, quote_service, image_service, encode_options, library, image_deduper)
+        else:
+            engine = BatchEngine(args.concurrency)
+            results = engine.run(
+                pending,
+                lambda i: generate_and_save_image(i, args.count, images_dir, captions_file, manifest, quote_service, image_service, text_overlay_service, encode_options, write_lock, args.text_mode, args.variants, library),
+                on_result=report,
+            )
+            successful = sum(1 for result in results if result.ok and result.value[0])
+        failed = len(pending) - successful
+        total_time = time.time() - start_time
+        
+        # Fold duplicate lines away and refresh the JSON view, both atomically
+        total_entries = manifest.compact()
+        manifest.export_json(json_file)
         
         # Summary
         print("\n" + "="*60)
         print("📊 Generation Complete!")
         print("="*60)
-        print(f"✅ Successful: {successful}/60")
-        print(f"❌ Failed: {failed}/60")
+        print(f"✅ Successful: {successful}/{len(pending)}")
+        print(f"❌ Failed: {failed}/{len(pending)}")
+        print(f"⏱️  Total time: {int(total_time // 60)}m {int(total_time % 60)}s")
+        for model_limiter in limiter.limiters.values():
+            print(f"🚦 {model_limiter.model}: throttled {model_limiter.throttled} time(s)")
+        if deduper is not None:
+            print(f"♻️  Dedup: {deduper.duplicates} near-duplicate fact(s) caught in {deduper.checks} check(s)")
+        if image_deduper is not None:
+            print(f"🖼️  Image dedup: {image_deduper.duplicates} near-duplicate image(s) caught in "
+                  f"{image_deduper.checks} check(s) ({image_deduper.action})")
+        if args.cache:
+            cache = get_response_cache()
+            print(f"🗃️  Response cache: {cache.hits} hit(s), {cache.misses} miss(es)")
         print(f"📁 Images saved in: {os.path.abspath(images_dir)}")
         print(f"📝 Text captions saved in: {os.path.abspath(captions_file)}")
         print(f"📄 JSON data saved in: {os.path.abspath(json_file)}")
-        print(f"📊 Total entries in JSON: {len(json_data)}")
+        print(f"🧾 Manifest: {os.path.abspath(manifest_file)}")
+        if library is not None:
+            print(f"📚 Post library: {library.path} ({library.count()} posts)")
+        print(f"📊 Total entries in JSON: {total_entries}")
         print("="*60)
     
     finally:
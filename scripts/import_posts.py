@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Load the existing post records (manifest.jsonl, instagram_captions.json and the legacy
+instagram_captions.txt) into the post library. Safe to rerun: posts are keyed by image number.
+Usage: python scripts/import_posts.py [--images-dir DIR] [--library PATH] [--dry-run]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import re
+import time
+from services.manifest import Manifest
+from services.post_library import PostLibrary, record_to_post, file_hash
+from config import settings
+
+# One block of instagram_captions.txt, as written by generate_images.py
+TEXT_BLOCK = re.compile(
+    r"^Image #(\d+)\n"
+    r"Filename: ([^\n]*)\n"
+    r"Entity: ([^\n]*)\n"
+    r"Quote: (.*?)\n"
+    r"-{10,}\n"
+    r"Instagram Caption:\n(.*?)\n"
+    r"={10,}$",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+def parse_captions_text(text):
+    """Records (image number -> dict) from the legacy captions text file"""
+    records = {}
+    for match in TEXT_BLOCK.finditer(text):
+        number, filename, entity, quote, caption = match.groups()
+        records[int(number)] = {
+            "image_number": int(number),
+            "filename": filename.strip(),
+            "entity": entity.strip(),
+            "quote": quote.strip(),
+            "instagram_caption": caption.strip(),
+        }
+    return records
+
+
+def load_sources(images_dir):
+    """Every known record by image number; the manifest beats the JSON file, which beats the text file"""
+    sources = []
+    txt_file = os.path.join(images_dir, "instagram_captions.txt")
+    if os.path.exists(txt_file):
+        with open(txt_file, "r", encoding="utf-8") as f:
+            sources.append(("instagram_captions.txt", parse_captions_text(f.read())))
+    json_file = os.path.join(images_dir, "instagram_captions.json")
+    if os.path.exists(json_file):
+        with open(json_file, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        sources.append(("instagram_captions.json", {entry["image_number"]: entry for entry in entries
+                                                    if entry.get("image_number") is not None}))
+    manifest_file = os.path.join(images_dir, "manifest.jsonl")
+    if os.path.exists(manifest_file):
+        sources.append(("manifest.jsonl", Manifest(manifest_file).load()))
+
+    merged = {}
+    for name, records in sources:
+        print(f"📄 {name}: {len(records)} record(s)")
+        for number, record in records.items():
+            # Later sources win field by field; empty values never erase known ones
+            merged.setdefault(number, {}).update({key: value for key, value in record.items() if value})
+    return merged
+
+
+def main():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Import existing post records into the post library")
+    parser.add_argument("--images-dir", default=os.path.join(project_root, "images"), help="Directory with the records and images")
+    parser.add_argument("--library", default=settings.POST_LIBRARY_PATH, help="Post library database (default: POST_LIBRARY_PATH)")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and report without writing")
+    args = parser.parse_args()
+
+    images_dir = os.path.abspath(args.images_dir)
+    if not os.path.isdir(images_dir):
+        print(f"❌ Images directory not found: {images_dir}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    records = load_sources(images_dir)
+    posts, missing_files = [], 0
+    for number, record in sorted(records.items()):
+        if not record.get("quote"):
+            continue
+        post = record_to_post(record, project_root, source="import")
+        path = os.path.join(images_dir, record["filename"]) if record.get("filename") else None
+        if path and os.path.exists(path):
+            post["content_hash"] = file_hash(path)
+        else:
+            missing_files += 1
+        posts.append(post)
+    print(f"🧾 {len(posts)} post(s) to import ({missing_files} without an image file on disk)")
+
+    if args.dry_run:
+        print("Dry run, nothing written")
+        return
+    library = PostLibrary(args.library)
+    before = library.count()
+    library.add_many(posts)
+    after = library.count()
+    library.close()
+    print(f"✅ {args.library}: {before} posts before, {after} after ({after - before} new) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
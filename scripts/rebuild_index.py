@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Rebuild images/manifest.jsonl and instagram_captions.json from the metadata embedded
+in the image files. Only header chunks are read; no image is decoded.
+Usage: python scripts/rebuild_index.py [--images-dir DIR] [--workers N] [--replace] [--dry-run]
+"""
+import sys
+import os
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+# Add parent directory to path to import services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+from services.image_metadata import scan_directory
+from services.caption_backfill import parse_image_filename
+from services.manifest import Manifest, atomic_write
+
+
+def record_from_metadata(filename, post, images_dir, project_root):
+    """Manifest entry (legacy instagram_captions.json layout) for one image's embedded post"""
+    image_path = os.path.join(images_dir, filename)
+    record = {
+        "image_number": post.get("image_number") or parse_image_filename(filename)[0],
+        "filename": filename,
+        "image_path": image_path,
+        "image_path_relative": os.path.relpath(image_path, project_root),
+        "entity": post.get("entity"),
+        "quote": post.get("quote"),
+        "instagram_caption": post.get("caption"),
+        "image_prompt": post.get("image_prompt"),
+        "progression_text": post.get("progression_text"),
+        "generated_at": post.get("generated_at"),
+    }
+    return {key: value for key, value in record.items() if value is not None}
+
+
+def main():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Rebuild the image manifest from embedded metadata")
+    parser.add_argument("--images-dir", default=os.path.join(project_root, "images"), help="Directory to scan")
+    parser.add_argument("--workers", type=int, default=8, help="Files read in parallel")
+    parser.add_argument("--replace", action="store_true",
+                        help="Drop manifest entries with no matching image metadata (default: keep them)")
+    parser.add_argument("--dry-run", action="store_true", help="Scan and report without writing")
+    args = parser.parse_args()
+
+    images_dir = os.path.abspath(args.images_dir)
+    if not os.path.isdir(images_dir):
+        print(f"❌ Images directory not found: {images_dir}")
+        sys.exit(1)
+    manifest_file = os.path.join(images_dir, "manifest.jsonl")
+    json_file = os.path.join(images_dir, "instagram_captions.json")
+
+    start = time.perf_counter()
+    posts = scan_directory(images_dir, workers=args.workers)
+    scan_seconds = time.perf_counter() - start
+    image_count = sum(1 for name in os.listdir(images_dir) if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    print(f"🔎 Scanned {image_count} images in {scan_seconds * 1000:.0f} ms, {len(posts)} with embedded metadata")
+
+    # Main images first, then attach each variant file to its image's entry
+    scanned, variants, skipped = {}, [], 0
+    for filename, post in posts.items():
+        if post.get("variant"):
+            variants.append((filename, post))
+            continue
+        record = record_from_metadata(filename, post, images_dir, project_root)
+        if record.get("image_number") is None:
+            skipped += 1
+            continue
+        scanned[record["image_number"]] = record
+    for filename, post in variants:
+        record = scanned.get(post.get("image_number"))
+        if record is not None:
+            record.setdefault("variants", {})[post["variant"]] = os.path.join(images_dir, filename)
+    if skipped:
+        print(f"⚠️  {skipped} image(s) have metadata but no image number, skipped")
+
+    manifest = Manifest(manifest_file)
+    existing = manifest.load()
+    merged = {} if args.replace else dict(existing)
+    for number, record in scanned.items():
+        # Metadata wins; fields it does not carry (e.g. a backfilled caption) are kept
+        merged[number] = {**existing.get(number, {}), **record}
+    added = sum(1 for number in scanned if number not in existing)
+    dropped = len(existing) - sum(1 for number in existing if number in merged)
+    print(f"🧾 Manifest: {len(existing)} entries before, {len(merged)} after "
+          f"({added} added, {len(scanned) - added} refreshed, {dropped} dropped)")
+
+    if args.dry_run:
+        print("Dry run, nothing written")
+        return
+    records = [record for _, record in sorted(merged.items())]
+    atomic_write(manifest_file, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8"))
+    manifest.export_json(json_file)
+    print(f"✅ Wrote {manifest_file} and {json_file} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Batch Backends
+Submit many text-model requests as one asynchronous batch job and collect the results:
+the Gemini Batch API for real runs and an in-memory fake for offline runs and tests.
+"""
+import time
+import uuid
+from services.resilience import RetryPolicy, is_retryable
+
+# Terminal batch job states
+STATE_SUCCEEDED = "succeeded"
+STATE_FAILED = "failed"
+STATE_RUNNING = "running"
+
+
+class BatchRequest:
+    """One generate_content request in a batch, identified by ``key``"""
+
+    def __init__(self, key: str, contents, config=None):
+        self.key = key
+        self.contents = contents
+        self.config = config
+
+
+class BatchJobError(Exception):
+    """Raised when a batch job fails, is cancelled, expires or times out"""
+
+
+class BatchBackend:
+    """
+    Interface of a batch backend.
+
+    Subclasses implement submit(), state() and results(); run() ties them
+    together by submitting, polling until the job is finished and returning
+    ``{key: text}`` with an Exception instead of text for failed items.
+
+    The job keeps running server-side whatever happens to the poller, so a
+    transient error while polling (5xx, timeout, 429) is retried with
+    ``poll_retry`` backoff rather than abandoning the job.
+    """
+
+    poll_retry = RetryPolicy(max_attempts=8, base_delay=2.0, max_delay=60.0)
+
+    def submit(self, model: str, requests: list) -> str:
+        """Submits the requests and returns a job id"""
+        raise NotImplementedError
+
+    def state(self, job_id: str) -> str:
+        """STATE_RUNNING, STATE_SUCCEEDED or STATE_FAILED"""
+        raise NotImplementedError
+
+    def results(self, job_id: str) -> dict:
+        """``{key: text or Exception}`` for a succeeded job"""
+        raise NotImplementedError
+
+    def run(self, model: str, requests: list, poll_seconds: float = 30.0, timeout_seconds: float = 24 * 3600) -> dict:
+        """
+        Submits a batch and waits for its results.
+
+        Args:
+            model: Model for every request
+            requests: List of BatchRequest with unique keys
+            poll_seconds: Wait between status checks
+            timeout_seconds: Give up after this long
+
+        Returns:
+            Dict of key -> response text, or the Exception for items that failed
+
+        Raises:
+            BatchJobError: If the job as a whole failed or timed out
+        """
+        if not requests:
+            return {}
+        job_id = self.submit(model, requests)
+        # The name is what a crashed run needs to fetch the results later
+        print(f"📦 Submitted batch {job_id} with {len(requests)} request(s) to {model}", flush=True)
+        start = time.monotonic()
+        while True:
+            state = self._poll(self.state, job_id)
+            if state == STATE_SUCCEEDED:
+                break
+            if state == STATE_FAILED:
+                raise BatchJobError(f"Batch {job_id} did not succeed")
+            if time.monotonic() - start > timeout_seconds:
+                raise BatchJobError(f"Batch {job_id} still running after {timeout_seconds:.0f}s")
+            print(f"⏳ Batch {job_id} running ({time.monotonic() - start:.0f}s)...")
+            time.sleep(poll_seconds)
+        results = self._poll(self.results, job_id)
+        print(f"✅ Batch {job_id} finished in {time.monotonic() - start:.0f}s")
+        return results
+
+    def _poll(self, func, job_id: str):
+        """``func(job_id)``, retrying transient errors"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(job_id)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.poll_retry.max_attempts:
+                    raise BatchJobError(f"Could not poll batch {job_id} ({e}); "
+                                        f"the job may still be running server-side") from e
+                delay = self.poll_retry.delay(attempt, e)
+                print(f"⚠️  Polling batch {job_id} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+class GeminiBatchBackend(BatchBackend):
+    """Gemini Batch API with inlined requests (billed at the batch discount)"""
+
+    _SUCCEEDED = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+    _FAILED = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+    def __init__(self, client, display_name: str = "instaauto-bulk"):
+        self.client = client
+        self.display_name = display_name
+        self._keys = {}
+
+    def submit(self, model: str, requests: list) -> str:
+        inlined = []
+        for request in requests:
+            item = {"contents": request.contents, "metadata": {"key": request.key}}
+            if request.config is not None:
+                item["config"] = request.config
+            inlined.append(item)
+        job = self.client.batches.create(model=model, src=inlined, config={"display_name": self.display_name})
+        # Responses come back in request order; keep the keys in case metadata is dropped
+        self._keys[job.name] = [request.key for request in requests]
+        return job.name
+
+    def state(self, job_id: str) -> str:
+        job = self.client.batches.get(name=job_id)
+        name = getattr(job.state, "name", str(job.state))
+        if name in self._SUCCEEDED:
+            return STATE_SUCCEEDED
+        if name in self._FAILED:
+            return STATE_FAILED
+        return STATE_RUNNING
+
+    def results(self, job_id: str) -> dict:
+        job = self.client.batches.get(name=job_id)
+        responses = (job.dest.inlined_responses if job.dest else None) or []
+        keys = self._keys.get(job_id, [])
+        results = {}
+        for position, item in enumerate(responses):
+            key = (item.metadata or {}).get("key") or (keys[position] if position < len(keys) else str(position))
+            if item.error is not None or item.response is None:
+                results[key] = BatchJobError(f"{key}: {item.error}")
+            else:
+                results[key] = item.response.text
+        return results
+
+
+class FakeBatchBackend(BatchBackend):
+    """
+    In-memory backend for offline runs and tests: every job reports running for
+    ``polls_until_done`` checks, then answers each request with ``responder``.
+
+    Args:
+        responder: Callable ``responder(model, request)`` returning the response
+            text (or raising to fail that item)
+        polls_until_done: Number of "running" states before the job succeeds
+    """
+
+    def __init__(self, responder, polls_until_done: int = 1):
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self._jobs = {}
+
+    def submit(self, model: str, requests: list) -> str:
+        job_id = f"fake-batch-{uuid.uuid4().hex[:8]}"
+        self._jobs[job_id] = {"model": model, "requests": list(requests), "polls": 0}
+        return job_id
+
+    def state(self, job_id: str) -> str:
+        job = self._jobs[job_id]
+        job["polls"] += 1
+        return STATE_SUCCEEDED if job["polls"] > self.polls_until_done else STATE_RUNNING
+
+    def results(self, job_id: str) -> dict:
+        job = self._jobs[job_id]
+        results = {}
+        for request in job["requests"]:
+            try:
+                results[request.key] = self.responder(job["model"], request)
+            except Exception as e:
+                results[request.key] = e
+        return results
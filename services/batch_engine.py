@@ -0,0 +1,67 @@
+"""
+Batch Engine
+Runs independent generation tasks concurrently on a bounded thread pool.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class BatchResult:
+    """Outcome of one batch item"""
+
+    def __init__(self, item, value=None, error: Exception = None, seconds: float = 0.0):
+        self.item = item
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchEngine:
+    """
+    Runs ``func(item)`` for every item with at most ``concurrency`` in flight.
+
+    Model calls inside ``func`` are expected to go through a RateLimitedClient,
+    so throughput is bounded by the per-model quotas rather than fixed sleeps.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = max(1, concurrency)
+        self._lock = threading.Lock()
+
+    def run(self, items, func, on_result=None):
+        """
+        Processes all items and returns their BatchResults in completion order.
+
+        Args:
+            items: Iterable of work items
+            func: Callable taking one item; its return value becomes BatchResult.value
+            on_result: Optional callback ``on_result(result, done, total)``, called
+                under a lock so it may update shared state or print progress
+
+        Returns:
+            List of BatchResult
+        """
+        items = list(items)
+        results = []
+
+        def timed(item):
+            start = time.perf_counter()
+            try:
+                return BatchResult(item, func(item), seconds=time.perf_counter() - start)
+            except Exception as e:
+                return BatchResult(item, error=e, seconds=time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(timed, item) for item in items]
+            for future in as_completed(futures):
+                result = future.result()
+                with self._lock:
+                    results.append(result)
+                    if on_result is not None:
+                        on_result(result, len(results), len(items))
+        return results
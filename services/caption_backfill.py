@@ -0,0 +1,204 @@
+"""
+Caption Backfill
+Finds generated images without a caption, recovers the quote each one was rendered
+with (manifest first, then embedded metadata) and writes only the missing captions.
+"""
+import os
+import re
+import threading
+import time
+from config.framing import VARIANTS
+from services.batch_engine import BatchEngine
+from services.image_metadata import read_metadata
+from services.post_library import record_to_post
+
+# image_001_Entity_quote_snippet.png (or .jpg / .webp); variant files carry a suffix
+IMAGE_NAME = re.compile(r"image_(\d+)_(.+?)_(.+)\.(?:png|jpg|webp)$")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".webp")
+
+
+def is_variant_file(filename: str, names) -> bool:
+    """
+    True for the extra placements written next to an image (see --variants).
+
+    A ``_story`` / ``_thumbnail`` / ... suffix alone is not enough (a quote
+    snippet can end that way); the image it belongs to, ``{base}.{ext}``,
+    must also be among ``names`` (the files in the same directory).
+    """
+    stem, ext = os.path.splitext(filename)
+    return any(stem.endswith(f"_{name}") and f"{stem[:-len(name) - 1]}{ext}" in names for name in VARIANTS)
+
+
+def parse_image_filename(filename: str):
+    """(image number, entity, quote snippet) from a generated image's name, or (None, None, None)"""
+    match = IMAGE_NAME.match(filename)
+    if match:
+        return int(match.group(1)), match.group(2), match.group(3)
+    return None, None, None
+
+
+class ManifestIndex:
+    """Manifest records looked up by file name, or by image number when the name agrees"""
+
+    def __init__(self, records):
+        self.by_number = {}
+        self.by_filename = {}
+        for record in records:
+            if record.get("image_number") is not None:
+                self.by_number[record["image_number"]] = record
+            if record.get("filename"):
+                self.by_filename[record["filename"]] = record
+
+    def find(self, image_number: int, filename: str):
+        record = self.by_filename.get(filename)
+        if record is not None:
+            return record
+        record = self.by_number.get(image_number)
+        # A record under the same number but for another file describes a different image
+        if record is not None and record.get("filename") in (None, "", filename):
+            return record
+        return None
+
+
+class BackfillItem:
+    """One image that needs a caption, with the quote it was rendered with"""
+
+    def __init__(self, image_number: int, filename: str, path: str, entity: str, quote: str,
+                 caption: str = None, record: dict = None, source: str = "manifest"):
+        self.image_number = image_number
+        self.filename = filename
+        self.path = path
+        self.entity = entity
+        self.quote = quote
+        # Set when the embedded metadata already has the caption (no model call needed)
+        self.caption = caption
+        self.record = record or {}
+        self.source = source
+
+
+class BackfillPlan:
+    """
+    What a backfill run has to do.
+
+    Attributes:
+        todo: BackfillItems missing a caption
+        captioned: Number of images that already have one
+        unresolved: File names whose quote could not be recovered
+        conflicts: (file name, manifest file name) pairs whose image number is
+            already recorded for another file; skipped, since recording them
+            would overwrite that entry
+    """
+
+    def __init__(self):
+        self.todo = []
+        self.captioned = 0
+        self.unresolved = []
+        self.conflicts = []
+
+
+class CaptionBackfill:
+    """
+    Writes captions for existing images that lack one.
+
+    The quote comes from the manifest or from the image's embedded metadata, so
+    the caption matches the text burned into the image; no quote is ever
+    regenerated. Only the caption calls hit the model, ``concurrency`` at a
+    time; pass a QuoteService whose client is a RateLimitedClient to stay
+    within the per-minute budget. With a PostLibrary, each new caption is
+    also written to the library entry for that image.
+    """
+
+    def __init__(self, quote_service, manifest, captions_file: str = None, concurrency: int = 4, library=None):
+        self.quote_service = quote_service
+        self.manifest = manifest
+        self.captions_file = captions_file
+        self.library = library
+        self.engine = BatchEngine(concurrency)
+        self._write_lock = threading.Lock()
+
+    def plan(self, images_dir: str, image_files=None) -> BackfillPlan:
+        """
+        Matches every generated image against the manifest and its metadata.
+
+        Args:
+            images_dir: Directory with the generated images
+            image_files: File names to consider (default: every image_* file in the directory)
+        """
+        if image_files is None:
+            names = set(os.listdir(images_dir))
+            image_files = sorted(name for name in names
+                                 if name.startswith("image_") and name.endswith(IMAGE_EXTENSIONS)
+                                 and not is_variant_file(name, names))
+        index = ManifestIndex(self.manifest.records())
+        plan = BackfillPlan()
+        for filename in image_files:
+            image_number, entity, _ = parse_image_filename(filename)
+            if image_number is None:
+                continue
+            record = index.find(image_number, filename)
+            if record is None and image_number in index.by_number:
+                # The manifest is keyed by image number: recording this file would replace the other one
+                plan.conflicts.append((filename, index.by_number[image_number].get("filename")))
+                continue
+            if record is not None and record.get("instagram_caption"):
+                plan.captioned += 1
+                continue
+
+            path = os.path.join(images_dir, filename)
+            quote, caption, source = (record or {}).get("quote"), None, "manifest"
+            if not quote:
+                # Only open the file when the manifest cannot answer
+                metadata = read_metadata(path)
+                quote, caption, source = metadata.get("quote"), metadata.get("caption"), "metadata"
+                entity = metadata.get("entity") or entity
+            if not quote:
+                plan.unresolved.append(filename)
+                continue
+            plan.todo.append(BackfillItem(image_number, filename, path, (record or {}).get("entity") or entity,
+                                          quote, caption, record, source))
+        return plan
+
+    def run(self, plan: BackfillPlan, on_result=None) -> list:
+        """
+        Captions every item in the plan and records it in the manifest (and the
+        legacy captions text file). Failed items are not recorded, so a later
+        run retries them.
+
+        Args:
+            plan: Result of plan()
+            on_result: Optional BatchEngine callback ``on_result(result, done, total)``
+
+        Returns:
+            List of BatchResult; ``value`` is the recorded manifest entry
+        """
+        return self.engine.run(plan.todo, self._caption_item, on_result=on_result)
+
+    def _caption_item(self, item: BackfillItem) -> dict:
+        caption = item.caption or self.quote_service.generate_caption(item.quote, fallback=False)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        record = dict(item.record)
+        record.update({
+            "image_number": item.image_number,
+            "filename": item.filename,
+            "image_path": item.path,
+            "image_path_relative": os.path.relpath(item.path, project_root),
+            "entity": item.entity,
+            "quote": item.quote,
+            "instagram_caption": caption,
+        })
+        record.setdefault("generated_at", time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.manifest.append(record)
+        if self.library is not None:
+            self.library.add(record_to_post(record, project_root))
+        if self.captions_file:
+            with self._write_lock:
+                with open(self.captions_file, 'a', encoding='utf-8') as f:
+                    f.write(f"\n{'='*80}\n")
+                    f.write(f"Image #{item.image_number:03d}\n")
+                    f.write(f"Filename: {item.filename}\n")
+                    f.write(f"Entity: {item.entity}\n")
+                    f.write(f"Quote: {item.quote}\n")
+                    f.write(f"{'-'*80}\n")
+                    f.write(f"Instagram Caption:\n{caption}\n")
+                    f.write(f"{'='*80}\n")
+        return record
@@ -0,0 +1,100 @@
+"""
+Gemini Client Factory
+One process-wide genai.Client with a tuned, shared keep-alive connection pool.
+"""
+import os
+import threading
+import httpx
+from google import genai
+from google.genai import types
+from config import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _pool_args() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "http2": settings.GEMINI_HTTP2 and http2_available(),
+    }
+
+
+def create_client(api_key: str = None):
+    """
+    Builds a new genai.Client with the pool settings from config.settings.
+
+    Both the sync client and its async twin (``client.aio``) get their own
+    httpx pool with the same limits; connections are kept alive and reused
+    across calls, so TLS handshakes happen once per connection, not per call.
+
+    Returns:
+        genai.Client, or None if no API key is configured
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    http_options = types.HttpOptions(
+        timeout=settings.GEMINI_TIMEOUT_SECONDS * 1000,
+        client_args=_pool_args(),
+        async_client_args=_pool_args(),
+    )
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def get_client():
+    """Returns the shared genai.Client (created on first use), or None without an API key"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = create_client()
+            except Exception as e:
+                print(f"ERROR: Failed to initialize Gemini client: {e}")
+                return None
+            if _client is not None:
+                pool = _pool_args()
+                print(f"OK: Gemini client ready (max {settings.GEMINI_MAX_CONNECTIONS} connections, "
+                      f"http2={'on' if pool['http2'] else 'off'})")
+        return _client
+
+
+def get_async_client():
+    """Async variant of get_client: the shared client's ``.aio`` interface"""
+    client = get_client()
+    return client.aio if client is not None else None
+
+
+def close_client():
+    """Closes the shared client's sync connection pool (call on shutdown)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception as e:
+                print(f"Warning: error closing Gemini client: {e}")
+            _client = None
+
+
+async def aclose_client():
+    """Closes both the async and the sync connection pools of the shared client"""
+    if _client is not None:
+        try:
+            await _client.aio.aclose()
+        except Exception as e:
+            print(f"Warning: error closing async Gemini client: {e}")
+    close_client()
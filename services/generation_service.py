@@ -0,0 +1,332 @@
+"""
+Generation Service
+Runs the full quote -> caption / image -> overlay -> encode pipeline asynchronously.
+"""
+import asyncio
+import logging
+import time
+from fastapi.concurrency import run_in_threadpool
+from config import settings
+from services.image_metadata import variant_metadata
+from services.text_overlay_service import output_ext
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages, in the order the image path goes through them
+STAGE_QUOTE = "quote"
+STAGE_CAPTION = "caption"
+STAGE_IMAGE_PROMPT = "image_prompt"
+STAGE_IMAGE = "image"
+STAGE_OVERLAY = "overlay"
+STAGE_ENCODE = "encode"
+STAGES = [STAGE_QUOTE, STAGE_CAPTION, STAGE_IMAGE_PROMPT, STAGE_IMAGE, STAGE_OVERLAY, STAGE_ENCODE]
+
+ERROR_IMAGE_URL = "https://placehold.co/600x400?text=Error+Generating+Image"
+
+
+class GenerationService:
+    """Service that chains the quote, image and overlay services for one post"""
+
+    def __init__(self, quote_service, image_service, text_overlay_service, image_store, encode_options=None,
+                 text_mode: str = "multi", render_pool=None, variants=(), post_library=None):
+        self.quote_service = quote_service
+        self.image_service = image_service
+        self.text_overlay_service = text_overlay_service
+        self.image_store = image_store
+        self.encode_options = encode_options or {}
+        # "single": one structured call writes quote, caption and image prompt
+        self.text_mode = text_mode
+        # Optional RenderPool: overlay + encode in worker processes instead of the threadpool
+        self.render_pool = render_pool
+        # Extra placements (config/framing.py VARIANTS) rendered from each generated image
+        self.variants = tuple(variants)
+        # Optional PostLibrary every finished post is recorded in
+        self.post_library = post_library
+        # Pipelines currently running (the warm pool only refills when this is idle)
+        self.in_flight = 0
+
+    def save_image(self, image, metadata: dict = None) -> str:
+        """
+        Encodes the final image straight into the store and returns its URL.
+        ``metadata`` (entity, quote, ...) is embedded in the file.
+        """
+        ext = output_ext(self.encode_options.get("format", "png"))
+        with self.image_store.writer(ext) as out:
+            encoded = self.text_overlay_service.encode_to(image, out, metadata=metadata, **self.encode_options)
+        self._log_encoded(encoded)
+        return f"/images/{out.key}"
+
+    def overlay(self, image, quote: str):
+        """
+        Renders the configured variants from the clean image, then draws the
+        quote on ``image`` itself (in place; it is ours alone).
+
+        Returns:
+            (final image, {variant name: PIL Image})
+        """
+        variant_images = self.text_overlay_service.render_variants(image, quote, self.variants) if self.variants else {}
+        return self.text_overlay_service.overlay_text(image, quote, in_place=True), variant_images
+
+    def save_variants(self, variant_images: dict, metadata: dict = None) -> dict:
+        """Encodes and stores each variant; returns {variant name: URL}"""
+        return {name: self.save_image(image, variant_metadata(metadata, name)) for name, image in variant_images.items()}
+
+    def store_encoded(self, encoded) -> str:
+        """Stores an EncodedImage and returns its URL"""
+        self._log_encoded(encoded)
+        key = self.image_store.put(encoded.data, encoded.ext)
+        return f"/images/{key}"
+
+    def store_encoded_variants(self, encoded_variants: dict) -> dict:
+        """Stores each encoded variant; returns {variant name: URL}"""
+        return {name: self.store_encoded(item) for name, item in encoded_variants.items()}
+
+    @staticmethod
+    def _log_encoded(encoded):
+        logger.info(
+            f"Encoded {encoded.format} (quality={encoded.quality}): {encoded.size} bytes "
+            f"in {encoded.encode_seconds * 1000:.0f} ms ({encoded.attempts} attempt(s))"
+        )
+
+    async def generate(self, prompt: str, description: str = "", on_progress=None, on_caption_delta=None) -> dict:
+        """
+        Generates a quote, caption and final image for a prompt.
+
+        The quote comes first; the caption and the image path (prompt, image,
+        overlay, encode) then run concurrently. Blocking SDK and Pillow calls run
+        in the threadpool so the event loop stays free.
+
+        Args:
+            prompt: Entity to generate a fact about, or "random"
+            description: Optional extra context for the quote
+            on_progress: Optional callback ``on_progress(stage, status, value)``
+                called with status "started" and then "done" for every stage
+            on_caption_delta: Optional callback ``on_caption_delta(text)``; when
+                given, the caption is streamed and each chunk is passed to it
+                (always called on the event loop thread)
+
+        Returns:
+            Dict with "quote", "caption", "image_prompt", "progression_text"
+            (single text mode only), "image_url", "variants" ({name: URL}, empty
+            unless variants are configured) and "image_error" (None unless the
+            image path failed)
+
+        Raises:
+            Exception: If the quote or caption step fails
+        """
+        result = {"quote": None, "caption": None, "image_prompt": None, "progression_text": None,
+                  "image_url": None, "variants": {}, "image_error": None, "image_hash": None, "near_duplicate_of": None}
+        self.in_flight += 1
+        try:
+            await self._generate(result, prompt, description, on_progress, on_caption_delta)
+        except BaseException:
+            # The quote (and a screened image) were claimed by the dedupers but never became a post
+            self.quote_service.release_quote(result["quote"])
+            if result["image_url"] is None:
+                self._release_image_hash(result)
+            raise
+        finally:
+            self.in_flight -= 1
+        return result
+
+    async def _generate(self, result: dict, prompt: str, description: str, on_progress, on_caption_delta):
+        def report(stage, status, value=None):
+            if on_progress is not None:
+                on_progress(stage, status, value)
+
+        async def run_stage(stage, func, *args):
+            report(stage, "started")
+            value = await run_in_threadpool(func, *args)
+            report(stage, "done", value if isinstance(value, str) else None)
+            return value
+
+        entity = self.quote_service.resolve_entity(prompt)
+
+        # Single text mode: one structured call replaces the quote, caption and image
+        # prompt calls; if it fails, the separate calls below run instead
+        if self.text_mode == "single":
+            report(STAGE_QUOTE, "started")
+            post = await run_in_threadpool(self.quote_service.generate_post, entity, description)
+            if post is not None:
+                result["quote"], result["progression_text"] = post["quote"], post["progression_text"]
+                report(STAGE_QUOTE, "done", result["quote"])
+                report(STAGE_CAPTION, "started")
+                result["caption"] = post["caption"]
+                report(STAGE_CAPTION, "done", result["caption"])
+                logger.info(f"Generated post content in one call: {result['quote']}")
+                await self._image_path(result, run_stage, report, entity, post["image_prompt"])
+                await self._record_post(result, entity)
+                return
+
+        # 1. Generate Quote (everything else depends on it). In "combined" prompt mode
+        # the same call also returns the image prompt, saving a serial text call
+        image_prompt = None
+        if self.image_service.prompt_strategy == "combined":
+            report(STAGE_QUOTE, "started")
+            combined = await run_in_threadpool(self.quote_service.generate_quote_with_image_prompt, entity, description)
+            result["quote"], image_prompt = combined["quote"], combined["image_prompt"]
+            report(STAGE_QUOTE, "done", result["quote"])
+        else:
+            result["quote"] = await run_stage(STAGE_QUOTE, self.quote_service.generate_quote, entity, description)
+        logger.info(f"Generated quote: {result['quote']}")
+
+        # 2. Caption and image only need the quote, so both start together
+        async def caption_path():
+            if on_caption_delta is None:
+                result["caption"] = await run_stage(STAGE_CAPTION, self.quote_service.generate_caption, result["quote"])
+            else:
+                report(STAGE_CAPTION, "started")
+                caption = await run_in_threadpool(self._stream_caption, result["quote"], on_caption_delta, asyncio.get_running_loop())
+                result["caption"] = caption.strip()
+                report(STAGE_CAPTION, "done", result["caption"])
+            logger.info("Generated caption")
+
+        await asyncio.gather(caption_path(), self._image_path(result, run_stage, report, entity, image_prompt))
+        await self._record_post(result, entity)
+
+    async def _record_post(self, result: dict, entity: str):
+        """
+        Adds a finished post to the library, then stores its quote in the
+        deduper (a failed image releases the quote instead); neither error
+        fails the request
+        """
+        if result["image_error"]:
+            self.quote_service.release_quote(result["quote"])
+            return
+        if self.post_library is not None:
+            key = result["image_url"].rsplit("/", 1)[-1]
+            post = {
+                "entity": entity,
+                "quote": result["quote"],
+                "caption": result["caption"],
+                "image_prompt": result["image_prompt"],
+                "progression_text": result["progression_text"],
+                "image_url": result["image_url"],
+                # Store keys are content hashes
+                "content_hash": key.split(".")[0],
+                "image_hash": result["image_hash"],
+                "variants": result["variants"],
+                "source": "server",
+            }
+            try:
+                await run_in_threadpool(self.post_library.add, post)
+            except Exception as e:
+                logger.warning(f"Could not record post in the library: {e}")
+        try:
+            await run_in_threadpool(self.quote_service.keep_quote, result["quote"], result["caption"])
+        except Exception as e:
+            logger.warning(f"Could not store quote in the dedup index: {e}")
+
+    def _stream_caption(self, quote: str, on_caption_delta, loop) -> str:
+        """Consumes the caption stream in a worker thread, forwarding chunks to the loop"""
+        chunks = []
+        for chunk in self.quote_service.stream_caption(quote):
+            chunks.append(chunk)
+            loop.call_soon_threadsafe(on_caption_delta, chunk)
+        return "".join(chunks)
+
+    async def stream(self, prompt: str, description: str = ""):
+        """
+        Runs the pipeline and yields ``(event, data)`` tuples as artifacts appear.
+
+        Events: "stage" (progress), "quote", "caption_delta" (streamed caption
+        chunk), "caption", "image_prompt", "image", then either "done" with the
+        full result or "error".
+        """
+        events = asyncio.Queue()
+
+        def on_progress(stage, status, value=None):
+            events.put_nowait(("stage", {"stage": stage, "status": status}))
+            if status == "done" and value is not None:
+                if stage == STAGE_QUOTE:
+                    events.put_nowait(("quote", {"quote": value}))
+                elif stage == STAGE_CAPTION:
+                    events.put_nowait(("caption", {"caption": value}))
+                elif stage == STAGE_IMAGE_PROMPT:
+                    events.put_nowait(("image_prompt", {"image_prompt": value}))
+                elif stage == STAGE_ENCODE:
+                    events.put_nowait(("image", {"image_url": value}))
+
+        def on_caption_delta(text):
+            events.put_nowait(("caption_delta", {"text": text}))
+
+        async def run():
+            try:
+                result = await self.generate(prompt, description, on_progress=on_progress, on_caption_delta=on_caption_delta)
+                if result["image_error"]:
+                    events.put_nowait(("image", {"image_url": result["image_url"]}))
+                events.put_nowait(("done", result))
+            except Exception as e:
+                logger.error(f"Error streaming generation: {e}")
+                events.put_nowait(("error", {"detail": str(e)}))
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await events.get()
+                yield event, data
+                if event in ("done", "error"):
+                    break
+        finally:
+            # Client went away before the pipeline finished
+            if not task.done():
+                task.cancel()
+
+    async def _image_path(self, result: dict, run_stage, report, entity: str, image_prompt: str = None):
+        """Runs prompt -> image -> overlay -> encode, recording a placeholder on failure"""
+        quote = result["quote"]
+        try:
+            if image_prompt is None:
+                image_prompt = await run_stage(STAGE_IMAGE_PROMPT, self.image_service.generate_image_prompt, quote, entity)
+            else:
+                report(STAGE_IMAGE_PROMPT, "started")
+                report(STAGE_IMAGE_PROMPT, "done", image_prompt)
+            result["image_prompt"] = image_prompt
+            generated_image = await run_stage(STAGE_IMAGE, self.image_service.render_image, result["image_prompt"])
+            logger.info("Image generated successfully")
+            # Hashed and reserved before any overlay or encode is spent on a near-duplicate
+            result["image_hash"], match = await run_in_threadpool(self.image_service.screen_image, generated_image)
+            result["near_duplicate_of"] = match.label if match is not None else None
+            # Embedded in the output so the file describes itself (the caption may still be running)
+            metadata = {
+                "entity": entity,
+                "quote": quote,
+                "image_prompt": image_prompt,
+                "image_model": settings.IMAGE_MODEL,
+                "generated_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            if result["image_hash"]:
+                metadata["image_hash"] = result["image_hash"]
+
+            if self.render_pool is not None:
+                # Overlay and encode both run in a worker process; only storing happens here
+                report(STAGE_OVERLAY, "started")
+                encoded, encoded_variants = await self.render_pool.overlay_and_encode_variants(
+                    generated_image, quote, self.variants, dict(self.encode_options, metadata=metadata)
+                )
+                report(STAGE_OVERLAY, "done")
+                logger.info("Text overlaid and image encoded in the render pool")
+                result["image_url"] = await run_stage(STAGE_ENCODE, self.store_encoded, encoded)
+                # Writing and hashing the files blocks, so it stays off the event loop
+                if encoded_variants:
+                    result["variants"] = await run_in_threadpool(self.store_encoded_variants, encoded_variants)
+            else:
+                final_image, variant_images = await run_stage(STAGE_OVERLAY, self.overlay, generated_image, quote)
+                logger.info("Text overlaid on image")
+                result["image_url"] = await run_stage(STAGE_ENCODE, self.save_image, final_image, metadata)
+                # The main image event is already out; the variants follow before "done"
+                if variant_images:
+                    result["variants"] = await run_in_threadpool(self.save_variants, variant_images, metadata)
+            logger.info(f"Image stored at {result['image_url']}")
+            if result["image_hash"]:
+                self.image_service.image_deduper.add(result["image_hash"], result["image_url"])
+        except Exception as e:
+            logger.error(f"Error generating/processing image: {e}")
+            result["image_url"] = ERROR_IMAGE_URL
+            result["image_error"] = str(e)
+            self._release_image_hash(result)
+
+    def _release_image_hash(self, result: dict):
+        """Drops the image deduper's reservation of an image that was not stored"""
+        if result["image_hash"]:
+            self.image_service.image_deduper.release(result["image_hash"])
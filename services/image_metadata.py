@@ -0,0 +1,184 @@
+"""
+Image Metadata
+Post details (entity, quote, caption, ...) embedded in generated image files: a PNG
+iTXt chunk, or an XMP packet in WebP / JPEG files. Reading walks the container's
+header chunks only, so scanning a directory never decodes a pixel.
+"""
+import html
+import json
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from PIL import PngImagePlugin
+
+# PNG text chunk keyword holding the post as JSON
+PNG_KEY = "instaauto:post"
+# XMP namespace and element holding the same JSON in WebP / JPEG files
+XMP_NAMESPACE = "https://github.com/instaauto/ns/post/1.0/"
+_XMP_POST = re.compile(rb"<instaauto:post>(.*?)</instaauto:post>", re.DOTALL)
+_XMP_JPEG_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Text chunks larger than this are not ours; skip rather than read them
+MAX_METADATA_BYTES = 1 << 20
+
+
+def xmp_packet(post: dict) -> bytes:
+    """An XMP packet carrying the post as JSON"""
+    payload = html.escape(json.dumps(post, ensure_ascii=False), quote=False)
+    return (
+        '<?xpacket begin="﻿" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        f'<rdf:Description rdf:about="" xmlns:instaauto="{XMP_NAMESPACE}">'
+        f'<instaauto:post>{payload}</instaauto:post>'
+        '</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+    ).encode("utf-8")
+
+
+def metadata_save_params(format: str, post: dict) -> dict:
+    """
+    Keyword arguments for ``Image.save`` that embed the post.
+
+    Args:
+        format: Output format name ("png", "jpeg" or "webp")
+        post: JSON-serializable dict, e.g. {"entity", "quote", "caption", ...}
+    """
+    if format == "png":
+        info = PngImagePlugin.PngInfo()
+        # Compressed iTXt, written before the pixel data so a header scan finds it
+        info.add_itxt(PNG_KEY, json.dumps(post, ensure_ascii=False), zip=True)
+        return {"pnginfo": info}
+    return {"xmp": xmp_packet(post)}
+
+
+def variant_metadata(post: dict, variant: str):
+    """The post for one output variant (None stays None)"""
+    return {**post, "variant": variant} if post else None
+
+
+def parse_xmp(xmp) -> dict:
+    """The post dict inside an XMP packet (bytes or str), or {} if it has none"""
+    if isinstance(xmp, str):
+        xmp = xmp.encode("utf-8")
+    match = _XMP_POST.search(xmp or b"")
+    if not match:
+        return {}
+    return _parse_post(html.unescape(match.group(1).decode("utf-8")))
+
+
+def _parse_post(text: str) -> dict:
+    try:
+        post = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    return post if isinstance(post, dict) else {}
+
+
+def _png_text(chunk_type: bytes, data: bytes):
+    """The post in a tEXt / zTXt / iTXt chunk with our keyword, else None"""
+    keyword, _, rest = data.partition(b"\x00")
+    if keyword != PNG_KEY.encode("latin-1"):
+        return None
+    if chunk_type == b"tEXt":
+        return _parse_post(rest.decode("latin-1"))
+    if chunk_type == b"zTXt":
+        return _parse_post(zlib.decompress(rest[1:]).decode("latin-1"))
+    # iTXt: compression flag, method, language\0, translated keyword\0, text
+    compressed = rest[:1] == b"\x01"
+    text = rest[2:].split(b"\x00", 2)[-1]
+    if compressed:
+        text = zlib.decompress(text)
+    return _parse_post(text.decode("utf-8"))
+
+
+def _scan_png(f) -> dict:
+    f.seek(len(_PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return {}
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type in (b"IDAT", b"IEND"):
+            return {}
+        if chunk_type in (b"iTXt", b"tEXt", b"zTXt") and length <= MAX_METADATA_BYTES:
+            post = _png_text(chunk_type, f.read(length))
+            if post is not None:
+                return post
+            f.seek(4, os.SEEK_CUR)
+        else:
+            f.seek(length + 4, os.SEEK_CUR)
+
+
+def _scan_webp(f) -> dict:
+    # RIFF chunks are padded to even sizes; image data chunks are skipped, not read
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return {}
+        fourcc, length = struct.unpack("<4sI", header)
+        if fourcc == b"XMP " and length <= MAX_METADATA_BYTES:
+            return parse_xmp(f.read(length))
+        f.seek(length + (length & 1), os.SEEK_CUR)
+
+
+def _scan_jpeg(f) -> dict:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return {}
+        # Start of scan / end of image: the headers are over
+        if marker[1] in (0xDA, 0xD9):
+            return {}
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0] - 2
+        if marker[1] == 0xE1 and length <= MAX_METADATA_BYTES:
+            data = f.read(length)
+            if data.startswith(_XMP_JPEG_HEADER):
+                return parse_xmp(data[len(_XMP_JPEG_HEADER):])
+        else:
+            f.seek(length, os.SEEK_CUR)
+
+
+def read_metadata(path: str) -> dict:
+    """
+    Reads the embedded post from an image file by walking its header chunks;
+    pixel data is skipped over, never read or decoded.
+
+    Args:
+        path: PNG, WebP or JPEG file
+
+    Returns:
+        The embedded post (e.g. "entity", "quote", "caption"), or {} when the
+        file has none or cannot be read
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head.startswith(_PNG_SIGNATURE):
+                return _scan_png(f)
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return _scan_webp(f)
+            if head[:2] == b"\xff\xd8":
+                return _scan_jpeg(f)
+    except (OSError, struct.error, zlib.error, UnicodeDecodeError):
+        pass
+    return {}
+
+
+def scan_directory(directory: str, extensions=(".png", ".jpg", ".jpeg", ".webp"), workers: int = 8) -> dict:
+    """
+    Reads the embedded post of every image in a directory.
+
+    Returns:
+        Dict of file name -> post, for files that have one
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(tuple(extensions)))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        posts = executor.map(lambda name: read_metadata(os.path.join(directory, name)), names)
+        return {name: post for name, post in zip(names, posts) if post}
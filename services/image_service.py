@@ -2,38 +2,49 @@
 Image Generation Service
 Handles AI-powered image generation using Gemini API.
 """
-import os
-from google import genai
 from PIL import Image
 import io
-from dotenv import load_dotenv
+import threading
+from collections import OrderedDict
 
-load_dotenv(override=True)
+from config import settings
+from config.prompts import IMAGE_SYSTEM_PROMPT, IMAGE_PROMPT_TEMPLATE, DEFAULT_SCENE, ENTITY_SCENE_PROMPT
+from services.gemini_client import get_client
+from services.resilience import with_resilience
+
+# How generate_image_prompt builds the prompt (see IMAGE_PROMPT_STRATEGY in config/settings.py)
+PROMPT_STRATEGIES = ("llm", "template", "cached", "combined")
 
-from config.prompts import IMAGE_SYSTEM_PROMPT
 
 class ImageService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+    def __init__(self, client=None, prompt_strategy: str = None, scene_cache_size: int = 256, image_deduper=None):
+        # Use the injected client, or the shared pooled one with retries
+        self.client = client if client is not None else with_resilience(get_client())
+        if self.client is None:
             print("ERROR: GEMINI_API_KEY not found.")
             print("Please set GEMINI_API_KEY in your .env file or environment variables.")
-            self.client = None
         else:
-            try:
-                # Initialize the client with the API key
-                self.client = genai.Client(api_key=self.api_key)
-                print("OK: ImageService initialized successfully with API key")
-            except Exception as e:
-                print(f"ERROR: Failed to initialize Gemini client: {e}")
-                self.client = None
-
-    def generate_image(self, quote: str) -> Image.Image:
+            print("OK: ImageService initialized successfully with API key")
+
+        prompt_strategy = (prompt_strategy or settings.IMAGE_PROMPT_STRATEGY).lower()
+        if prompt_strategy not in PROMPT_STRATEGIES:
+            print(f"WARNING: Unknown image prompt strategy {prompt_strategy!r}, using 'llm'")
+            prompt_strategy = "llm"
+        self.prompt_strategy = prompt_strategy
+        # Per-entity scene descriptions for the "cached" strategy (LRU)
+        self._scenes = OrderedDict()
+        self._scenes_lock = threading.Lock()
+        self.scene_cache_size = scene_cache_size
+        # Optional ImageDeduper every rendered image is screened against
+        self.image_deduper = image_deduper
+
+    def generate_image(self, quote: str, entity: str = None) -> Image.Image:
         """
         Generates an image based on the quote using Gemini image generation.
         
         Args:
             quote: The quote to generate an image for
+            entity: Entity the quote is about (used by the "cached" prompt strategy)
         
         Returns:
             PIL Image object (not base64 string)
@@ -41,15 +52,89 @@ class ImageService:
         Raises:
             Exception: If image generation fails
         """
+        image_prompt = self.generate_image_prompt(quote, entity)
+        return self.render_image(image_prompt)
+
+    def generate_image_prompt(self, quote: str, entity: str = None) -> str:
+        """
+        Builds the image prompt for a quote with the configured strategy.
+        
+        "llm" expands every quote with the text model; "template" fills
+        IMAGE_PROMPT_TEMPLATE locally; "cached" fills the template with a scene
+        expanded once per entity. "combined" prompts come from
+        QuoteService.generate_quote_with_image_prompt, so when this is called
+        anyway (the combined call failed) the local template is used.
+        
+        Args:
+            quote: The quote to generate an image prompt for
+            entity: Entity the quote is about (used by the "cached" strategy)
+        
+        Returns:
+            The image prompt
+        
+        Raises:
+            Exception: If the "llm" strategy is used without a configured client
+        """
+        if self.prompt_strategy == "llm":
+            return self.expand_image_prompt(quote)
+        scene = DEFAULT_SCENE
+        if self.prompt_strategy == "cached" and entity:
+            scene = self.entity_scene(entity)
+        return self.template_image_prompt(quote, scene)
+
+    @staticmethod
+    def template_image_prompt(quote: str, scene: str = DEFAULT_SCENE) -> str:
+        """Fills IMAGE_PROMPT_TEMPLATE locally, without a model call"""
+        return IMAGE_PROMPT_TEMPLATE.replace("{{quote}}", quote).replace("{{scene}}", scene)
+
+    def entity_scene(self, entity: str) -> str:
+        """
+        Scene description for an entity, expanded by the text model on first use
+        and memoized afterwards. Falls back to DEFAULT_SCENE if the call fails.
+        """
+        key = entity.strip().lower()
+        with self._scenes_lock:
+            if key in self._scenes:
+                self._scenes.move_to_end(key)
+                return self._scenes[key]
+        if not self.client:
+            return DEFAULT_SCENE
+        try:
+            response = self.client.models.generate_content(
+                model=settings.TEXT_MODEL,
+                contents=[ENTITY_SCENE_PROMPT.replace("{{entity}}", entity)],
+            )
+            scene = (response.text or "").strip() or DEFAULT_SCENE
+        except Exception as e:
+            print(f"Warning: scene expansion for {entity} failed, using the default scene: {e}")
+            return DEFAULT_SCENE
+        with self._scenes_lock:
+            self._scenes[key] = scene
+            while len(self._scenes) > self.scene_cache_size:
+                self._scenes.popitem(last=False)
+        return scene
+
+    def expand_image_prompt(self, quote: str) -> str:
+        """
+        Expands the quote into a detailed image prompt using the text model.
+        
+        Args:
+            quote: The quote to generate an image prompt for
+        
+        Returns:
+            The "Image Prompt:" section of the model output (or the whole output)
+        
+        Raises:
+            Exception: If the client is not configured
+        """
         if not self.client:
             raise Exception("GEMINI_API_KEY not found. Cannot generate image.")
 
-        # Step 1: Generate the Image Prompt
         print(f"Generating image prompt for quote: {quote[:50]}...")
         text_prompt = IMAGE_SYSTEM_PROMPT.replace("{{quote}}", quote)
         
         text_response = self.client.models.generate_content(
-            model="gemini-2.5-flash", 
+            model=settings.TEXT_MODEL, 
             contents=[text_prompt],
         )
         
@@ -60,63 +145,56 @@ class ImageService:
         final_image_prompt = generated_prompt
         if "Image Prompt:" in generated_prompt:
             final_image_prompt = generated_prompt.split("Image Prompt:")[1].split("Progression Text:")[0].strip()
+        return final_image_prompt
+
+    def render_image(self, final_image_prompt: str) -> Image.Image:
+        """
+        Generates an image from an already expanded image prompt.
+        
+        Args:
+            final_image_prompt: Detailed image prompt (see generate_image_prompt)
         
-        # Step 2: Generate the Image using gemini-2.5-flash-image
+        Returns:
+            PIL Image object
+        
+        Raises:
+            Exception: If image generation fails
+        """
+        if not self.client:
+            raise Exception("GEMINI_API_KEY not found. Cannot generate image.")
+
+        # Generate the Image using the image model
         print(f"Generating image with prompt: {final_image_prompt[:50]}...")
-        print(f"Using model: gemini-2.5-flash-image")
-        
-        image_response = None
-        for attempt in range(3):
-            try:
-                image_response = self.client.models.generate_content(
-                    model="gemini-2.5-flash-image",
-                    contents=[final_image_prompt],
-                )
-                print("Image generation API call successful!")
-                break
-            except Exception as e:
-                print(f"Attempt {attempt+1} failed: {e}")
-                import traceback
-                traceback.print_exc()
-                if attempt == 2:
-                    raise e
-                import time
-                time.sleep(2)  # Simple backoff
-
-        # Extract image from response
+        print(f"Using model: {settings.IMAGE_MODEL}")
+        
+        # Retries, backoff and the deadline come from the client's resilience layer
+        image_response = self.client.models.generate_content(
+            model=settings.IMAGE_MODEL,
+            contents=[final_image_prompt],
+        )
+        print("Image generation API call successful!")
+
+        # Extract image from response: decode the inline bytes once. convert()
+        # already returns a new, writable image; otherwise load() decodes into
+        # pixels this image owns, so no defensive copy is needed.
         image = None
         
         for part in image_response.parts:
             if part.text is not None:
                 print(f"Warning: Received text instead of image: {part.text[:100]}...")
             elif part.inline_data is not None:
-                # Use as_image() method to get PIL Image directly
                 try:
-                    pil_image = part.as_image()
-                    # Convert to RGB mode if needed and make a mutable copy
-                    if pil_image.mode != 'RGB':
-                        pil_image = pil_image.convert('RGB')
-                    # Create a mutable copy to avoid _ensure_mutable errors
-                    image = pil_image.copy()
+                    image = Image.open(io.BytesIO(part.inline_data.data))
+                    if image.mode != 'RGB':
+                        image = image.convert('RGB')
+                    else:
+                        image.load()
                     print("Successfully extracted image from response!")
                     break
                 except Exception as e:
-                    print(f"Error using as_image(): {e}")
-                    import traceback
-                    traceback.print_exc()
-                    # Fallback to manual extraction
-                    try:
-                        img_bytes = part.inline_data.data
-                        pil_image = Image.open(io.BytesIO(img_bytes))
-                        # Convert to RGB and make mutable copy
-                        if pil_image.mode != 'RGB':
-                            pil_image = pil_image.convert('RGB')
-                        image = pil_image.copy()
-                        print("Successfully extracted image using fallback method!")
-                        break
-                    except Exception as e2:
-                        print(f"Fallback extraction also failed: {e2}")
-                        continue
+                    print(f"Image extraction failed: {e}")
+                    image = None
+                    continue
         
         if image is None:
             error_msg = "No image data found in response."
@@ -127,3 +205,18 @@ class ImageService:
             raise Exception(error_msg)
         
         return image
+
+    def screen_image(self, image: Image.Image):
+        """
+        Checks a generated image with the image deduper, reserving its hash
+        (see ImageDeduper.screen).
+
+        Returns:
+            (perceptual hash, ImageMatch or None), or (None, None) without a deduper
+
+        Raises:
+            DuplicateImageError: If the deduper rejects near-duplicates and this is one
+        """
+        if self.image_deduper is None:
+            return None, None
+        return self.image_deduper.screen(image)
@@ -0,0 +1,171 @@
+"""
+Image Store
+Content-addressed on-disk storage for final images, served by GET /images/{key}.
+"""
+import os
+import re
+import hashlib
+import tempfile
+import contextlib
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# 32 hex chars (128 bits of SHA-256) followed by a known extension
+KEY_PATTERN = re.compile(r"^([0-9a-f]{32})\.(png|jpg|webp)$")
+
+
+class ImageStore:
+    """Stores encoded images once, under a name derived from their content hash"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def put(self, data: bytes, ext: str = "png") -> str:
+        """
+        Writes encoded image bytes to the store (no-op if already present).
+
+        Args:
+            data: Encoded image bytes
+            ext: File extension, one of MIME_TYPES
+
+        Returns:
+            Store key, e.g. "3f2a...c9.png"
+        """
+        ext = self._normalize_ext(ext)
+        key = f"{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
+        path = self._path(key)
+        if not os.path.exists(path):
+            # Write to a temp file in the same directory, then rename, so readers
+            # never see a partially written image
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return key
+
+    @contextlib.contextmanager
+    def writer(self, ext: str = "png"):
+        """
+        Streams an image into the store without holding it in memory.
+
+        Yields a file-like object; write the encoded image to it. Bytes go to
+        a temp file and are hashed on the way, and on exit the file is renamed
+        to its content key (the same key put() would give). The key is then
+        available as ``writer.key``.
+
+        Args:
+            ext: File extension, one of MIME_TYPES
+        """
+        ext = self._normalize_ext(ext)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        stream = _HashingWriter(os.fdopen(fd, "wb"))
+        try:
+            yield stream
+            stream.close()
+            key = f"{stream.hexdigest()[:32]}.{ext}"
+            path = self._path(key)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            stream.key = key
+        except BaseException:
+            stream.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _normalize_ext(ext: str) -> str:
+        ext = ext.lower().lstrip(".")
+        if ext == "jpeg":
+            ext = "jpg"
+        if ext not in MIME_TYPES:
+            raise ValueError(f"Unsupported image extension: {ext}")
+        return ext
+
+    def path_for(self, key: str):
+        """Returns the file path for a key, or None if the key is invalid or missing"""
+        if not KEY_PATTERN.match(key):
+            return None
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def _path(self, key: str) -> str:
+        # Fan out by the first two hex chars to keep directories small
+        return os.path.join(self.root, key[:2], key)
+
+
+class _HashingWriter:
+    """
+    Write-only file wrapper that hashes everything written. It has no fileno(),
+    so Pillow writes through write() instead of straight to the descriptor.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._hash = hashlib.sha256()
+        self.key = None
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def mime_type_for(key: str) -> str:
+    """Returns the MIME type for a store key"""
+    return MIME_TYPES[key.rsplit(".", 1)[1]]
+
+
+def parse_range(range_header: str, size: int):
+    """
+    Parses a single-range HTTP Range header ("bytes=start-end").
+
+    Args:
+        range_header: Value of the Range header
+        size: Total size of the resource in bytes
+
+    Returns:
+        (start, end) inclusive byte offsets, or None if the header is not a
+        byte range we can serve (the caller should answer 416)
+    """
+    match = re.match(r"^bytes=(\d*)-(\d*)$", range_header.strip())
+    if not match or (match.group(1) == "" and match.group(2) == ""):
+        return None
+
+    if match.group(1) == "":
+        # Suffix range: the last N bytes
+        length = int(match.group(2))
+        if length == 0:
+            return None
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        end = min(end, size - 1)
+
+    if start > end or start >= size:
+        return None
+    return start, end
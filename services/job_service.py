@@ -0,0 +1,157 @@
+"""
+Job Service
+Bounded asynchronous job queue for generation requests, with progress polling.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from services.generation_service import STAGE_ENCODE
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """A single generation request and its progress"""
+
+    def __init__(self, prompt: str, description: str = ""):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.description = description
+        self.status = STATUS_QUEUED
+        self.stage = None
+        self.completed_stages = []
+        self.result = {}
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at = None
+
+    def on_progress(self, stage: str, status: str, value=None):
+        """Progress callback for GenerationService.generate"""
+        if status == "started":
+            self.stage = stage
+        else:
+            self.completed_stages.append(stage)
+            if value is not None:
+                # The encode stage produces the final image URL
+                self.result["image_url" if stage == STAGE_ENCODE else stage] = value
+        self.updated_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "completed_stages": list(self.completed_stages),
+            "quote": self.result.get("quote"),
+            "caption": self.result.get("caption"),
+            "image_prompt": self.result.get("image_prompt"),
+            "image_url": self.result.get("image_url"),
+            "variants": dict(self.result.get("variants") or {}),
+            "near_duplicate_of": self.result.get("near_duplicate_of"),
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobService:
+    """
+    Runs generation jobs on a fixed number of worker tasks.
+
+    The queue is bounded: once ``queue_size`` jobs are waiting, submit() raises
+    QueueFullError so the API can push back instead of piling work onto the loop.
+    """
+
+    def __init__(self, generation_service, concurrency: int = 2, queue_size: int = 20, ttl_seconds: int = 900):
+        self.generation_service = generation_service
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.ttl_seconds = ttl_seconds
+        self.jobs = {}
+        self._queue = None
+        self._workers = []
+
+    async def start(self):
+        """Starts the worker tasks (call from the app startup hook)"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Job workers started: concurrency={self.concurrency}, queue_size={self.queue_size}")
+
+    async def stop(self):
+        """Cancels the worker tasks (call from the app shutdown hook)"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, prompt: str, description: str = "") -> Job:
+        """
+        Queues a new generation job.
+
+        Raises:
+            QueueFullError: If the queue is full
+        """
+        if self._queue is None:
+            raise RuntimeError("JobService.start() has not been called")
+        self._evict_expired()
+        job = Job(prompt, description)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.queue_size} waiting)")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str):
+        """Returns the job with this id, or None if unknown or expired"""
+        self._evict_expired()
+        return self.jobs.get(job_id)
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs waiting in the queue"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def active(self) -> int:
+        """Number of jobs currently being generated"""
+        return sum(1 for job in self.jobs.values() if job.status == STATUS_RUNNING)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            job.status = STATUS_RUNNING
+            job.updated_at = time.time()
+            logger.info(f"Worker {worker_id} running job {job.id}: {job.prompt}")
+            try:
+                result = await self.generation_service.generate(job.prompt, job.description, on_progress=job.on_progress)
+                job.result.update(result)
+                job.error = result.get("image_error")
+                job.status = STATUS_COMPLETED
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = STATUS_FAILED
+            finally:
+                job.stage = None
+                job.finished_at = job.updated_at = time.time()
+                self._queue.task_done()
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
@@ -0,0 +1,328 @@
+"""
+LLM Response Cache
+Persistent SQLite cache for Gemini responses keyed by (model, rendered prompt, config),
+with a separate on-disk blob store for image model outputs.
+"""
+import contextlib
+import contextvars
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from PIL import Image
+from config import settings
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextlib.contextmanager
+def bypass_cache():
+    """Within this block, model calls skip the cache (no lookup, no store) for fresh output"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _jsonable(value):
+    if isinstance(value, type) and hasattr(value, "model_json_schema"):
+        # A pydantic class used as response_schema
+        return value.model_json_schema()
+    if hasattr(value, "model_dump"):
+        # Field by field, since fields may hold values model_dump cannot serialize
+        fields = {name: getattr(value, name) for name in type(value).model_fields}
+        return {name: _jsonable(field) for name, field in fields.items() if field is not None}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def cache_key(model: str, contents, config=None) -> str:
+    """Stable hash of the model, fully rendered contents and generation config"""
+    payload = json.dumps(
+        {"model": model, "contents": _jsonable(contents), "config": _jsonable(config)},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Store:
+    """SQLite table of cache entries with TTL and LRU eviction by entry count and bytes"""
+
+    def __init__(self, db_path: str, table: str, ttl_seconds: float, max_entries: int, max_bytes: int):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, model TEXT, value BLOB, mime_type TEXT, size INTEGER, "
+            "created_at REAL, accessed_at REAL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._db.commit()
+
+    def get(self, key: str):
+        """Returns (value, mime_type) or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, mime_type, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0], row[1]
+
+    def put(self, key: str, model: str, value, mime_type: str = None):
+        now = time.time()
+        size = len(value.encode("utf-8") if isinstance(value, str) else value)
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, value, mime_type, size, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> list:
+        """Deletes expired and least recently used rows; returns the evicted keys"""
+        evicted = []
+        if self.ttl_seconds:
+            cutoff = time.time() - self.ttl_seconds
+            evicted = [row[0] for row in self._db.execute(f"SELECT key FROM {self.table} WHERE created_at < ?", (cutoff,))]
+            self._db.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (cutoff,))
+        count, total = self._db.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+
+        def within_limits():
+            return (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes)
+
+        if within_limits():
+            return evicted
+        for key, size in self._db.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at").fetchall():
+            if within_limits():
+                break
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            evicted.append(key)
+            count -= 1
+            total -= size
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.commit()
+
+
+class BlobStore(_Store):
+    """Like _Store, but values live as files on disk and the table only indexes them"""
+
+    def __init__(self, db_path: str, blob_dir: str, ttl_seconds: float, max_entries: int, max_bytes: int):
+        self.blob_dir = blob_dir
+        os.makedirs(blob_dir, exist_ok=True)
+        super().__init__(db_path, "blobs", ttl_seconds, max_entries, max_bytes)
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.blob_dir, key[:2], key)
+
+    def get(self, key: str):
+        entry = super().get(key)
+        path = self._blob_path(key)
+        if entry is None:
+            # Expired rows are deleted by the lookup; drop the file with them
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read(), entry[1]
+
+    def put(self, key: str, model: str, value: bytes, mime_type: str = None):
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temp file of its own, so concurrent writers of one key never share it
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # The table row stores the path; size still counts the blob for eviction
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, path, mime_type, len(value), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> list:
+        evicted = super()._evict()
+        for key in evicted:
+            path = self._blob_path(key)
+            if os.path.exists(path):
+                os.remove(path)
+        return evicted
+
+
+class CachedBlob:
+    def __init__(self, data: bytes, mime_type: str):
+        self.data = data
+        self.mime_type = mime_type
+
+
+class CachedPart:
+    """Mirrors the bits of google.genai.types.Part the services read"""
+
+    def __init__(self, text: str = None, inline_data: CachedBlob = None):
+        self.text = text
+        self.inline_data = inline_data
+
+    def as_image(self):
+        if self.inline_data is None:
+            return None
+        return Image.open(io.BytesIO(self.inline_data.data))
+
+
+class CachedResponse:
+    """Mirrors the bits of GenerateContentResponse the services read"""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.cached = True
+
+    @property
+    def text(self):
+        texts = [part.text for part in self.parts if part.text is not None]
+        return "".join(texts) if texts else None
+
+
+class ResponseCache:
+    """Text responses in SQLite, image model outputs in a blob store beside it"""
+
+    def __init__(self, path: str, image_models=(), ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 10000, max_image_bytes: int = 1024 * 1024 * 1024):
+        self.image_models = set(image_models)
+        self.text = _Store(path, "responses", ttl_seconds, max_entries, 0)
+        self.images = BlobStore(path, os.path.join(os.path.dirname(os.path.abspath(path)), "blobs"),
+                                ttl_seconds, 0, max_image_bytes)
+        self.hits = 0
+        self.misses = 0
+        # Lookups run on many worker threads at once
+        self._counter_lock = threading.Lock()
+
+    def lookup(self, model: str, key: str):
+        if model in self.image_models:
+            entry = self.images.get(key)
+            response = CachedResponse([CachedPart(inline_data=CachedBlob(*entry))]) if entry else None
+        else:
+            entry = self.text.get(key)
+            response = CachedResponse([CachedPart(text=entry[0])]) if entry else None
+        with self._counter_lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def store(self, model: str, key: str, response):
+        """Stores a successful response; responses without usable output are not cached"""
+        if model in self.image_models:
+            for part in getattr(response, "parts", None) or []:
+                if getattr(part, "inline_data", None) is not None and part.inline_data.data:
+                    self.images.put(key, model, part.inline_data.data, part.inline_data.mime_type)
+                    return
+        else:
+            text = getattr(response, "text", None)
+            if text:
+                self.text.put(key, model, text)
+
+
+class _CachedModels:
+    def __init__(self, models, cache: ResponseCache):
+        self._models = models
+        self._cache = cache
+
+    def generate_content(self, *, model, contents, config=None, cache: bool = True, **kwargs):
+        if not cache or _bypass.get():
+            return self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        key = cache_key(model, contents, config)
+        response = self._cache.lookup(model, key)
+        if response is not None:
+            return response
+        response = self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        try:
+            self._cache.store(model, key, response)
+        except Exception as e:
+            print(f"Warning: could not cache response: {e}")
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class CachedClient:
+    """
+    Wraps a genai.Client so ``client.models.generate_content`` is served from the
+    cache when the same (model, contents, config) was seen within the TTL.
+    Pass ``cache=False`` or use ``bypass_cache()`` for fresh output.
+    """
+
+    def __init__(self, client, cache: ResponseCache):
+        self._client = client
+        self.cache = cache
+        self.models = _CachedModels(client.models, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide ResponseCache configured from settings"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(
+                settings.LLM_CACHE_PATH,
+                image_models=[settings.IMAGE_MODEL],
+                ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                max_image_bytes=settings.LLM_IMAGE_CACHE_MAX_MB * 1024 * 1024,
+            )
+        return _shared_cache
+
+
+def with_cache(client, enabled: bool = None):
+    """Wraps a client in the shared cache when enabled (default: LLM_CACHE_ENABLED)"""
+    if enabled is None:
+        enabled = settings.LLM_CACHE_ENABLED
+    if client is None or not enabled:
+        return client
+    return CachedClient(client, get_response_cache())
@@ -0,0 +1,135 @@
+"""
+Batch Manifest
+Append-only JSONL record of generated images, with atomic compaction and
+import/export of the legacy instagram_captions.json array.
+"""
+import os
+import json
+import threading
+import tempfile
+
+
+def atomic_write(path: str, data: bytes):
+    """Writes a file via temp file + fsync + rename, so readers see old or new content, never a mix"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Persist the rename itself (not supported on Windows)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class Manifest:
+    """
+    Append-only manifest keyed by ``image_number``.
+
+    Every record is one JSON line, written with flush + fsync, so a crash loses
+    at most the line being written. When a number appears more than once the
+    last record wins. compact() rewrites the file with one line per number.
+    """
+
+    def __init__(self, path: str, key: str = "image_number"):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        """Returns {key: record} for all intact records, skipping a torn final line"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if line_number == len(lines):
+                    print(f"⚠️  Ignoring incomplete last line of {self.path} (interrupted write)")
+                else:
+                    print(f"⚠️  Skipping corrupt line {line_number} of {self.path}")
+                continue
+            if self.key in record:
+                records[record[self.key]] = record
+        return records
+
+    def completed(self) -> set:
+        """Keys of all recorded entries"""
+        return set(self.load())
+
+    def append(self, record: dict):
+        """Durably appends one record"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "ab") as f:
+                # A crash may have left a partial line without a newline; start fresh
+                if f.tell() > 0 and not self._ends_with_newline():
+                    f.write(b"\n")
+                f.write(line.encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def records(self) -> list:
+        """Latest record per key, sorted by key"""
+        return [record for _, record in sorted(self.load().items())]
+
+    def compact(self) -> int:
+        """Atomically rewrites the manifest with one line per key; returns the record count"""
+        with self._lock:
+            records = self.records()
+            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            atomic_write(self.path, data.encode("utf-8"))
+        return len(records)
+
+    def import_json(self, json_path: str) -> int:
+        """
+        Appends entries from a legacy JSON array file that the manifest does not have yet.
+
+        Returns:
+            Number of imported records
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            print(f"⚠️  {json_path} is not valid JSON. Nothing imported.")
+            return 0
+        existing = self.completed()
+        imported = 0
+        for entry in entries:
+            if entry.get(self.key) is not None and entry[self.key] not in existing:
+                self.append(entry)
+                existing.add(entry[self.key])
+                imported += 1
+        return imported
+
+    def export_json(self, json_path: str) -> int:
+        """Atomically writes all records as a pretty-printed JSON array (legacy format)"""
+        records = self.records()
+        data = json.dumps(records, indent=2, ensure_ascii=False).encode("utf-8")
+        atomic_write(json_path, data)
+        return len(records)
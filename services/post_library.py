@@ -0,0 +1,348 @@
+"""
+Post Library
+SQLite (WAL) store of every generated post, shared by the server and the batch scripts:
+indexed by image number, entity, creation time and content hash, with a full-text
+index over quote and caption and keyset-paginated queries.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Columns callers may set, in table order
+POST_FIELDS = ("image_number", "entity", "quote", "caption", "image_prompt", "progression_text",
+               "image_path", "image_url", "content_hash", "image_hash", "variants", "source", "created_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    image_number INTEGER UNIQUE,
+    entity TEXT,
+    quote TEXT NOT NULL,
+    caption TEXT,
+    image_prompt TEXT,
+    progression_text TEXT,
+    image_path TEXT,
+    image_url TEXT,
+    content_hash TEXT,
+    image_hash TEXT,
+    variants TEXT,
+    source TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_created ON posts (created_at, id);
+CREATE INDEX IF NOT EXISTS posts_entity_created ON posts (entity, created_at, id);
+CREATE INDEX IF NOT EXISTS posts_content_hash ON posts (content_hash);
+CREATE TABLE IF NOT EXISTS quote_vectors (
+    quote_key TEXT NOT NULL,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (quote_key, model)
+) WITHOUT ROWID;
+"""
+
+# External-content FTS5 table kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(quote, caption, content='posts', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, quote, caption) VALUES (new.id, new.quote, new.caption);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, quote, caption) VALUES ('delete', old.id, old.quote, old.caption);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF quote, caption ON posts BEGIN
+    INSERT INTO posts_fts (posts_fts, rowid, quote, caption) VALUES ('delete', old.id, old.quote, old.caption);
+    INSERT INTO posts_fts (rowid, quote, caption) VALUES (new.id, new.quote, new.caption);
+END;
+"""
+
+# Columns added after the first release: (name, type), created on databases that lack them
+MIGRATIONS = (("image_hash", "TEXT"),)
+
+MAX_PAGE_SIZE = 100
+
+
+def file_hash(path: str) -> str:
+    """Content hash of a file, in the same form as ImageStore keys (32 hex digits)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def portable_path(path: str, project_root: str = None) -> str:
+    """
+    A project-relative, forward-slash path. Absolute paths recorded on another
+    machine (e.g. ``E:\\Code\\instaauto\\images\\x.png``) are cut back to the
+    part from the ``images`` folder on.
+    """
+    if not path:
+        return path
+    normalized = path.replace("\\", "/")
+    if project_root and os.path.isabs(path):
+        relative = os.path.relpath(path, project_root).replace("\\", "/")
+        if not relative.startswith(".."):
+            return relative
+    parts = normalized.split("/")
+    if "images" in parts:
+        return "/".join(parts[len(parts) - 1 - parts[::-1].index("images"):])
+    return normalized
+
+
+def parse_generated_at(value) -> float:
+    """Epoch seconds from a "%Y-%m-%d %H:%M:%S" string (or a number); now if missing"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value:
+        try:
+            return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+        except ValueError:
+            pass
+    return time.time()
+
+
+def record_to_post(record: dict, project_root: str = None, source: str = "batch") -> dict:
+    """Converts a manifest / instagram_captions.json entry to a library post"""
+    path = record.get("image_path_relative") or record.get("image_path")
+    if not path and record.get("filename"):
+        path = f"images/{record['filename']}"
+    return {
+        "image_number": record.get("image_number"),
+        "entity": record.get("entity"),
+        "quote": record.get("quote"),
+        "caption": record.get("instagram_caption") or record.get("caption"),
+        "image_prompt": record.get("image_prompt"),
+        "progression_text": record.get("progression_text"),
+        "image_path": portable_path(path, project_root),
+        "image_hash": record.get("image_hash"),
+        "variants": {name: portable_path(value, project_root) for name, value in (record.get("variants") or {}).items()},
+        "source": source,
+        "created_at": parse_generated_at(record.get("generated_at")),
+    }
+
+
+def encode_cursor(created_at: float, post_id: int) -> str:
+    raw = json.dumps([created_at, post_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(created_at, id) from a cursor string; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, post_id = json.loads(raw)
+        return float(created_at), int(post_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def fts_query(text: str) -> str:
+    """Quotes each word, so user input is matched as terms, never parsed as FTS syntax"""
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{word}"' for word in words)
+
+
+class PostLibrary:
+    """
+    Posts in one SQLite database in WAL mode, so the server and batch scripts
+    can read while one of them writes. Writes take the database write lock up
+    front (BEGIN IMMEDIATE) and wait up to ``timeout`` seconds for it, so
+    concurrent writers queue instead of failing.
+
+    Posts with an ``image_number`` (batch output) are upserted by that number;
+    server posts have none and are always appended.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=timeout, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._migrate()
+        try:
+            self._db.executescript(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: text search falls back to LIKE
+            self.full_text = False
+
+    def _migrate(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(posts)")}
+        for name, kind in MIGRATIONS:
+            if name not in columns:
+                try:
+                    self._db.execute(f"ALTER TABLE posts ADD COLUMN {name} {kind}")
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, post: dict) -> int:
+        """Inserts (or, by image number, updates) one post; returns its id"""
+        return self.add_many([post])[0]
+
+    def add_many(self, posts) -> list:
+        """Writes several posts in one transaction; returns their ids"""
+        ids = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for post in posts:
+                    ids.append(self._upsert(post))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def _upsert(self, post: dict) -> int:
+        if not post.get("quote"):
+            raise ValueError("A post needs a quote")
+        values = {field: post.get(field) for field in POST_FIELDS}
+        values["variants"] = json.dumps(values["variants"] or {}, ensure_ascii=False)
+        values["created_at"] = values["created_at"] or time.time()
+        columns = ", ".join(POST_FIELDS)
+        placeholders = ", ".join(f":{field}" for field in POST_FIELDS)
+        if values["image_number"] is None:
+            cursor = self._db.execute(f"INSERT INTO posts ({columns}) VALUES ({placeholders})", values)
+            return cursor.lastrowid
+        # Fields the new record does not know keep their stored value
+        updates = ", ".join(f"{field} = COALESCE(excluded.{field}, {field})"
+                            for field in POST_FIELDS if field != "image_number")
+        self._db.execute(
+            f"INSERT INTO posts ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (image_number) DO UPDATE SET {updates}",
+            values,
+        )
+        return self._db.execute("SELECT id FROM posts WHERE image_number = ?", (values["image_number"],)).fetchone()[0]
+
+    def get(self, post_id: int):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def by_image_number(self, image_number: int):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM posts WHERE image_number = ?", (image_number,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def find_by_hash(self, content_hash: str) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM posts WHERE content_hash = ?", (content_hash,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def quotes(self) -> list:
+        """Every stored quote, oldest first (seeds the quote dedup index)"""
+        with self._lock:
+            rows = self._db.execute("SELECT quote FROM posts ORDER BY created_at, id").fetchall()
+        return [row[0] for row in rows]
+
+    def image_hashes(self) -> list:
+        """(image path or URL, perceptual hash) of every hashed post, oldest first"""
+        with self._lock:
+            rows = self._db.execute("SELECT COALESCE(image_path, image_url, id), image_hash FROM posts "
+                                    "WHERE image_hash IS NOT NULL ORDER BY created_at, id").fetchall()
+        return [(str(row[0]), row[1]) for row in rows]
+
+    def vectors(self, model: str, keys) -> dict:
+        """Stored quote embeddings of one model: {quote key: float32 bytes}"""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT quote_key, vector FROM quote_vectors WHERE model = ? "
+                    f"AND quote_key IN ({', '.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                found.update((key, vector) for key, vector in rows)
+        return found
+
+    def put_vectors(self, model: str, vectors: dict):
+        """Stores quote embeddings ({quote key: float32 bytes}) so they are not recomputed"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO quote_vectors (quote_key, model, vector) VALUES (?, ?, ?)",
+                    [(key, model, vector) for key, vector in vectors.items()],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def query(self, entity: str = None, q: str = None, limit: int = 20, cursor: str = None):
+        """
+        Newest posts first, optionally filtered by entity and a text search over
+        quote and caption.
+
+        Pagination is by keyset: pass the returned cursor back to get the next
+        page. Each page is an index range scan, however deep the page.
+
+        Args:
+            entity: Exact entity name
+            q: Words that must all appear in the quote or caption
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            cursor: ``next_cursor`` of the previous page
+
+        Returns:
+            (posts, next_cursor); next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where, params = [], []
+        if entity:
+            where.append("p.entity = ?")
+            params.append(entity)
+        if q and q.strip():
+            if self.full_text:
+                match = fts_query(q)
+                if match:
+                    where.append("p.id IN (SELECT rowid FROM posts_fts WHERE posts_fts MATCH ?)")
+                    params.append(match)
+            else:
+                for word in q.split():
+                    where.append("(p.quote LIKE ? OR p.caption LIKE ?)")
+                    params.extend([f"%{word}%", f"%{word}%"])
+        if cursor:
+            created_at, post_id = decode_cursor(cursor)
+            where.append("(p.created_at, p.id) < (?, ?)")
+            params.extend([created_at, post_id])
+        sql = "SELECT p.* FROM posts p"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY p.created_at DESC, p.id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        posts = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(posts[-1]["created_at"], posts[-1]["id"])
+        return posts, next_cursor
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        post = dict(row)
+        post["variants"] = json.loads(post["variants"] or "{}")
+        return post
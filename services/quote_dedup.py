@@ -0,0 +1,549 @@
+"""
+Quote Dedup
+Near-duplicate detection for generated facts: a MinHash / LSH index over the words of
+every stored quote, optionally backed by an embedding index searched with one NumPy
+matrix-vector product. Checks run before any image call is spent on a repeated fact.
+"""
+import hashlib
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from config import settings
+
+# Words that carry no fact; dropped before shingling so rephrasings still overlap
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each even ever every few for from further had has
+have having he her here hers him his how i if in into is it its itself just know like may me might more
+most much must my no nor not now of off on once one only or other our out over own really same she
+should so some such than that the their them then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+# Golden-ratio multiplier used to fold a band's rows into one key
+_BAND_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingles(text: str) -> set:
+    """Content words of a quote and their adjacent pairs"""
+    words = [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+    # Crude plural folding: "moons" and "moon" are the same shingle
+    words = [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words]
+    return {*words, *(f"{a} {b}" for a, b in zip(words, words[1:]))}
+
+
+def quote_key(quote: str) -> str:
+    """Stable key of a quote's text (32 hex digits), e.g. for stored embeddings"""
+    return hashlib.sha256(quote.strip().encode("utf-8")).hexdigest()[:32]
+
+
+class DuplicateQuoteError(Exception):
+    """A generated quote repeats a stored one (after any regeneration attempts)"""
+
+    def __init__(self, quote: str, match):
+        super().__init__(f"Near-duplicate of a stored fact ({match.method} {match.score:.2f}): {match.quote[:80]}")
+        self.quote = quote
+        self.match = match
+
+
+class Match:
+    """The stored quote a new one duplicates, and how similar they are"""
+
+    def __init__(self, quote: str, score: float, method: str):
+        self.quote = quote
+        self.score = score
+        # "lexical" (estimated Jaccard of shingles) or "semantic" (embedding cosine)
+        self.method = method
+
+
+class MinHashIndex:
+    """
+    MinHash signatures with banded LSH.
+
+    Each quote's shingles are hashed under ``num_perm`` multiply-shift hash
+    functions (no modulo, so one vectorized multiply-add per function); the
+    signature is split into ``bands`` bands and each band folded into one key.
+    Quotes sharing any band key are candidates, and candidates are scored by
+    the share of equal signature values (an estimate of their Jaccard
+    similarity) in one vectorized comparison.
+
+    Band keys live in one sorted NumPy array searched with ``searchsorted``;
+    recent additions sit in a small dict until it is merged in. A lookup is a
+    few binary searches however many quotes are stored, and memory stays at
+    a few dozen bytes per band per quote.
+    """
+
+    MERGE_EVERY = 2048
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        # Odd multipliers; the hash is the top 32 bits of a * x + b (mod 2^64)
+        self._a = (rng.randint(0, 1 << 62, size=(num_perm, 1), dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.randint(0, 1 << 62, size=(num_perm, 1), dtype=np.uint64)
+        self._mix = np.arange(1, self.rows + 1, dtype=np.uint64) * _BAND_MIX
+        # Band index goes in the top bits so equal rows in different bands never collide
+        self._band_tag = np.arange(bands, dtype=np.uint64) << np.uint64(56)
+        self._signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.size = 0
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._key_rows = np.zeros(0, dtype=np.int32)
+        self._pending = {}
+
+    def signatures(self, texts) -> np.ndarray:
+        """MinHash signatures (uint32, one row per text)"""
+        texts = list(texts)
+        # Chunked so the (shingles x permutations) matrix stays a few MB
+        chunks = [self._signature_chunk(texts[start:start + 256]) for start in range(0, len(texts), 256)]
+        return np.concatenate(chunks) if chunks else np.zeros((0, self.num_perm), dtype=np.uint32)
+
+    def _signature_chunk(self, texts) -> np.ndarray:
+        hashes, counts = [], []
+        for text in texts:
+            text_shingles = shingles(text) or {""}
+            hashes.extend(zlib.crc32(shingle.encode("utf-8")) for shingle in text_shingles)
+            counts.append(len(text_shingles))
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        # (hash function, shingle) layout keeps each reduction over contiguous memory
+        with np.errstate(over="ignore"):
+            hashed = ((self._a * values + self._b) >> np.uint64(32)).astype(np.uint32)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return np.ascontiguousarray(np.minimum.reduceat(hashed, starts, axis=1).T)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """One uint64 key per band, per signature row"""
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            folded = (banded * self._mix).sum(axis=2)
+        return (folded >> np.uint64(8)) | self._band_tag
+
+    def add_many(self, signatures: np.ndarray):
+        """Appends signatures; rows are numbered in insertion order"""
+        count = len(signatures)
+        if not count:
+            return
+        needed = self.size + count
+        if needed > len(self._signatures):
+            grown = np.zeros((max(needed, 2 * len(self._signatures), 1024), self.num_perm), dtype=np.uint32)
+            grown[:self.size] = self._signatures[:self.size]
+            self._signatures = grown
+        self._signatures[self.size:needed] = signatures
+        keys = self.band_keys(signatures)
+        if count >= self.MERGE_EVERY:
+            # Bulk loads go straight into the sorted arrays
+            self._merge(keys.ravel(), np.repeat(np.arange(self.size, needed, dtype=np.int32), self.bands))
+        else:
+            for offset, row_keys in enumerate(keys.tolist()):
+                for key in row_keys:
+                    self._pending.setdefault(key, []).append(self.size + offset)
+        self.size = needed
+        if len(self._pending) >= self.MERGE_EVERY * self.bands:
+            self._merge()
+
+    def _merge(self, keys=None, rows=None):
+        """Folds pending keys (and any given arrays) into the sorted key array"""
+        parts_keys, parts_rows = [self._keys], [self._key_rows]
+        if self._pending:
+            parts_keys.append(np.fromiter((key for key, rows in self._pending.items() for _ in rows), dtype=np.uint64))
+            parts_rows.append(np.fromiter((row for rows in self._pending.values() for row in rows), dtype=np.int32))
+        if keys is not None:
+            parts_keys.append(keys)
+            parts_rows.append(rows)
+        keys, rows = np.concatenate(parts_keys), np.concatenate(parts_rows)
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._key_rows = keys[order], rows[order]
+        self._pending = {}
+
+    def best(self, signature: np.ndarray):
+        """(row, estimated Jaccard) of the most similar candidate, or (None, 0.0)"""
+        query = self.band_keys(signature[None, :])[0]
+        left = np.searchsorted(self._keys, query, side="left")
+        right = np.searchsorted(self._keys, query, side="right")
+        found = [self._key_rows[start:end] for start, end in zip(left.tolist(), right.tolist()) if end > start]
+        for key in query.tolist():
+            if key in self._pending:
+                found.append(np.asarray(self._pending[key], dtype=np.int32))
+        if not found:
+            return None, 0.0
+        candidates = np.unique(np.concatenate(found))
+        scores = np.count_nonzero(self._signatures[candidates] == signature, axis=1) / self.num_perm
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+
+class EmbeddingIndex:
+    """
+    Unit-normalized embeddings for cosine search.
+
+    Small indexes are searched exactly with one matrix-vector product. Past
+    ``EXACT_UP_TO`` vectors that product is bound by memory bandwidth (the
+    whole float32 matrix is read per query), so each vector also gets a
+    ``bits``-bit sign code from random hyperplanes. Two vectors at angle t
+    differ in about ``bits * t / pi`` code bits, so a cosine threshold maps to
+    a Hamming cutoff (plus a 3 sigma margin). A query XORs the codes (8 bytes
+    per vector per code word), and exact cosines are computed only for the
+    vectors within the cutoff.
+    """
+
+    EXACT_UP_TO = 4096
+    MAX_RERANK = 1024
+
+    def __init__(self, bits: int = 256, seed: int = 1):
+        if bits % 64:
+            raise ValueError("bits must be a multiple of 64")
+        self.bits = bits
+        self.seed = seed
+        self.dimensions = None
+        self._vectors = None
+        # One contiguous array per 64-bit code word: (words, capacity)
+        self._codes = None
+        self._planes = None
+        self.size = 0
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Sign of each random projection, packed into (words, n) uint64"""
+        packed = np.packbits(vectors @ self._planes > 0, axis=1)
+        return np.ascontiguousarray(packed.view(np.uint64).T)
+
+    def hamming_cutoff(self, min_score: float) -> int:
+        """Most code bits two vectors with cosine ``min_score`` are expected to differ in"""
+        p = np.arccos(np.clip(min_score, -1.0, 1.0)) / np.pi
+        return int(np.ceil(self.bits * p + 3 * np.sqrt(self.bits * p * (1 - p))))
+
+    def add_many(self, vectors):
+        vectors = self.normalize(vectors)
+        if self._vectors is None:
+            self.dimensions = vectors.shape[1]
+            self._planes = np.random.RandomState(self.seed).standard_normal((self.dimensions, self.bits)).astype(np.float32)
+            self._vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+            self._codes = np.zeros((self.bits // 64, 0), dtype=np.uint64)
+        needed = self.size + len(vectors)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors), 1024)
+            vectors_grown = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            vectors_grown[:self.size] = self._vectors[:self.size]
+            codes_grown = np.zeros((self.bits // 64, capacity), dtype=np.uint64)
+            codes_grown[:, :self.size] = self._codes[:, :self.size]
+            self._vectors, self._codes = vectors_grown, codes_grown
+        self._vectors[self.size:needed] = vectors
+        self._codes[:, self.size:needed] = self._encode(vectors)
+        self.size = needed
+
+    def best(self, vector, min_score: float = None):
+        """
+        (row, cosine similarity) of the closest stored vector, or (None, 0.0).
+        With ``min_score``, large indexes only rerank vectors that may reach it.
+        """
+        if not self.size:
+            return None, 0.0
+        query = self.normalize(vector)
+        if self.size <= self.EXACT_UP_TO or min_score is None:
+            scores = self._vectors[:self.size] @ query[0]
+            best = int(np.argmax(scores))
+            return best, float(scores[best])
+        query_code = self._encode(query)[:, 0]
+        distances = np.bitwise_count(self._codes[0, :self.size] ^ query_code[0])
+        for word in range(1, len(query_code)):
+            distances += np.bitwise_count(self._codes[word, :self.size] ^ query_code[word])
+        rows = np.flatnonzero(distances <= self.hamming_cutoff(min_score))
+        if not len(rows):
+            return None, 0.0
+        if len(rows) > self.MAX_RERANK:
+            rows = rows[np.argpartition(distances[rows], self.MAX_RERANK)[:self.MAX_RERANK]]
+        scores = self._vectors[rows] @ query[0]
+        best = int(np.argmax(scores))
+        return int(rows[best]), float(scores[best])
+
+
+class GeminiEmbedder:
+    """Embeddings from the Gemini embedding model, through the shared client"""
+
+    def __init__(self, client, model: str = "gemini-embedding-001", dimensions: int = 256):
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.name = f"{model}:{dimensions}"
+
+    def __call__(self, texts) -> np.ndarray:
+        from google.genai import types
+        response = self.client.models.embed_content(
+            model=self.model,
+            contents=list(texts),
+            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY", output_dimensionality=self.dimensions),
+        )
+        return np.asarray([embedding.values for embedding in response.embeddings], dtype=np.float32)
+
+
+class LocalEmbedder:
+    """Embeddings from a local sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model: str = "all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("Local embeddings need sentence-transformers: pip install sentence-transformers") from e
+        self._model = SentenceTransformer(model)
+        self.name = model
+
+    def __call__(self, texts) -> np.ndarray:
+        return np.asarray(self._model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+
+def make_embedder(backend: str, client=None, model: str = None):
+    """
+    The embedder for a DEDUP_EMBEDDINGS value.
+
+    Args:
+        backend: "" / "none" (lexical only), "gemini" or "local"
+        client: Gemini client, for the "gemini" backend
+        model: Embedding model name (default per backend)
+    """
+    if not backend or backend == "none":
+        return None
+    if backend == "gemini":
+        return GeminiEmbedder(client, model) if model else GeminiEmbedder(client)
+    if backend == "local":
+        return LocalEmbedder(model) if model else LocalEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def avoid_context(description: str, match: Match) -> str:
+    """Extra prompt context that steers a regenerated quote away from the duplicate"""
+    avoid = f"Do not repeat this fact, pick a different one: {match.quote}"
+    return f"{description}\n{avoid}" if description else avoid
+
+
+class QuoteDeduper:
+    """
+    Decides whether a new quote repeats a stored one.
+
+    Every quote is checked lexically (MinHash / LSH) first. With an embedder,
+    quotes that pass are embedded and compared by cosine similarity too, to
+    catch the same fact in different words. A new quote is claimed under a
+    lock, so concurrent generations cannot both take the same fact; it is
+    only stored once its post is saved, so a failed image does not burn it.
+
+    With a ``library`` (PostLibrary), ``load()`` seeds the index from every
+    stored post, and signatures and embeddings are kept in the library, so a
+    restart neither rehashes nor re-embeds.
+    """
+
+    def __init__(self, lexical_threshold: float = 0.5, semantic_threshold: float = 0.9, embedder=None,
+                 regenerate_attempts: int = 2, library=None, num_perm: int = 128, bands: int = 32):
+        self.lexical_threshold = lexical_threshold
+        self.semantic_threshold = semantic_threshold
+        self.embedder = embedder
+        # Regenerations before a duplicate is rejected (0 = reject right away)
+        self.regenerate_attempts = regenerate_attempts
+        self.library = library
+        self.minhash = MinHashIndex(num_perm, bands)
+        # Name under which signatures are kept in the library
+        self.minhash_name = f"minhash-{num_perm}"
+        self.embeddings = EmbeddingIndex() if embedder is not None else None
+        self.quotes = []
+        self._keys = set()
+        # Quotes handed out but not yet saved: key -> (quote, signature, unit vector)
+        self._claims = {}
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.duplicates = 0
+        self.check_seconds = 0.0
+
+    def __len__(self):
+        return len(self.quotes)
+
+    def load(self, quotes=None) -> int:
+        """
+        Seeds the index. Quotes default to every post in the library; their
+        signatures and embeddings are read from the library, and any missing
+        ones are computed and stored there.
+
+        Returns:
+            Number of quotes added
+        """
+        if quotes is None:
+            quotes = self.library.quotes() if self.library is not None else []
+        with self._lock:
+            new = []
+            for quote in quotes:
+                key = quote_key(quote) if quote else None
+                if key and key not in self._keys:
+                    self._keys.add(key)
+                    new.append(quote)
+            if new:
+                self.minhash.add_many(self._stored(self.minhash_name, new, self.minhash.signatures, np.uint32))
+                if self.embeddings is not None:
+                    self.embeddings.add_many(self._stored(self.embedder.name, new, self._embed, np.float32))
+                self.quotes.extend(new)
+        return len(new)
+
+    def _embed(self, quotes) -> np.ndarray:
+        return np.concatenate([np.asarray(self.embedder(quotes[start:start + 100]), dtype=np.float32)
+                               for start in range(0, len(quotes), 100)])
+
+    def _stored(self, name: str, quotes, compute, dtype) -> np.ndarray:
+        """Per-quote vectors from the library where it has them; the rest computed and stored"""
+        keys = [quote_key(quote) for quote in quotes]
+        stored = self.library.vectors(name, keys) if self.library is not None else {}
+        missing = [quote for quote, key in zip(quotes, keys) if key not in stored]
+        computed = dict(zip((quote_key(quote) for quote in missing), compute(missing))) if missing else {}
+        if computed and self.library is not None:
+            self.library.put_vectors(name, {key: row.astype(dtype).tobytes() for key, row in computed.items()})
+        return np.stack([computed[key] if key in computed else np.frombuffer(stored[key], dtype=dtype)
+                         for key in keys])
+
+    def check(self, quote: str, claim: bool = False):
+        """
+        Finds the stored or claimed quote this one repeats.
+
+        Args:
+            quote: Newly generated quote
+            claim: Also claim the quote when it is not a duplicate (see claim())
+
+        Returns:
+            Match, or None if the quote is new
+        """
+        start = time.perf_counter()
+        key = quote_key(quote)
+        signature = self.minhash.signatures([quote])
+        # Embedding calls can be slow (network / model); make them before taking the lock
+        vector = self.embeddings.normalize(self._embed([quote])) if self.embeddings is not None else None
+        with self._lock:
+            self.checks += 1
+            match = None
+            if key in self._keys or key in self._claims:
+                match = Match(quote, 1.0, "lexical")
+            if match is None and self.minhash.size:
+                row, score = self.minhash.best(signature[0])
+                if score >= self.lexical_threshold:
+                    match = Match(self.quotes[row], score, "lexical")
+            if match is None and vector is not None:
+                row, score = self.embeddings.best(vector, self.semantic_threshold)
+                if score >= self.semantic_threshold:
+                    match = Match(self.quotes[row], score, "semantic")
+            if match is None:
+                match = self._claimed_match(signature[0], vector)
+            if match is not None:
+                self.duplicates += 1
+            elif claim:
+                self._claims[key] = (quote, signature, vector)
+            self.check_seconds += time.perf_counter() - start
+            return match
+
+    def _claimed_match(self, signature: np.ndarray, vector):
+        """The claimed quote this one repeats; claims are few (one per pipeline in flight)"""
+        for quote, claimed_signature, claimed_vector in self._claims.values():
+            score = np.count_nonzero(claimed_signature[0] == signature) / self.minhash.num_perm
+            if score >= self.lexical_threshold:
+                return Match(quote, score, "lexical")
+            if vector is not None:
+                score = float(claimed_vector[0] @ vector[0])
+                if score >= self.semantic_threshold:
+                    return Match(quote, score, "semantic")
+        return None
+
+    def claim(self, quote: str):
+        """
+        check() that claims the quote when it is new: later checks treat it as
+        stored, so concurrent generations cannot both take the same fact. The
+        claim lives in memory only; add() stores the quote once its post is
+        saved, release() drops it if the post fails.
+        """
+        return self.check(quote, claim=True)
+
+    def add(self, quote: str):
+        """Stores a quote whose post was saved, in the index and the library (claimed or not)"""
+        key = quote_key(quote)
+        with self._lock:
+            claimed = self._claims.pop(key, None)
+        if claimed is None:
+            vector = self.embeddings.normalize(self._embed([quote])) if self.embeddings is not None else None
+            claimed = (quote, self.minhash.signatures([quote]), vector)
+        _, signature, vector = claimed
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.add(key)
+            self.minhash.add_many(signature)
+            self.quotes.append(quote)
+            vectors = {self.minhash_name: signature[0].tobytes()}
+            if vector is not None:
+                self.embeddings.add_many(vector)
+                vectors[self.embedder.name] = vector[0].tobytes()
+        if self.library is not None:
+            for name, data in vectors.items():
+                self.library.put_vectors(name, {key: data})
+
+    def release(self, quote: str):
+        """Drops the claim on a quote whose post was not saved, so the fact can be generated again"""
+        with self._lock:
+            self._claims.pop(quote_key(quote), None)
+
+    def unique(self, generate, quote_of=lambda result: result, description: str = ""):
+        """
+        Calls ``generate(description)`` until its quote is new, regenerating
+        with a hint that names the repeated fact.
+
+        Args:
+            generate: ``generate(description) -> result``
+            quote_of: Extracts the quote from a result; returning None skips the check
+            description: Prompt context for the first attempt
+
+        Returns:
+            The first result whose quote is new; the quote is claimed, and the
+            caller calls add() or release() once its post is saved or fails
+
+        Raises:
+            DuplicateQuoteError: If every attempt repeats a stored fact
+        """
+        result = generate(description)
+        for attempt in range(self.regenerate_attempts + 1):
+            quote = quote_of(result)
+            if quote is None:
+                return result
+            match = self.claim(quote)
+            if match is None:
+                return result
+            if attempt == self.regenerate_attempts:
+                raise DuplicateQuoteError(quote, match)
+            print(f"♻️  Near-duplicate fact ({match.method} {match.score:.2f}), regenerating: {quote[:60]}...")
+            result = generate(avoid_context(description, match))
+        return result
+
+
+def make_deduper(library=None, client=None, enabled: bool = None):
+    """
+    QuoteDeduper configured from the DEDUP_* settings.
+
+    Args:
+        library: PostLibrary to seed from (see load()) and to keep vectors in
+        client: Gemini client, for DEDUP_EMBEDDINGS=gemini
+        enabled: Overrides DEDUP_ENABLED
+
+    Returns:
+        QuoteDeduper, or None when dedup is off
+    """
+    if enabled is None:
+        enabled = settings.DEDUP_ENABLED
+    if not enabled:
+        return None
+    return QuoteDeduper(
+        lexical_threshold=settings.DEDUP_LEXICAL_THRESHOLD_PERCENT / 100,
+        semantic_threshold=settings.DEDUP_SEMANTIC_THRESHOLD_PERCENT / 100,
+        embedder=make_embedder(settings.DEDUP_EMBEDDINGS, client, settings.DEDUP_EMBEDDING_MODEL),
+        regenerate_attempts=settings.DEDUP_REGENERATE_ATTEMPTS,
+        library=library,
+    )
@@ -1,85 +1,308 @@
-import os
-from google import genai
-from dotenv import load_dotenv
+import random
+from google.genai import types
+from pydantic import BaseModel
+from config import settings
+from config.prompts import QUOTE_SYSTEM_PROMPT, SPACE_ENTITIES, CAPTION_SYSTEM_PROMPT, QUOTE_WITH_IMAGE_PROMPT, POST_CONTENT_PROMPT
+from services.gemini_client import get_client
+from services.resilience import with_resilience
 
-load_dotenv(override=True)
 
-from config.prompts import QUOTE_SYSTEM_PROMPT, SPACE_ENTITIES, CAPTION_SYSTEM_PROMPT
+class QuoteWithImagePrompt(BaseModel):
+    """Response schema of the combined quote + image prompt call"""
+    quote: str
+    image_prompt: str
+
+
+class PostContent(BaseModel):
+    """Response schema of the single structured call that writes a whole post"""
+    quote: str
+    caption: str
+    image_prompt: str
+    progression_text: str = ""
+
+
+# Stand-ins returned when the model call fails; never worth keeping as a finished post
+FALLBACK_QUOTE = "Space is vast and full of mysteries."
+
+
+def fallback_caption(quote: str) -> str:
+    """Generic caption used when the caption call fails"""
+    return f"✨ {quote} ✨\n\n#space #universe #cosmos"
+
+
+def is_fallback_post(quote: str, caption: str) -> bool:
+    """True if the quote or the caption is a fallback stand-in rather than model output"""
+    return quote == FALLBACK_QUOTE or caption == fallback_caption(quote)
+
+
+def clean_quote(text: str) -> str:
+    """Strips whitespace and a leading "Fun fact:" from model output"""
+    cleaned_text = text.strip()
+    if cleaned_text.lower().startswith("fun fact:"):
+        cleaned_text = cleaned_text[9:].strip()
+    return cleaned_text
+
 
 class QuoteService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+    def __init__(self, client=None, deduper=None):
+        # Use the injected client, or the shared pooled one with retries
+        self.client = client if client is not None else with_resilience(get_client())
+        # Optional QuoteDeduper: near-duplicate facts are regenerated or rejected
+        self.deduper = deduper
+        if self.client is None:
             print("ERROR: GEMINI_API_KEY not found in environment variables.")
             print("Please set GEMINI_API_KEY in your .env file or environment variables.")
-            self.client = None
         else:
-            try:
-                # Initialize the client with the API key
-                self.client = genai.Client(api_key=self.api_key)
-                print("✅ QuoteService initialized successfully with API key")
-            except Exception as e:
-                print(f"ERROR: Failed to initialize Gemini client: {e}")
-                self.client = None
+            print("✅ QuoteService initialized successfully with API key")
+
+    @staticmethod
+    def resolve_entity(prompt: str) -> str:
+        """The prompt itself, or a random entity for an empty / 'random' prompt"""
+        entity = prompt.strip()
+        if not entity or entity.lower() == "random":
+            entity = random.choice(SPACE_ENTITIES)
+        return entity
+
+    def _unique(self, generate, description: str, quote_of=lambda result: result):
+        """
+        Runs ``generate(description)`` through the deduper, if there is one; a
+        new quote stays claimed until keep_quote() or release_quote(). The
+        fallback fact is never checked or claimed: during an outage every
+        request falls back to it, and each should get the degraded post.
+        """
+        if self.deduper is None:
+            return generate(description)
+
+        def checked_quote(result):
+            quote = quote_of(result)
+            return None if quote == FALLBACK_QUOTE else quote
+
+        return self.deduper.unique(generate, checked_quote, description)
+
+    def keep_quote(self, quote: str, caption: str = None):
+        """
+        Stores a claimed quote in the deduper once its post is saved; a
+        fallback post is not stored (its claim, if any, is dropped)
+        """
+        if self.deduper is None or not quote:
+            return
+        if is_fallback_post(quote, caption):
+            self.deduper.release(quote)
+        else:
+            self.deduper.add(quote)
+
+    def release_quote(self, quote: str):
+        """Drops the deduper's claim on a quote whose post failed"""
+        if self.deduper is not None and quote:
+            self.deduper.release(quote)
 
     def generate_quote(self, prompt: str, description: str = "") -> str:
         """
         Generates a space fact. If prompt is 'random', picks a random entity.
         Otherwise uses the prompt as the entity.
+
+        Raises:
+            DuplicateQuoteError: If a deduper is set and every attempt repeats a stored fact
         """
+        entity = self.resolve_entity(prompt)
+        return self._unique(lambda context: self._generate_quote(entity, context), description)
+
+    def _generate_quote(self, prompt: str, description: str = "") -> str:
         if not self.client:
             print("ERROR: GEMINI_API_KEY not found. Cannot generate quote.")
-            return "Space is vast and full of mysteries."
+            return FALLBACK_QUOTE
         
         try:
-            entity = prompt.strip()
-            if not entity or entity.lower() == "random":
-                import random
-                entity = random.choice(SPACE_ENTITIES)
+            entity = self.resolve_entity(prompt)
             
             # Inject entity into system prompt template
             formatted_system_prompt = QUOTE_SYSTEM_PROMPT.replace("{{entity}}", entity)
-            
-            full_prompt = f"{formatted_system_prompt}\n\nContext: {description}" if description else formatted_system_prompt
+            full_prompt = self._with_context(formatted_system_prompt, description)
 
             print(f"Generating quote for entity: {entity}")
-            print(f"Using model: gemini-2.5-flash")
+            print(f"Using model: {settings.TEXT_MODEL}")
             
             response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+                model=settings.TEXT_MODEL,
                 contents=[full_prompt]
             )
             
             if not response or not hasattr(response, 'text'):
                 print("ERROR: Invalid response from API")
-                return "Space is vast and full of mysteries."
+                return FALLBACK_QUOTE
             
-            cleaned_text = response.text.strip()
-            if cleaned_text.lower().startswith("fun fact:"):
-                cleaned_text = cleaned_text[9:].strip()
+            cleaned_text = clean_quote(response.text)
             print(f"Generated quote: {cleaned_text[:50]}...")
             return cleaned_text
         except Exception as e:
-            print(f"Error generating fact: {e}")
+            print(f"⚠️  Fact generation failed after retries, using fallback fact: {e}")
             import traceback
             traceback.print_exc()
-            return "Space is vast and full of mysteries."
+            return FALLBACK_QUOTE
 
-    def generate_caption(self, quote: str) -> str:
+    @staticmethod
+    def _with_context(prompt: str, description: str) -> str:
+        return f"{prompt}\n\nContext: {description}" if description else prompt
+
+    def generate_quote_with_image_prompt(self, prompt: str, description: str = "") -> dict:
+        """
+        Generates the fact and its image prompt in one JSON-constrained call,
+        saving the separate image prompt expansion.
+
+        Args:
+            prompt: Entity to generate a fact about, or "random"
+            description: Optional extra context for the quote
+
+        Returns:
+            Dict with "quote" and "image_prompt"; "image_prompt" is None when the
+            structured call failed and the quote came from generate_quote instead
+
+        Raises:
+            DuplicateQuoteError: If a deduper is set and every attempt repeats a stored fact
+        """
+        entity = self.resolve_entity(prompt)
+        return self._unique(lambda context: self._generate_quote_with_image_prompt(entity, context), description,
+                            lambda result: result["quote"])
+
+    def _generate_quote_with_image_prompt(self, entity: str, description: str) -> dict:
+        if not self.client:
+            return {"quote": self._generate_quote(entity, description), "image_prompt": None}
+
+        try:
+            print(f"Generating quote and image prompt for entity: {entity}")
+            response = self.client.models.generate_content(
+                model=settings.TEXT_MODEL,
+                contents=[self._with_context(QUOTE_WITH_IMAGE_PROMPT.replace("{{entity}}", entity), description)],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=QuoteWithImagePrompt,
+                ),
+            )
+            # Parse the text rather than response.parsed so cached responses work too
+            parsed = QuoteWithImagePrompt.model_validate_json(response.text)
+            quote = clean_quote(parsed.quote)
+            if not quote or not parsed.image_prompt.strip():
+                raise ValueError("empty quote or image prompt")
+            print(f"Generated quote: {quote[:50]}...")
+            return {"quote": quote, "image_prompt": parsed.image_prompt.strip()}
+        except Exception as e:
+            print(f"⚠️  Combined quote/image prompt call failed, generating the quote alone: {e}")
+            return {"quote": self._generate_quote(entity, description), "image_prompt": None}
+
+    def post_request(self, prompt: str, description: str = ""):
+        """
+        The contents and config of the structured post call, for batch submission.
+
+        Returns:
+            (contents, config) tuple for generate_content
+        """
+        entity = self.resolve_entity(prompt)
+        contents = [self._with_context(POST_CONTENT_PROMPT.replace("{{entity}}", entity), description)]
+        config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=PostContent)
+        return contents, config
+
+    @staticmethod
+    def parse_post(text: str) -> dict:
+        """
+        Validates the JSON output of the structured post call.
+
+        Raises:
+            ValueError: If the output is not valid PostContent or a field is empty
+        """
+        post = PostContent.model_validate_json(text or "")
+        result = {
+            "quote": clean_quote(post.quote),
+            "caption": post.caption.strip(),
+            "image_prompt": post.image_prompt.strip(),
+            "progression_text": post.progression_text.strip(),
+        }
+        if not (result["quote"] and result["caption"] and result["image_prompt"]):
+            raise ValueError("empty field in structured output")
+        return result
+
+    def generate_post(self, prompt: str, description: str = ""):
+        """
+        Writes the fact, caption, image prompt and progression text in one
+        JSON-schema-constrained call instead of three separate text calls.
+
+        Args:
+            prompt: Entity to generate a fact about, or "random"
+            description: Optional extra context for the quote
+
+        Returns:
+            Dict with "quote", "caption", "image_prompt" and "progression_text",
+            or None if the call failed or its output did not validate; callers
+            then fall back to generate_quote / generate_caption
+
+        Raises:
+            DuplicateQuoteError: If a deduper is set and every attempt repeats a stored fact
+        """
+        entity = self.resolve_entity(prompt)
+        return self._unique(lambda context: self._generate_post(entity, context), description,
+                            lambda result: result["quote"] if result else None)
+
+    def _generate_post(self, entity: str, description: str):
+        if not self.client:
+            return None
+
+        try:
+            print(f"Generating post content for entity: {entity}")
+            contents, config = self.post_request(entity, description)
+            response = self.client.models.generate_content(model=settings.TEXT_MODEL, contents=contents, config=config)
+            result = self.parse_post(response.text)
+            print(f"Generated quote: {result['quote'][:50]}...")
+            return result
+        except Exception as e:
+            print(f"⚠️  Structured post call failed, falling back to separate calls: {e}")
+            return None
+
+    def generate_caption(self, quote: str, fallback: bool = True) -> str:
         """
         Generates an engaging Instagram caption for the quote.
+        
+        With ``fallback=False`` a failed call raises instead of returning the
+        generic fallback caption (for backfills that must not record it).
         """
         if not self.client:
-            return f"✨ {quote} ✨\n\n#space #universe #cosmos"
+            if not fallback:
+                raise RuntimeError("GEMINI_API_KEY not found. Cannot generate caption.")
+            return fallback_caption(quote)
         
         try:
             prompt = CAPTION_SYSTEM_PROMPT.replace("{{quote}}", quote)
             
             response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+                model=settings.TEXT_MODEL,
                 contents=[prompt]
             )
             return response.text.strip()
         except Exception as e:
-            print(f"Error generating caption: {e}")
-            return f"✨ {quote} ✨\n\n#space #universe #cosmos"
+            if not fallback:
+                raise
+            print(f"⚠️  Caption generation failed after retries, using fallback caption: {e}")
+            return fallback_caption(quote)
+
+    def stream_caption(self, quote: str):
+        """
+        Generates the Instagram caption for the quote, yielding text chunks as
+        the model produces them. Joining the chunks gives the full caption.
+        """
+        if not self.client:
+            yield fallback_caption(quote)
+            return
+        
+        streamed_any = False
+        try:
+            prompt = CAPTION_SYSTEM_PROMPT.replace("{{quote}}", quote)
+            
+            for chunk in self.client.models.generate_content_stream(
+                model=settings.TEXT_MODEL,
+                contents=[prompt]
+            ):
+                if chunk.text:
+                    streamed_any = True
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error streaming caption: {e}")
+            if not streamed_any:
+                yield fallback_caption(quote)
@@ -0,0 +1,146 @@
+"""
+Rate Limiting
+Per-model token buckets with adaptive backoff on 429 / RESOURCE_EXHAUSTED responses,
+and a Gemini client wrapper that applies them to every model call.
+"""
+import random
+import threading
+import time
+from services.resilience import is_rate_limit_error, retry_after_seconds
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``rate`` is tokens per second and can change at runtime"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ModelLimiter:
+    """
+    Request limiter for one model.
+
+    Starts at the configured requests per minute. A throttling response halves
+    the rate and blocks all callers for a backoff period (the server's
+    Retry-After when given, otherwise exponential with jitter); each success
+    then raises the rate by a step until it is back at the configured limit.
+    """
+
+    def __init__(self, model: str, rpm: float, burst: int = None, min_rpm: float = 1,
+                 initial_backoff: float = 2.0, max_backoff: float = 60.0):
+        self.model = model
+        self.max_rate = rpm / 60.0
+        self.min_rate = min(min_rpm, rpm) / 60.0
+        self.bucket = TokenBucket(self.max_rate, burst or max(1, int(rpm // 10)))
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._backoff = initial_backoff
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    @property
+    def rpm(self) -> float:
+        return self.bucket.rate * 60
+
+    def acquire(self):
+        """Waits out any active backoff, then takes a token"""
+        while True:
+            wait = self._blocked_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        self.bucket.acquire()
+
+    def on_success(self):
+        with self._lock:
+            self._backoff = self.initial_backoff
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * 0.05)
+
+    def on_throttled(self, retry_after: float = None):
+        with self._lock:
+            self.throttled += 1
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            delay = retry_after if retry_after is not None else self._backoff * random.uniform(0.5, 1.5)
+            self._backoff = min(self.max_backoff, self._backoff * 2)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        print(f"⏳ {self.model} throttled, backing off {delay:.1f}s (now {self.rpm:.1f} rpm)")
+
+
+class RateLimiter:
+    """Holds one ModelLimiter per model; models without a configured limit are not limited"""
+
+    def __init__(self, limits: dict):
+        self.limiters = {model: ModelLimiter(model, rpm) for model, rpm in limits.items() if rpm and rpm > 0}
+
+    def for_model(self, model: str):
+        return self.limiters.get(model)
+
+
+class _RateLimitedModels:
+    def __init__(self, models, limiter: RateLimiter, max_retries: int):
+        self._models = models
+        self._limiter = limiter
+        self._max_retries = max_retries
+
+    def generate_content(self, *, model, **kwargs):
+        limiter = self._limiter.for_model(model)
+        if limiter is None:
+            return self._models.generate_content(model=model, **kwargs)
+        for attempt in range(self._max_retries + 1):
+            limiter.acquire()
+            try:
+                response = self._models.generate_content(model=model, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self._max_retries:
+                    raise
+                limiter.on_throttled(retry_after_seconds(e))
+                continue
+            limiter.on_success()
+            return response
+
+    def generate_content_stream(self, *, model, **kwargs):
+        limiter = self._limiter.for_model(model)
+        if limiter is not None:
+            limiter.acquire()
+        return self._models.generate_content_stream(model=model, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RateLimitedClient:
+    """
+    Wraps a genai.Client so ``client.models.generate_content`` waits for a token
+    from the model's limiter and retries throttled calls after backing off.
+    Everything else is passed through to the wrapped client.
+    """
+
+    def __init__(self, client, limiter: RateLimiter, max_retries: int = 5):
+        self._client = client
+        self.limiter = limiter
+        self.models = _RateLimitedModels(client.models, limiter, max_retries)
+
+    def handles_rate_limits(self, model: str) -> bool:
+        """True if throttled calls to ``model`` are already backed off and retried here"""
+        return self.limiter.for_model(model) is not None
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
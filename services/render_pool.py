@@ -0,0 +1,257 @@
+"""
+Render Pool
+CPU-bound image work in worker processes: each process sets up its own services once
+(fonts loaded, pooled client) and then overlays, encodes or fully renders posts.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from PIL import Image
+from config import settings
+from config.fonts import font_registry
+from services.image_dedup import image_hash
+from services.image_metadata import variant_metadata
+from services.text_overlay_service import TextOverlayService, EncodedImage, output_ext
+
+logger = logging.getLogger(__name__)
+
+# Per-process state filled in by the pool initializers
+_worker = {}
+
+
+def placeholder_image(seed: str, size=(1080, 1920)) -> Image.Image:
+    """Deterministic vertical gradient used instead of the image model in offline runs"""
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    top = Image.new("RGB", size, tuple(digest[0:3]))
+    bottom = Image.new("RGB", size, (digest[3] // 8, digest[4] // 8, digest[5] // 4))
+    mask = Image.linear_gradient("L").resize(size)
+    return Image.composite(bottom, top, mask)
+
+
+def write_variants(overlay: TextOverlayService, image: Image.Image, quote: str, variants, path_stem: str,
+                   encode_options: dict, metadata: dict = None) -> dict:
+    """
+    Renders the named variants of a clean generated image and writes each one
+    to ``{path_stem}_{variant}.{ext}``, with ``metadata`` embedded. Call before
+    drawing on ``image`` in place.
+
+    Returns:
+        Dict of variant name -> file path
+    """
+    ext = output_ext(encode_options.get("format", "png"))
+    paths = {}
+    for name, variant_image in overlay.render_variants(image, quote, variants).items():
+        paths[name] = f"{path_stem}_{name}.{ext}"
+        with open(paths[name], "wb") as f:
+            overlay.encode_to(variant_image, f, metadata=variant_metadata(metadata, name), **encode_options)
+    return paths
+
+
+def init_batch_worker(offline: bool, image_rpm: float, encode_options: dict, variants: tuple = ()):
+    """
+    ProcessPoolExecutor initializer for bulk runs.
+
+    Args:
+        offline: Render placeholder images instead of calling the image model
+        image_rpm: This process's share of the image model budget (0 = unlimited)
+        encode_options: Keyword arguments for TextOverlayService.encode
+        variants: Extra placements to write next to each image (see write_variants)
+    """
+    font_registry.load_bundled()
+    _worker["overlay"] = TextOverlayService()
+    _worker["encode_options"] = encode_options or {}
+    _worker["variants"] = tuple(variants)
+    _worker["image_service"] = None
+    if not offline:
+        # Imported here so offline workers never touch the Gemini SDK
+        from services.gemini_client import get_client
+        from services.image_service import ImageService
+        from services.rate_limit import RateLimiter, RateLimitedClient
+        from services.resilience import with_resilience
+        client = get_client()
+        if client is not None:
+            client = with_resilience(RateLimitedClient(client, RateLimiter({settings.IMAGE_MODEL: image_rpm})))
+        _worker["image_service"] = ImageService(client)
+
+
+def render_post(task: dict) -> dict:
+    """
+    Generates the image for one post, overlays the quote and writes the encoded file.
+
+    Args:
+        task: Dict with "quote", "image_prompt", "path_stem" (output path
+            without extension; the encoder picks the extension) and optionally
+            "metadata" to embed in the files
+
+    Returns:
+        Dict with "path", "size", "encode_seconds", "variants" ({name: path})
+        and "image_hash" (perceptual hash of the generated image, before the overlay)
+    """
+    image_service = _worker["image_service"]
+    if image_service is None:
+        image = placeholder_image(task["image_prompt"])
+    else:
+        image = image_service.render_image(task["image_prompt"])
+    # Hashed here, where the pixels are; the parent process checks it against the library
+    value = image_hash(image)
+    metadata = dict(task["metadata"], image_hash=value) if task.get("metadata") else None
+    overlay = _worker["overlay"]
+    encode_options = _worker["encode_options"]
+    variant_paths = {}
+    if _worker["variants"]:
+        variant_paths = write_variants(overlay, image, task["quote"], _worker["variants"], task["path_stem"],
+                                       encode_options, metadata)
+    final_image = overlay.overlay_text(image, task["quote"], in_place=True)
+    path = f"{task['path_stem']}.{output_ext(encode_options.get('format', 'png'))}"
+    # Stream the encoder output straight to disk rather than through a bytes object
+    with open(path, "wb") as f:
+        encoded = overlay.encode_to(final_image, f, metadata=metadata, **encode_options)
+    return {"path": path, "size": encoded.size, "encode_seconds": encoded.encode_seconds, "variants": variant_paths,
+            "image_hash": value}
+
+
+def init_render_worker():
+    """ProcessPoolExecutor initializer for the server's overlay/encode pool"""
+    font_registry.load_bundled()
+    _worker["overlay"] = TextOverlayService()
+
+
+def _warm_up() -> bool:
+    return "overlay" in _worker
+
+
+def _encoded_fields(encoded: EncodedImage) -> dict:
+    return {
+        "data": encoded.data,
+        "format": encoded.format,
+        "quality": encoded.quality,
+        "encode_seconds": encoded.encode_seconds,
+        "attempts": encoded.attempts,
+    }
+
+
+def _attach_shared(name: str) -> shared_memory.SharedMemory:
+    """
+    Opens a block the parent created. The parent owns (and unlinks) it, so the
+    worker does not track it: on 3.13+ it says so; before that, attaching
+    registers the name with the resource tracker, which RenderPool.start
+    makes the parent's own, so the extra registration is a no-op there.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def overlay_encode_shared(shm_name: str, size: tuple, quote: str, encode_options: dict, overlay_options: dict,
+                          variants: tuple = ()) -> dict:
+    """
+    Worker side of RenderPool.overlay_and_encode: reads the RGB pixels from the
+    shared memory block, renders any variants from the clean pixels, then draws
+    the quote and encodes the result.
+
+    Returns:
+        Dict with "image" (EncodedImage fields) and "variants" ({name: fields})
+    """
+    shm = _attach_shared(shm_name)
+    try:
+        # Pillow keeps RGB at 4 bytes per pixel, so this unpacks into a writable image of our own
+        image = Image.frombuffer("RGB", size, shm.buf, "raw", "RGB", 0, 1)
+    finally:
+        shm.close()
+    overlay = _worker["overlay"]
+    variant_images = overlay.render_variants(image, quote, variants, **overlay_options) if variants else {}
+    final_image = overlay.overlay_text(image, quote, in_place=True, **overlay_options)
+    encode_options = dict(encode_options)
+    metadata = encode_options.pop("metadata", None)
+    return {
+        "image": _encoded_fields(overlay.encode(final_image, metadata=metadata, **encode_options)),
+        "variants": {name: _encoded_fields(overlay.encode(item, metadata=variant_metadata(metadata, name), **encode_options))
+                     for name, item in variant_images.items()},
+    }
+
+
+class RenderPool:
+    """
+    Runs overlay + encode in a ProcessPoolExecutor so CPU work scales with cores
+    instead of queueing behind one interpreter's GIL.
+
+    Workers are started and have their fonts loaded in start(), before the first
+    request. Pixels go to the worker through a shared memory block rather than
+    as a pickled PIL image; only the encoded bytes come back.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = max(1, processes)
+        self._executor = None
+
+    def start(self):
+        """Spawns the workers and waits until each has loaded its fonts"""
+        if self._executor is not None:
+            return
+        if os.name == "posix":
+            # Workers inherit a running tracker; one they started themselves would
+            # report every block they attached to as leaked when they exit
+            resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=init_render_worker)
+        # One task per worker forces every process to spawn and run its initializer now
+        for future in [self._executor.submit(_warm_up) for _ in range(self.processes)]:
+            future.result()
+        logger.info(f"Render pool ready: {self.processes} process(es)")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def _share(image: Image.Image):
+        """Copies the RGB pixels into a new shared memory block"""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        pixels = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=len(pixels))
+        shm.buf[:len(pixels)] = pixels
+        return shm, image.size
+
+    async def overlay_and_encode(self, image: Image.Image, quote: str, encode_options: dict = None,
+                                 **overlay_options) -> EncodedImage:
+        """
+        Draws the quote on the image and encodes it in a worker process.
+
+        Args:
+            image: Generated image (converted to RGB if needed)
+            quote: Text to overlay
+            encode_options: Keyword arguments for TextOverlayService.encode
+            **overlay_options: Keyword arguments for TextOverlayService.overlay_text
+
+        Returns:
+            EncodedImage
+        """
+        encoded, _ = await self.overlay_and_encode_variants(image, quote, (), encode_options, **overlay_options)
+        return encoded
+
+    async def overlay_and_encode_variants(self, image: Image.Image, quote: str, variants, encode_options: dict = None,
+                                          **overlay_options):
+        """
+        Like overlay_and_encode, and also renders and encodes the named variants
+        (see TextOverlayService.render_variants) from the same shared pixels.
+
+        Returns:
+            (EncodedImage, {variant name: EncodedImage})
+        """
+        shm, size = await asyncio.to_thread(self._share, image)
+        try:
+            loop = asyncio.get_running_loop()
+            output = await loop.run_in_executor(
+                self._executor, overlay_encode_shared,
+                shm.name, size, quote, encode_options or {}, overlay_options, tuple(variants),
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+        return (EncodedImage(**output["image"]),
+                {name: EncodedImage(**fields) for name, fields in output["variants"].items()})
@@ -0,0 +1,343 @@
+"""
+Resilience
+Retries with exponential backoff and jitter, per-call deadlines, per-model circuit
+breakers and optional hedged requests for every Gemini model call.
+"""
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import httpx
+from config import settings
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a model call (including retries) runs past its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while a model's circuit breaker is open"""
+
+
+def _status_code(error: Exception):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if the error is a quota / rate limit response (HTTP 429, RESOURCE_EXHAUSTED)"""
+    if _status_code(error) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED":
+        return True
+    # A bare "429" in the text may be an id or a byte count; the status name is not ambiguous
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_after_seconds(error: Exception):
+    """Server-suggested wait from a Retry-After header or a "retryDelay" hint, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def is_server_failure(error: Exception) -> bool:
+    """Errors that say the API is unhealthy: 5xx, timeouts and connection failures"""
+    if isinstance(error, (DeadlineExceeded, TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    code = _status_code(error)
+    return code is not None and code >= 500
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, request timeouts (408) and server-side failures are worth retrying"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    return is_rate_limit_error(error) or _status_code(error) == 408 or is_server_failure(error)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped, preferring the server's Retry-After"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 30.0, multiplier: float = 2.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int, error: Exception = None) -> float:
+        """Seconds to wait before retry number ``attempt`` (1-based)"""
+        hinted = retry_after_seconds(error) if error is not None else None
+        if hinted is not None:
+            return min(self.max_delay, hinted)
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Tracks the failure rate of the last ``window`` calls to one model.
+
+    Opens when at least ``min_calls`` were seen and the failure rate reaches
+    ``failure_rate``; while open, calls fail immediately. After ``open_seconds``
+    one probe call is let through (half-open): success closes the breaker,
+    failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 10, window: int = 20, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raises CircuitOpenError if the call must not go out"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise CircuitOpenError(f"Circuit for {self.name} is open; failing fast")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f"Circuit for {self.name} is half-open; probe in flight")
+                self._probe_in_flight = True
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    print(f"OK: Circuit for {self.name} closed")
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        print(f"⚠️  Circuit for {self.name} opened for {self.open_seconds:.0f}s")
+
+
+class _AttemptPool:
+    """
+    The shared thread pool attempts run on, so a blocking SDK call can be
+    abandoned at its deadline. An abandoned attempt (deadline passed, hedge
+    race lost) keeps its worker until the SDK call returns, so the pool counts
+    them: hedges are only sent while a worker is idle, and once every worker
+    is held by abandoned attempts new calls fail fast instead of queueing
+    behind dead work.
+    """
+
+    def __init__(self, max_workers: int = 32):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+        self._lock = threading.Lock()
+        self._abandoned = set()
+        self.running = 0
+
+    def submit(self, model: str, func):
+        with self._lock:
+            if len(self._abandoned) >= self.max_workers:
+                raise DeadlineExceeded(f"{model}: all {self.max_workers} model call workers are held by "
+                                       f"abandoned attempts; failing fast")
+            self.running += 1
+        future = self._executor.submit(func)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self.running -= 1
+            self._abandoned.discard(future)
+
+    def abandon(self, futures):
+        """Marks attempts nobody waits for any more; they count until they finish"""
+        with self._lock:
+            self._abandoned.update(future for future in futures if not future.done())
+
+    def has_idle_worker(self) -> bool:
+        with self._lock:
+            return self.running < self.max_workers
+
+    @property
+    def abandoned(self) -> int:
+        with self._lock:
+            return len(self._abandoned)
+
+
+_pool = _AttemptPool()
+
+
+class _ResilientModels:
+    def __init__(self, models, client):
+        self._models = models
+        self._client = client
+
+    def generate_content(self, *, model, **kwargs):
+        return self._client.call(model, lambda: self._models.generate_content(model=model, **kwargs))
+
+    def generate_content_stream(self, *, model, **kwargs):
+        # A half-consumed stream cannot be replayed, so streams only get the breaker check
+        breaker = self._client.breaker(model)
+        breaker.allow()
+        try:
+            stream = self._models.generate_content_stream(model=model, **kwargs)
+        except Exception as e:
+            breaker.record(not is_server_failure(e))
+            raise
+        breaker.record(True)
+        return stream
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class ResilientClient:
+    """
+    Wraps a genai.Client so every ``client.models.generate_content`` call gets
+    retries (RetryPolicy), a deadline per logical call, a per-model circuit
+    breaker and, for models listed in ``hedge_models``, a hedged second request
+    if the first has not answered after ``hedge_delay`` seconds.
+    """
+
+    def __init__(self, client, retry_policy: RetryPolicy = None, deadlines: dict = None, default_deadline: float = 120.0,
+                 breaker_options: dict = None, hedge_models=(), hedge_delay: float = 0.0):
+        self._client = client
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+        self.breaker_options = breaker_options or {}
+        self.hedge_models = set(hedge_models)
+        self.hedge_delay = hedge_delay
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.models = _ResilientModels(client.models, self)
+        # A RateLimitedClient underneath owns 429 retries for its limited models
+        self._handles_rate_limits = getattr(client, "handles_rate_limits", None)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(model, **self.breaker_options)
+            return self._breakers[model]
+
+    def call(self, model: str, func):
+        """Runs ``func`` under the model's deadline, breaker, retry and hedging policy"""
+        deadline = time.monotonic() + self.deadlines.get(model, self.default_deadline)
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.allow()
+            try:
+                result = self._attempt(model, func, deadline)
+            except Exception as e:
+                breaker.record(not is_server_failure(e))
+                remaining = deadline - time.monotonic()
+                if isinstance(e, DeadlineExceeded) or not self._retryable(model, e) or attempt >= self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.delay(attempt, e)
+                if delay >= remaining:
+                    raise DeadlineExceeded(f"{model}: no time left to retry after: {e}") from e
+                print(f"Attempt {attempt} for {model} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            breaker.record(True)
+            return result
+
+    def _retryable(self, model: str, error: Exception) -> bool:
+        if is_rate_limit_error(error) and self._handles_rate_limits is not None and self._handles_rate_limits(model):
+            # The rate limiter below has already spent its retries on this quota error
+            return False
+        return is_retryable(error)
+
+    def _attempt(self, model: str, func, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{model}: deadline exceeded")
+        primary = _pool.submit(model, func)
+        if model in self.hedge_models and self.hedge_delay:
+            # Hedged: give the first request a head start, then race a second one
+            done, _ = wait([primary], timeout=min(self.hedge_delay, remaining))
+            if done:
+                return primary.result()
+            # A hedge that would queue behind busy workers only adds load
+            if _pool.has_idle_worker():
+                return self._race(model, [primary, _pool.submit(model, func)], deadline)
+            remaining = deadline - time.monotonic()
+        try:
+            return primary.result(timeout=max(0, remaining))
+        except FutureTimeoutError:
+            _pool.abandon([primary])
+            raise DeadlineExceeded(f"{model}: no response within the deadline")
+
+    @staticmethod
+    def _race(model: str, futures, deadline: float):
+        """First successful result of the hedged attempts; the losers are abandoned"""
+        error = None
+        while futures:
+            remaining = deadline - time.monotonic()
+            done, pending = wait(futures, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                _pool.abandon(pending)
+                raise DeadlineExceeded(f"{model}: no response within the deadline (hedged)")
+            for future in done:
+                if future.exception() is None:
+                    _pool.abandon(pending)
+                    return future.result()
+                error = future.exception()
+            futures = list(pending)
+        raise error
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def with_resilience(client):
+    """Wraps a client with the retry/deadline/breaker/hedging policy from settings"""
+    if client is None:
+        return None
+    return ResilientClient(
+        client,
+        retry_policy=RetryPolicy(
+            max_attempts=settings.MODEL_MAX_ATTEMPTS,
+            base_delay=settings.MODEL_RETRY_BASE_MS / 1000,
+            max_delay=settings.MODEL_RETRY_MAX_SECONDS,
+        ),
+        deadlines={
+            settings.TEXT_MODEL: settings.TEXT_CALL_DEADLINE_SECONDS,
+            settings.IMAGE_MODEL: settings.IMAGE_CALL_DEADLINE_SECONDS,
+        },
+        breaker_options={
+            "failure_rate": settings.BREAKER_FAILURE_RATE_PERCENT / 100,
+            "min_calls": settings.BREAKER_MIN_CALLS,
+            "window": settings.BREAKER_WINDOW,
+            "open_seconds": settings.BREAKER_OPEN_SECONDS,
+        },
+        hedge_models=[settings.TEXT_MODEL],
+        hedge_delay=settings.TEXT_HEDGE_DELAY_MS / 1000,
+    )
@@ -3,15 +3,80 @@ Text Overlay Service
 Handles overlaying text on images with proper formatting and styling.
 """
 import io
+import time
 import base64
 from PIL import Image, ImageDraw
-from config.utils import get_ubuntu_font, draw_text_with_shadow, wrap_text
+from config.utils import get_ubuntu_font, wrap_text
+from config.text_layout import fit_font_size, line_height_for
+from config.compositor import composite_text, DEFAULT_STYLE
+from config.framing import VARIANTS, fit_to_size, draft_thumbnail
+from services.image_metadata import metadata_save_params
+
+# Output format name -> (Pillow format, MIME type, file extension)
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+MIME_TO_FORMAT = {mime: name for name, (_, mime, _) in OUTPUT_FORMATS.items()}
+
+# Lowest quality the size-targeted search will go to
+MIN_QUALITY = 40
+
+
+def output_ext(format: str) -> str:
+    """File extension for an output format name ("png", "jpeg", "jpg", "webp")"""
+    format = FORMAT_ALIASES.get(format.lower(), format.lower())
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {format}")
+    return OUTPUT_FORMATS[format][2]
+
+
+class EncodedImage:
+    """
+    Encoded image bytes plus what was used to produce them. ``data`` is None
+    when the encoder wrote straight to a file (see encode_to); ``size`` is
+    then the number of bytes written.
+    """
+
+    def __init__(self, data: bytes, format: str, quality, encode_seconds: float, attempts: int = 1, size: int = None):
+        self.data = data
+        self.format = format
+        self.mime_type = OUTPUT_FORMATS[format][1]
+        self.ext = OUTPUT_FORMATS[format][2]
+        self.quality = quality
+        self.encode_seconds = encode_seconds
+        self.attempts = attempts
+        self._size = size
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else self._size
+
+
+class _CountingWriter:
+    """Forwards writes to a file object and counts the bytes"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self.written = 0
+
+    def write(self, data) -> int:
+        self._fp.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self):
+        self._fp.flush()
 
 
 class TextOverlayService:
     """Service for overlaying text on images"""
     
-    def overlay_text(self, image: Image.Image, quote: str, position: str = "bottom_center") -> Image.Image:
+    def overlay_text(self, image: Image.Image, quote: str, position: str = "bottom_center",
+                     wrap_strategy: str = "greedy", max_text_height: float = None,
+                     style=DEFAULT_STYLE, in_place: bool = False) -> Image.Image:
         """
         Overlays text on an image.
         
@@ -19,29 +84,40 @@ class TextOverlayService:
             image: PIL Image object to overlay text on
             quote: Text to overlay
             position: Position of text ("bottom_center", "center", "top_center")
+            wrap_strategy: "greedy" (original line breaks) or "balanced" (even line lengths)
+            max_text_height: Optional fraction of the image height the text block may
+                use; the font shrinks until the wrapped text fits
+            style: TextStyle (fill, shadow, soft shadow blur, outline, scrim)
+            in_place: Draw directly on ``image`` when it is already RGB and the
+                caller does not need the original
         
         Returns:
             PIL Image with text overlaid
         """
-        # Ensure image is mutable and in RGB mode
+        # Ensure image is mutable and in RGB mode (convert already returns a new image)
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        image = image.copy()
+        elif not in_place:
+            image = image.copy()
         
         draw = ImageDraw.Draw(image)
         width, height = image.size
         
         # Font setup
         font_size = int(width * 0.032)  # Slightly smaller dynamic font size based on width
-        font = get_ubuntu_font(font_size)
-        
-        # Wrap text
         margin = int(width * 0.1)
         max_text_width = width - (2 * margin)
-        lines = wrap_text(quote, font, max_text_width, draw)
+        
+        # Wrap text, shrinking the font if it has to fit a box
+        if max_text_height:
+            font, lines = fit_font_size(quote, get_ubuntu_font, max_text_width, int(height * max_text_height),
+                                        max_size=font_size, strategy=wrap_strategy)
+        else:
+            font = get_ubuntu_font(font_size)
+            lines = wrap_text(quote, font, max_text_width, draw, strategy=wrap_strategy)
         
         # Calculate total text height
-        line_height = font.getbbox("Ay")[3] + 10  # approximate height + padding
+        line_height = line_height_for(font)  # approximate height + padding
         total_text_height = len(lines) * line_height
         
         # Position calculation
@@ -54,14 +130,175 @@ class TextOverlayService:
         else:
             start_y = height - int(height * 0.25) - (total_text_height // 2)
         
-        # Draw text lines
-        current_y = start_y
-        for line in lines:
-            # Draw centered text with shadow
-            draw_text_with_shadow(draw, (width // 2, current_y), line, font)
-            current_y += line_height
+        # Render the block once and composite text + shadow onto the image
+        return composite_text(image, lines, font, width // 2, start_y, line_height, style)
+    
+    def render_variants(self, image: Image.Image, quote: str, names, **overlay_options) -> dict:
+        """
+        Renders several placements of one generated image in one pass.
+        
+        Each variant is framed from the clean image (see config/framing.py) and
+        gets its own text layout for its size. Thumbnails are reduced from their
+        source variant, text included. ``image`` itself is not modified, so the
+        caller can still draw on it in place afterwards.
+        
+        Args:
+            image: Generated image without text
+            quote: Text to overlay
+            names: Variant names from config.framing.VARIANTS
+            **overlay_options: Passed to overlay_text (position, style, ...)
+        
+        Returns:
+            Dict of variant name -> PIL Image, in the order of ``names``
+        
+        Raises:
+            ValueError: If a name is not a known variant
+        """
+        unknown = [name for name in names if name not in VARIANTS]
+        if unknown:
+            raise ValueError(f"Unknown output variant(s): {', '.join(unknown)}")
+        
+        rendered = {}
+        
+        def render(name):
+            if name not in rendered:
+                spec = VARIANTS[name]
+                if spec.source:
+                    rendered[name] = draft_thumbnail(render(spec.source), spec.size)
+                else:
+                    options = dict(overlay_options)
+                    if spec.max_text_height and "max_text_height" not in options:
+                        options["max_text_height"] = spec.max_text_height
+                    framed = fit_to_size(image, spec.size, spec.max_crop)
+                    rendered[name] = self.overlay_text(framed, quote, in_place=True, **options)
+            return rendered[name]
+        
+        # Sources a thumbnail needed but nobody asked for are dropped here
+        return {name: render(name) for name in names}
+    
+    def encode(self, image: Image.Image, format: str = "png", quality: int = 90, max_bytes: int = None,
+               png_compress_level: int = 6, strip_metadata: bool = True, metadata: dict = None) -> EncodedImage:
+        """
+        Encodes a PIL Image for delivery.
+        
+        For lossy formats with ``max_bytes`` set, quality levels between
+        MIN_QUALITY and ``quality`` are binary-searched for the highest one whose
+        output fits the budget. If none fits, the MIN_QUALITY result is returned.
+        PNG is lossless, so ``quality`` and ``max_bytes`` do not apply to it.
+        
+        Args:
+            image: PIL Image object
+            format: "png", "jpeg" (or "jpg") or "webp"
+            quality: Quality (1-100) for JPEG/WebP, upper bound when targeting a size
+            max_bytes: Optional byte budget for the encoded output
+            png_compress_level: zlib level (0-9) for PNG
+            strip_metadata: Drop EXIF and ICC profile data from the output
+            metadata: Optional post details (quote, entity, caption, ...) embedded
+                as a PNG iTXt chunk or an XMP packet (see services/image_metadata.py)
+        
+        Returns:
+            EncodedImage with the bytes, format, quality and encode time
+        """
+        format = FORMAT_ALIASES.get(format.lower(), format.lower())
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {format}")
+        
+        start = time.perf_counter()
+        extra = self._extra_params(format, strip_metadata, metadata)
+        if format == "png":
+            data = self._save(image, format, extra, compress_level=png_compress_level)
+            return EncodedImage(data, format, None, time.perf_counter() - start)
         
-        return image
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        
+        data = self._save_lossy(image, format, quality, extra)
+        attempts = 1
+        if max_bytes and len(data) > max_bytes:
+            # Binary search for the highest quality that fits the budget
+            best_data, best_quality = None, None
+            low, high = MIN_QUALITY, quality - 1
+            while low <= high:
+                mid = (low + high) // 2
+                candidate = self._save_lossy(image, format, mid, extra)
+                attempts += 1
+                if len(candidate) <= max_bytes:
+                    best_data, best_quality = candidate, mid
+                    low = mid + 1
+                else:
+                    high = mid - 1
+            if best_data is None:
+                best_quality = min(quality, MIN_QUALITY)
+                best_data = data if best_quality == quality else self._save_lossy(image, format, best_quality, extra)
+                print(f"Warning: {format} output is {len(best_data)} bytes at quality {best_quality}, over the {max_bytes} byte budget")
+            data, quality = best_data, best_quality
+        
+        return EncodedImage(data, format, quality, time.perf_counter() - start, attempts)
+    
+    def encode_to(self, image: Image.Image, fp, format: str = "png", quality: int = 90, max_bytes: int = None,
+                  png_compress_level: int = 6, strip_metadata: bool = True, metadata: dict = None) -> EncodedImage:
+        """
+        Encodes like encode(), but writes the output to a binary file object.
+        
+        When no size search is needed (PNG, or no ``max_bytes``), the encoder
+        streams straight into ``fp`` with no in-memory copy of the output.
+        Otherwise the search runs in memory and only the chosen result is written.
+        
+        Args:
+            image: PIL Image object
+            fp: Writable binary file object
+            (other arguments as for encode)
+        
+        Returns:
+            EncodedImage with ``data`` None and ``size`` the bytes written
+        """
+        format = FORMAT_ALIASES.get(format.lower(), format.lower())
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {format}")
+        if format != "png" and max_bytes:
+            encoded = self.encode(image, format, quality, max_bytes, png_compress_level, strip_metadata, metadata)
+            fp.write(encoded.data)
+            return EncodedImage(None, format, encoded.quality, encoded.encode_seconds, encoded.attempts, encoded.size)
+        
+        start = time.perf_counter()
+        counter = _CountingWriter(fp)
+        extra = self._extra_params(format, strip_metadata, metadata)
+        if format == "png":
+            self._save_to(counter, image, format, extra, compress_level=png_compress_level)
+            quality = None
+        else:
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            self._save_lossy_to(counter, image, format, quality, extra)
+        return EncodedImage(None, format, quality, time.perf_counter() - start, size=counter.written)
+    
+    @staticmethod
+    def _extra_params(format: str, strip_metadata: bool, metadata: dict) -> dict:
+        """Save parameters for metadata: stripped EXIF / ICC and the embedded post"""
+        params = {"exif": b"", "icc_profile": None} if strip_metadata else {}
+        if metadata:
+            params.update(metadata_save_params(format, metadata))
+        return params
+    
+    def _save_lossy(self, image: Image.Image, format: str, quality: int, extra: dict) -> bytes:
+        buffered = io.BytesIO()
+        self._save_lossy_to(buffered, image, format, quality, extra)
+        return buffered.getvalue()
+    
+    def _save_lossy_to(self, fp, image: Image.Image, format: str, quality: int, extra: dict):
+        if format == "jpeg":
+            self._save_to(fp, image, format, extra, quality=quality, optimize=True, progressive=True)
+        else:
+            self._save_to(fp, image, format, extra, quality=quality, method=4)
+    
+    def _save(self, image: Image.Image, format: str, extra: dict, **params) -> bytes:
+        buffered = io.BytesIO()
+        self._save_to(buffered, image, format, extra, **params)
+        # getvalue() hands over BytesIO's buffer without copying when nothing else references it
+        return buffered.getvalue()
+    
+    def _save_to(self, fp, image: Image.Image, format: str, extra: dict, **params):
+        image.save(fp, format=OUTPUT_FORMATS[format][0], **params, **extra)
     
     def image_to_base64(self, image: Image.Image, mime_type: str = "image/png") -> str:
         """
@@ -69,13 +306,11 @@ class TextOverlayService:
         
         Args:
             image: PIL Image object
-            mime_type: MIME type of the image (default: "image/png")
+            mime_type: MIME type of the image (default: "image/png"); selects the encoder
         
         Returns:
             Base64 data URL string
         """
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        b64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        return f"data:{mime_type};base64,{b64_str}"
-
+        encoded = self.encode(image, MIME_TO_FORMAT.get(mime_type, "png"))
+        b64_str = base64.b64encode(encoded.data).decode('utf-8')
+        return f"data:{encoded.mime_type};base64,{b64_str}"
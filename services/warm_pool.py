@@ -0,0 +1,151 @@
+"""
+Warm Pool
+Keeps a bounded stock of fully rendered "random" posts so "Surprise Me" is served instantly.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from services.manifest import atomic_write
+from services.quote_service import is_fallback_post
+
+logger = logging.getLogger(__name__)
+
+
+def is_random_prompt(prompt: str, description: str = "") -> bool:
+    """True for requests the pool can answer: a random entity and no extra context"""
+    return prompt.strip().lower() in ("", "random") and not description.strip()
+
+
+class WarmPool:
+    """
+    Bounded pool of ready posts (quote, caption, image prompt, stored image URL).
+
+    Producer tasks run the normal generation pipeline for random entities and
+    only while the server is otherwise idle, so live requests keep priority.
+    pop() hands out the oldest post and wakes the producers to refill. The pool
+    is saved to ``path`` after every change and reloaded on start; posts whose
+    image is no longer in the image store are dropped. Posts with fallback
+    text (a failed quote or caption call) are never pooled.
+    """
+
+    def __init__(self, generation_service, image_store, path: str, size: int = 5, concurrency: int = 1,
+                 is_busy=None, idle_poll_seconds: float = 2.0, retry_seconds: float = 30.0):
+        self.generation_service = generation_service
+        self.image_store = image_store
+        self.path = path
+        self.size = max(0, size)
+        self.concurrency = max(1, concurrency)
+        self.is_busy = is_busy or (lambda: False)
+        self.idle_poll_seconds = idle_poll_seconds
+        self.retry_seconds = retry_seconds
+        self.posts = []
+        self.hits = 0
+        self.misses = 0
+        self._producing = 0
+        self._wakeup = None
+        self._save_lock = None
+        self._producers = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def load(self):
+        """Reads the saved pool, keeping posts whose image still exists"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                posts = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not read warm pool {self.path}: {e}")
+            return
+        self.posts = [post for post in posts if self._image_exists(post)
+                      and not is_fallback_post(post.get("quote"), post.get("caption"))][:self.size]
+        logger.info(f"Warm pool loaded {len(self.posts)} ready post(s)")
+
+    def save(self, posts: list):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic_write(self.path, json.dumps(posts, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    async def _persist(self):
+        # Snapshot under the lock, so the last write to land is the newest state
+        async with self._save_lock:
+            await asyncio.to_thread(self.save, list(self.posts))
+
+    def _image_exists(self, post: dict) -> bool:
+        key = post.get("image_url", "").rsplit("/", 1)[-1]
+        return self.image_store.path_for(key) is not None
+
+    async def start(self):
+        """Loads the saved pool and starts the producers (call from the app startup hook)"""
+        if not self.enabled or self._producers:
+            return
+        await asyncio.to_thread(self.load)
+        self._wakeup = asyncio.Event()
+        self._save_lock = asyncio.Lock()
+        self._producers = [asyncio.create_task(self._producer(i)) for i in range(self.concurrency)]
+        logger.info(f"Warm pool started: size={self.size}, concurrency={self.concurrency}")
+
+    async def stop(self):
+        """Cancels the producers (call from the app shutdown hook)"""
+        for producer in self._producers:
+            producer.cancel()
+        await asyncio.gather(*self._producers, return_exceptions=True)
+        self._producers = []
+
+    def pop(self):
+        """Takes the oldest ready post, or returns None if the pool is empty"""
+        if not self.posts:
+            self.misses += 1
+            return None
+        post = self.posts.pop(0)
+        self.hits += 1
+        if self._producers:
+            asyncio.get_running_loop().create_task(self._persist())
+            self._wakeup.set()
+        return post
+
+    def _busy(self) -> bool:
+        # Our own generations count as in flight too; only other work makes us yield
+        return self.generation_service.in_flight > self._producing or self.is_busy()
+
+    async def _producer(self, producer_id: int):
+        while True:
+            if len(self.posts) + self._producing >= self.size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self._busy():
+                await asyncio.sleep(self.idle_poll_seconds)
+                continue
+
+            self._producing += 1
+            try:
+                result = await self.generation_service.generate("random")
+            except Exception as e:
+                result = {"image_error": str(e)}
+            finally:
+                self._producing -= 1
+
+            if result.get("image_error"):
+                logger.warning(f"Warm pool producer {producer_id} failed: {result['image_error']}")
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            if is_fallback_post(result["quote"], result["caption"]):
+                # The text calls failed over to stand-ins; serve a real post or none
+                logger.warning(f"Warm pool producer {producer_id} got fallback text, not pooling it")
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            self.posts.append({
+                "quote": result["quote"],
+                "caption": result["caption"],
+                "image_prompt": result["image_prompt"],
+                "image_url": result["image_url"],
+                "variants": result.get("variants") or {},
+                "created_at": time.time(),
+            })
+            await self._persist()
+            logger.info(f"Warm pool refilled: {len(self.posts)}/{self.size} ready")
@@ -12,6 +12,105 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const randomBtn = document.getElementById('randomBtn');
 
+    const POLL_INTERVAL_MS = 1000;
+    const STAGE_LABELS = {
+        quote: 'Thinking...',
+        caption: 'Writing caption...',
+        image_prompt: 'Imagining the scene...',
+        image: 'Painting the image...',
+        overlay: 'Adding text...',
+        encode: 'Finishing up...'
+    };
+
+    // Polls a generation job, showing partial results as they arrive
+    async function pollJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            const job = await response.json();
+
+            if (job.quote) {
+                quoteText.textContent = `"${job.quote}"`;
+            } else if (job.stage) {
+                quoteText.textContent = STAGE_LABELS[job.stage] || 'Thinking...';
+            }
+            if (job.caption) {
+                captionText.value = job.caption;
+            }
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+        }
+    }
+
+    // Streams a generation over Server-Sent Events, showing each artifact as it arrives
+    function streamGeneration(data) {
+        return new Promise((resolve, reject) => {
+            const params = new URLSearchParams(data);
+            const source = new EventSource(`/api/generate/stream?${params}`);
+            let captionStarted = false;
+
+            source.addEventListener('stage', (event) => {
+                const stage = JSON.parse(event.data);
+                if (stage.status === 'started' && stage.stage === 'quote') {
+                    quoteText.textContent = STAGE_LABELS.quote;
+                }
+            });
+            source.addEventListener('quote', (event) => {
+                quoteText.textContent = `"${JSON.parse(event.data).quote}"`;
+            });
+            source.addEventListener('caption_delta', (event) => {
+                if (!captionStarted) {
+                    captionText.value = '';
+                    captionStarted = true;
+                }
+                captionText.value += JSON.parse(event.data).text;
+            });
+            source.addEventListener('caption', (event) => {
+                captionText.value = JSON.parse(event.data).caption;
+            });
+            source.addEventListener('done', (event) => {
+                source.close();
+                resolve(JSON.parse(event.data));
+            });
+            // Fired both for server "error" events and for connection failures
+            source.addEventListener('error', (event) => {
+                source.close();
+                const detail = event.data ? JSON.parse(event.data).detail : 'Connection lost';
+                reject(new Error(detail));
+            });
+        });
+    }
+
+    // Queues a generation job and polls it until it finishes
+    async function jobGeneration(data) {
+        const response = await fetch('/api/jobs', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(data)
+        });
+
+        if (response.status === 503) {
+            throw new Error('Server is busy. Please try again in a moment.');
+        }
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+
+        const job = await response.json();
+        const result = await pollJob(job.status_url);
+
+        if (result.status === 'failed') {
+            throw new Error(result.error || 'Generation failed');
+        }
+        return result;
+    }
+
     // Reusable generation function
     async function generateContent(promptValue, descriptionValue = "") {
         // UI State: Loading
@@ -33,19 +132,9 @@ document.addEventListener('DOMContentLoaded', () => {
         };
 
         try {
-            const response = await fetch('/api/generate', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(data)
-            });
-
-            if (!response.ok) {
-                throw new Error('Network response was not ok');
-            }
-
-            const result = await response.json();
+            const result = window.EventSource
+                ? await streamGeneration(data)
+                : await jobGeneration(data);
 
             // UI State: Success
             quoteText.textContent = `"${result.quote}"`;
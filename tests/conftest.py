@@ -0,0 +1,21 @@
+"""
+Pytest setup: the offline unit tests run under pytest; test_api.py and
+test_image_api.py are live-API scripts (they exit without GEMINI_API_KEY),
+run by hand with python.
+
+Importing main builds the app's stores, so their paths point at a scratch
+directory before any test module imports it.
+"""
+import os
+import tempfile
+
+collect_ignore = ["test_api.py", "test_image_api.py"]
+
+_scratch = tempfile.mkdtemp(prefix="instaauto-tests-")
+for name, value in {
+    "POST_LIBRARY_PATH": os.path.join(_scratch, "posts.sqlite3"),
+    "IMAGE_STORE_DIR": os.path.join(_scratch, "generated_images"),
+    "WARM_POOL_PATH": os.path.join(_scratch, "warm_pool.json"),
+    "LLM_CACHE_PATH": os.path.join(_scratch, "llm_cache.sqlite3"),
+}.items():
+    os.environ[name] = value
@@ -0,0 +1,117 @@
+"""
+Bulk Mode (offline)
+The batch text step with FakeBatchBackend and placeholder rendering with
+render_post, end to end into the manifest, without any API key.
+"""
+import argparse
+import os
+import pytest
+from services.batch_backend import BatchRequest, BatchJobError, FakeBatchBackend
+from services.image_metadata import read_metadata
+from services.resilience import RetryPolicy
+from services.manifest import Manifest
+from services.quote_service import QuoteService
+from services.image_service import ImageService
+from services.render_pool import init_batch_worker, render_post
+from scripts import generate_images
+
+
+def test_fake_backend_runs_a_batch():
+    def respond(model, request):
+        if request.key == "bad":
+            raise ValueError("no output")
+        return f"{model}:{request.contents[0]}"
+
+    backend = FakeBatchBackend(respond, polls_until_done=2)
+    results = backend.run("text-model", [BatchRequest("a", ["one"]), BatchRequest("bad", ["two"])], poll_seconds=0)
+    assert results["a"] == "text-model:one"
+    assert isinstance(results["bad"], ValueError)
+
+
+def test_failed_job_raises():
+    backend = FakeBatchBackend(lambda model, request: "x")
+    backend.state = lambda job_id: "failed"
+    with pytest.raises(BatchJobError):
+        backend.run("text-model", [BatchRequest("a", ["one"])], poll_seconds=0)
+
+
+class ServerError(Exception):
+    code = 503
+
+
+def test_transient_poll_errors_are_retried():
+    backend = FakeBatchBackend(lambda model, request: "x")
+    backend.poll_retry = RetryPolicy(max_attempts=3, base_delay=0)
+    fake_state, failures = backend.state, []
+
+    def flaky_state(job_id):
+        if len(failures) < 2:
+            failures.append(job_id)
+            raise ServerError("503 UNAVAILABLE")
+        return fake_state(job_id)
+
+    backend.state = flaky_state
+    assert backend.run("text-model", [BatchRequest("a", ["one"])], poll_seconds=0) == {"a": "x"}
+    assert len(failures) == 2
+
+
+def test_persistent_poll_errors_name_the_batch():
+    backend = FakeBatchBackend(lambda model, request: "x")
+    backend.poll_retry = RetryPolicy(max_attempts=2, base_delay=0)
+
+    def unavailable(job_id):
+        raise ServerError("503 UNAVAILABLE")
+
+    backend.state = unavailable
+    with pytest.raises(BatchJobError, match="fake-batch-.*may still be running"):
+        backend.run("text-model", [BatchRequest("a", ["one"])], poll_seconds=0)
+
+
+def test_bulk_text_parses_fake_posts():
+    entities = {0: "Mars", 3: "Titan"}
+    backend = FakeBatchBackend(generate_images.fake_post_responder(entities))
+    quote_service = QuoteService(None)
+    posts = generate_images.bulk_text([0, 3], entities, backend, quote_service,
+                                      ImageService(None, prompt_strategy="template"), poll_seconds=0)
+    assert sorted(posts) == [0, 3]
+    assert "Titan" in posts[3]["quote"]
+    assert posts[0]["image_prompt"]
+
+
+def test_render_post_writes_image_and_variants(tmp_path):
+    init_batch_worker(True, 0, {"format": "png"}, ("thumbnail",))
+    metadata = generate_images.post_metadata(4, "Mars", "Mars has two moons.", "cap", "red planet", "Onward")
+    rendered = render_post({
+        "quote": "Mars has two moons.",
+        "image_prompt": "red planet",
+        "path_stem": str(tmp_path / "image_005_Mars_x"),
+        "metadata": metadata,
+    })
+    assert rendered["path"] == str(tmp_path / "image_005_Mars_x.png")
+    assert os.path.getsize(rendered["path"]) == rendered["size"]
+    assert sorted(rendered["variants"]) == ["thumbnail"]
+    assert os.path.exists(rendered["variants"]["thumbnail"])
+    embedded = read_metadata(rendered["path"])
+    assert embedded["quote"] == "Mars has two moons."
+    assert embedded["image_hash"] == rendered["image_hash"]
+    assert read_metadata(rendered["variants"]["thumbnail"])["variant"] == "thumbnail"
+
+
+def test_run_bulk_records_manifest_entries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    manifest = Manifest(str(images_dir / "manifest.jsonl"))
+    args = argparse.Namespace(batch_backend="fake", poll_seconds=0, image_rpm=0, processes=1, variants=())
+    saved = generate_images.run_bulk(args, [0, 1, 2], str(images_dir), str(images_dir / "captions.txt"), manifest,
+                                     QuoteService(None), ImageService(None, prompt_strategy="template"),
+                                     {"format": "png"})
+    assert saved == 3
+    records = manifest.load()
+    assert sorted(records) == [1, 2, 3]
+    for record in records.values():
+        assert os.path.exists(record["image_path"])
+        assert record["quote"] and record["instagram_caption"] and record["image_hash"]
+    # A rerun skips what the manifest already has
+    assert manifest.completed() == {1, 2, 3}
+    assert (images_dir / "captions.txt").read_text(encoding="utf-8").count("Image #") == 3
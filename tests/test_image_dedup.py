@@ -0,0 +1,119 @@
+"""
+Image Dedup
+Perceptual hash stability, radius queries, the deduper's reserve / add / release
+cycle, and the post library migration that adds the image_hash column.
+"""
+import io
+import sqlite3
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from services.image_dedup import (DuplicateImageError, ImageDeduper, ImageHashIndex, RESERVED_LABEL,
+                                  image_hash, split_hash)
+from services.post_library import SCHEMA, PostLibrary
+
+
+def scene(seed: int) -> Image.Image:
+    """A 9:16 picture with a gradient sky and a few bright discs, like a generated space scene"""
+    rng = np.random.RandomState(seed)
+    sky = np.linspace(0, 1, 960)[:, None] * rng.uniform(40, 120, size=3)
+    pixels = np.broadcast_to(sky[:, None, :], (960, 540, 3)).astype(np.uint8)
+    image = Image.fromarray(np.ascontiguousarray(pixels))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y, r = rng.randint(0, 540), rng.randint(0, 960), rng.randint(30, 160)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(int(c) for c in rng.randint(80, 255, size=3)))
+    return image
+
+
+def distances(a: str, b: str):
+    return tuple(bin(x ^ y).count("1") for x, y in zip(split_hash(a), split_hash(b)))
+
+
+def flip(value: str, bits: int) -> str:
+    """The hash with its lowest ``bits`` bits flipped, under both halves"""
+    phash, dhash = split_hash(value)
+    mask = (1 << bits) - 1
+    return f"{phash ^ mask:016x}{dhash ^ mask:016x}"
+
+
+def test_hash_survives_recompression_and_resizing():
+    original = scene(1)
+    value = image_hash(original)
+    buffer = io.BytesIO()
+    original.save(buffer, "JPEG", quality=70)
+    buffer.seek(0)
+    with Image.open(buffer) as recompressed:
+        assert max(distances(value, image_hash(recompressed))) <= 8
+    assert max(distances(value, image_hash(original.resize((270, 480))))) <= 8
+    assert min(distances(value, image_hash(scene(2)))) > 8
+
+
+def test_index_query_respects_radius():
+    base = image_hash(scene(1))
+    index = ImageHashIndex()
+    for bits in (0, 3, 6, 12):
+        index.add(flip(base, bits), f"{bits} bits")
+    assert [match.label for match in index.query(base, 6)] == ["0 bits", "3 bits", "6 bits"]
+    assert [match.label for match in index.query(base, 5)] == ["0 bits", "3 bits"]
+    assert index.query(flip(base, 40), 8) == []
+    assert ImageHashIndex().query(base, 64) == []
+
+
+def test_reject_raises_and_does_not_store():
+    deduper = ImageDeduper(radius=8, action="reject")
+    value = image_hash(scene(1))
+    deduper.load([("images/image_001.png", value)])
+    with pytest.raises(DuplicateImageError) as error:
+        deduper.check(flip(value, 2), "images/image_002.png")
+    assert error.value.match.label == "images/image_001.png"
+    assert len(deduper) == 1
+    assert deduper.check(image_hash(scene(2)), "images/image_003.png") is None
+    assert len(deduper) == 2
+
+
+def test_flag_returns_hash_and_match():
+    deduper = ImageDeduper(radius=8, action="flag")
+    image = scene(1)
+    deduper.load([("images/image_001.png", image_hash(image))])
+    value, match = deduper.screen(image)
+    assert value == image_hash(image)
+    assert match.label == "images/image_001.png"
+    assert "image_hash" not in image.info
+
+
+def test_screened_image_is_reserved_until_added_or_released():
+    deduper = ImageDeduper(radius=8, action="reject")
+    first, match = deduper.screen(scene(1))
+    assert match is None
+    # A look-alike generated while the first is still being encoded
+    with pytest.raises(DuplicateImageError) as error:
+        deduper.screen(scene(1).resize((270, 480)))
+    assert error.value.match.label == RESERVED_LABEL
+    deduper.release(first)
+    assert deduper.screen(scene(1)) == (first, None)
+    deduper.add(first, "/images/first.png")
+    with pytest.raises(DuplicateImageError) as error:
+        deduper.check(first, add=False)
+    assert error.value.match.label == "/images/first.png"
+
+
+def test_migrate_adds_image_hash_to_old_database(tmp_path):
+    path = str(tmp_path / "posts.sqlite3")
+    old_schema = SCHEMA.replace("    image_hash TEXT,\n", "")
+    assert "image_hash" not in old_schema
+    db = sqlite3.connect(path)
+    db.executescript(old_schema)
+    db.execute("INSERT INTO posts (image_number, quote, image_path, created_at) VALUES (1, 'Old fact.', 'images/a.png', 1.0)")
+    db.commit()
+    db.close()
+
+    library = PostLibrary(path)
+    try:
+        assert library.by_image_number(1)["image_hash"] is None
+        library.add({"image_number": 2, "quote": "New fact.", "image_path": "images/b.png", "image_hash": "ab" * 16})
+        assert library.image_hashes() == [("images/b.png", "ab" * 16)]
+    finally:
+        library.close()
+    # Reopening an already migrated database is a no-op
+    PostLibrary(path).close()
@@ -0,0 +1,116 @@
+"""
+Post Library
+Upserts, full-text sync, keyset paging and the GET /api/posts endpoint.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from services.post_library import PostLibrary, decode_cursor, encode_cursor, fts_query
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = PostLibrary(str(tmp_path / "posts.sqlite3"))
+    yield library
+    library.close()
+
+
+def test_upsert_by_image_number_keeps_known_fields(library):
+    first = library.add({"image_number": 7, "entity": "Mars", "quote": "Mars has two moons.",
+                         "caption": "Phobos and Deimos", "image_prompt": "red planet"})
+    second = library.add({"image_number": 7, "quote": "Mars has two moons.", "caption": None,
+                          "image_path": "images/image_007.png"})
+    assert first == second
+    assert library.count() == 1
+    post = library.by_image_number(7)
+    assert post["caption"] == "Phobos and Deimos"
+    assert post["image_prompt"] == "red planet"
+    assert post["entity"] == "Mars"
+    assert post["image_path"] == "images/image_007.png"
+
+
+def test_server_posts_are_always_appended(library):
+    library.add({"quote": "Same quote."})
+    library.add({"quote": "Same quote."})
+    assert library.count() == 2
+
+
+def test_post_needs_a_quote(library):
+    with pytest.raises(ValueError):
+        library.add({"image_number": 1, "caption": "no quote"})
+
+
+def test_full_text_index_follows_updates(library):
+    if not library.full_text:
+        pytest.skip("SQLite built without FTS5")
+    library.add({"image_number": 1, "quote": "A stellar nursery.", "caption": "Orion nebula glows"})
+    assert [post["image_number"] for post in library.query(q="nebula")[0]] == [1]
+    library.add({"image_number": 1, "quote": "A stellar nursery.", "caption": "Andromeda galaxy"})
+    assert library.query(q="nebula")[0] == []
+    assert [post["image_number"] for post in library.query(q="galaxy")[0]] == [1]
+    # Every word must match, in the quote or the caption
+    assert len(library.query(q="stellar galaxy")[0]) == 1
+    assert library.query(q="stellar nebula")[0] == []
+
+
+def test_keyset_paging_over_equal_timestamps(library):
+    ids = [library.add({"quote": f"Fact {i}.", "created_at": 1000.0}) for i in range(5)]
+    ids.append(library.add({"quote": "Older fact.", "created_at": 999.0}))
+    seen, cursor = [], None
+    while True:
+        posts, cursor = library.query(limit=2, cursor=cursor)
+        seen.extend(post["id"] for post in posts)
+        if cursor is None:
+            break
+    assert seen == sorted(ids[:5], reverse=True) + [ids[5]]
+
+
+def test_entity_filter(library):
+    library.add({"quote": "Red.", "entity": "Mars"})
+    library.add({"quote": "Rings.", "entity": "Saturn"})
+    posts, cursor = library.query(entity="Saturn")
+    assert [post["quote"] for post in posts] == ["Rings."]
+    assert cursor is None
+
+
+def test_cursor_round_trip_and_malformed_cursors():
+    assert decode_cursor(encode_cursor(1234.5, 42)) == (1234.5, 42)
+    for cursor in ("not-a-cursor", "!!!", encode_cursor(1.0, 2)[:-3], "WzFd", "e30"):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_fts_query_quotes_hostile_input(library):
+    assert fts_query('nebula" OR x* NEAR(a b) -c ^d:') == '"nebula" "OR" "x" "NEAR" "a" "b" "c" "d"'
+    assert fts_query("*** ()") == ""
+    library.add({"quote": "Orion nebula.", "caption": "OR x"})
+    for q in ('nebula" OR', "x* NEAR(", '"', "caption:nebula", "AND OR NOT"):
+        library.query(q=q)
+
+
+@pytest.fixture
+def client(library, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "post_library", library)
+    return TestClient(main.app)
+
+
+def test_api_posts_pages_and_filters(client, library):
+    for i in range(3):
+        library.add({"image_number": i + 1, "entity": "Moon", "quote": f"Moon fact {i}.", "created_at": 100.0 + i})
+    body = client.get("/api/posts", params={"limit": 2}).json()
+    assert [post["image_number"] for post in body["posts"]] == [3, 2]
+    body = client.get("/api/posts", params={"limit": 2, "cursor": body["next_cursor"]}).json()
+    assert [post["image_number"] for post in body["posts"]] == [1]
+    assert body["next_cursor"] is None
+    assert len(client.get("/api/posts", params={"entity": "Moon"}).json()["posts"]) == 3
+
+
+def test_api_posts_rejects_malformed_cursor(client):
+    response = client.get("/api/posts", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_api_posts_when_library_disabled(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "post_library", None)
+    assert TestClient(main.app).get("/api/posts").status_code == 404
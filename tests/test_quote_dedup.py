@@ -0,0 +1,145 @@
+"""
+Quote Dedup
+MinHash / LSH and embedding search, and the deduper's claim / add / release cycle.
+"""
+import numpy as np
+import pytest
+from services.post_library import PostLibrary
+from services.quote_dedup import DuplicateQuoteError, EmbeddingIndex, MinHashIndex, QuoteDeduper, quote_key
+from services.quote_service import FALLBACK_QUOTE, QuoteService, fallback_caption
+
+RED_SPOT = "Jupiter's Great Red Spot is a storm larger than Earth that has raged for centuries."
+RED_SPOT_REWORDED = "The Great Red Spot on Jupiter is a storm larger than Earth that has raged for centuries."
+NEUTRON_STAR = "Neutron stars can spin hundreds of times per second."
+SATURN = "Saturn's rings are made mostly of water ice."
+
+
+def test_minhash_finds_reworded_duplicate():
+    index = MinHashIndex()
+    index.add_many(index.signatures([NEUTRON_STAR, RED_SPOT]))
+    row, score = index.best(index.signatures([RED_SPOT_REWORDED])[0])
+    assert row == 1
+    assert score >= 0.5
+    assert index.best(index.signatures([SATURN])[0]) == (None, 0.0)
+
+
+def test_minhash_pending_keys_merge_into_sorted_arrays():
+    index = MinHashIndex()
+    index.MERGE_EVERY = 4
+    quotes = [f"Fact number {i} about comet {i * 7} and asteroid {i * 13}." for i in range(10)]
+    signatures = index.signatures(quotes)
+    for i in range(3):
+        index.add_many(signatures[i:i + 1])
+    assert index._pending and not len(index._keys)
+    index.add_many(signatures[3:4])
+    # Four quotes fill MERGE_EVERY * bands pending keys
+    assert not index._pending
+    assert len(index._keys) == 4 * index.bands
+    assert np.all(index._keys[:-1] <= index._keys[1:])
+    # Later additions sit in pending again; a bulk add goes straight into the arrays
+    index.add_many(signatures[4:5])
+    index.add_many(signatures[5:])
+    assert index.size == 10
+    for row, signature in enumerate(signatures):
+        assert index.best(signature) == (row, 1.0)
+
+
+@pytest.fixture
+def vectors():
+    return np.random.RandomState(7).standard_normal((300, 64)).astype(np.float32)
+
+
+def test_embedding_index_exact_search(vectors):
+    index = EmbeddingIndex()
+    index.add_many(vectors)
+    query = vectors[17] + 0.05 * np.random.RandomState(1).standard_normal(64).astype(np.float32)
+    row, score = index.best(query)
+    assert row == 17
+    assert score > 0.99
+
+
+def test_embedding_index_sign_code_search(vectors):
+    index = EmbeddingIndex()
+    index.EXACT_UP_TO = 100
+    index.add_many(vectors)
+    query = vectors[250] + 0.05 * np.random.RandomState(1).standard_normal(64).astype(np.float32)
+    row, score = index.best(query, min_score=0.9)
+    assert row == 250
+    assert score > 0.99
+    unrelated = np.random.RandomState(2).standard_normal(64)
+    assert index.best(unrelated, min_score=0.9) == (None, 0.0)
+
+
+def test_unique_rejects_after_regenerate_attempts():
+    deduper = QuoteDeduper(regenerate_attempts=2)
+    deduper.load([RED_SPOT])
+    contexts = []
+
+    def generate(context):
+        contexts.append(context)
+        return RED_SPOT_REWORDED
+
+    with pytest.raises(DuplicateQuoteError) as error:
+        deduper.unique(generate, description="Keep it short.")
+    assert len(contexts) == 3
+    assert contexts[0] == "Keep it short."
+    assert RED_SPOT in contexts[1]
+    assert error.value.match.quote == RED_SPOT
+
+
+def test_unique_regenerates_until_new():
+    deduper = QuoteDeduper(regenerate_attempts=2)
+    deduper.load([RED_SPOT])
+    answers = iter([RED_SPOT_REWORDED, SATURN])
+    assert deduper.unique(lambda context: next(answers)) == SATURN
+
+
+def test_claimed_quote_blocks_until_released():
+    deduper = QuoteDeduper()
+    assert deduper.claim(RED_SPOT) is None
+    # A concurrent generation cannot take the same fact
+    assert deduper.claim(RED_SPOT_REWORDED).quote == RED_SPOT
+    assert len(deduper) == 0
+    deduper.release(RED_SPOT)
+    assert deduper.claim(RED_SPOT_REWORDED) is None
+
+
+def test_add_stores_claimed_quote_and_its_vectors(tmp_path):
+    library = PostLibrary(str(tmp_path / "posts.sqlite3"))
+    try:
+        deduper = QuoteDeduper(library=library)
+        deduper.claim(RED_SPOT)
+        assert library.vectors(deduper.minhash_name, [quote_key(RED_SPOT)]) == {}
+        deduper.add(RED_SPOT)
+        assert len(deduper) == 1
+        assert quote_key(RED_SPOT) in library.vectors(deduper.minhash_name, [quote_key(RED_SPOT)])
+        # Stored now, so a release no longer frees it
+        deduper.release(RED_SPOT)
+        assert deduper.check(RED_SPOT_REWORDED).quote == RED_SPOT
+    finally:
+        library.close()
+
+
+class _Unavailable:
+    """A client whose every model call fails, as during an API outage"""
+
+    class models:
+        @staticmethod
+        def generate_content(**kwargs):
+            raise RuntimeError("503 UNAVAILABLE")
+
+
+def test_fallback_fact_is_never_claimed_or_stored():
+    deduper = QuoteDeduper(regenerate_attempts=2)
+    quote_service = QuoteService(_Unavailable(), deduper)
+    for _ in range(2):
+        quote = quote_service.generate_quote("Mars")
+        assert quote == FALLBACK_QUOTE
+        quote_service.keep_quote(quote, fallback_caption(quote))
+    assert len(deduper) == 0
+    assert deduper.duplicates == 0
+    # A real fact with a fallback caption is released rather than stored
+    deduper.claim(SATURN)
+    quote_service.keep_quote(SATURN, fallback_caption(SATURN))
+    assert len(deduper) == 0
+    assert deduper.claim(SATURN) is None